@@ -4,9 +4,9 @@ import { query_db } from "../../settings/setupdb";
 import { address, baseToken } from "../address";
 import {
   call_python,
+  call_router,
   computeSwapStep, getEthPriceInUSD, getSqrtRatioX96FromTick,
   getTickFromSqrtRatioX96,
-  run_python,
   unpackPoolParam
 } from "../helpers";
 import {
@@ -332,7 +332,6 @@ export class LpPool {
       }
     }
     const param = [
-      pythonRouterPath,
       "getSpotPrice",
       JSON.stringify(poolparam),
       baseToken.address,
@@ -340,7 +339,7 @@ export class LpPool {
     ];
 
     const result: any = await new Promise(function (resolve, reject) {
-      run_python(async (data) => resolve(data), param);
+      call_router(async (data) => resolve(data), param);
     });
     if (result.status == 0) {
       let datastr = result.data;
@@ -738,7 +737,6 @@ export class LpPool {
     const { lp_pool, poolparam } = await this.unpackPoolParam(tickDirection);
 
     const param = [
-      pythonRouterPath,
       "swapAmount",
       amount.toString(),
       tokenAddress,
@@ -747,7 +745,7 @@ export class LpPool {
     ];
 
     const result: any = await new Promise(function (resolve, reject) {
-      run_python(async (data) => resolve(data), param);
+      call_router(async (data) => resolve(data), param);
     });
 
     if (result.status == 0) {
@@ -1414,7 +1412,6 @@ export class LpPools {
     let poolParams = (await this.unpackMultiPoolParams(PoolPath)).map(pool=>pool.poolparam)
     // console.log(poolParams)
     const param = [
-      pythonRouterPath,
       "swapAmountMultiHop",
       amount.toString(),
       FirstToken,
@@ -1423,7 +1420,7 @@ export class LpPools {
     ];
 
     const result: any = await new Promise(function (resolve, reject) {
-      run_python(async (data) => resolve(data), param);
+      call_router(async (data) => resolve(data), param);
     });
 
     if (result.status == 0) {
@@ -1464,7 +1461,6 @@ export class LpPools {
     ).map((e) => e.poolparam);
 
     const param = [
-      pythonRouterPath,
       "calcProfitMultiHop",
       borrowAmount.toString(),
       borrowAddress,
@@ -1472,7 +1468,7 @@ export class LpPools {
     ];
 
     const result: any = await new Promise(function (resolve, reject) {
-      run_python(async (data) => resolve(data), param);
+      call_router(async (data) => resolve(data), param);
     });
 
     if (result.status == 0) {
@@ -1520,14 +1516,13 @@ export class LpPools {
     ).map((e) => e.poolparam);
     
     const param = [
-      pythonRouterPath,
       "optimizeMultiHop",
       borrowAddress,
       JSON.stringify(poolParams),
     ];
 
     const result: any = await new Promise(function (resolve, reject) {
-      run_python(async (data) => resolve(data), param);
+      call_router(async (data) => resolve(data), param);
     });
 
     if (result.status == 0) {
@@ -1538,6 +1533,49 @@ export class LpPools {
     }
   }
 
+  async optimizeMultiHopBatch(
+    paths: { pools: string[]; borrowAddress: string }[],
+    maxWorkers?: number,
+    deadline?: number
+  ) {
+    // Optimize many pool paths in parallel worker processes, pool params are sent once per batch
+    const poolAddresses = [...new Set(paths.map((path) => path.pools).flat())];
+    for (const poolAddress of poolAddresses) {
+      if (!this.poolsList.includes(poolAddress)) {
+        throw "Pool Path Wrong Input";
+      }
+    }
+
+    let poolParams = (await this.unpackMultiPoolParams(poolAddresses)).map(
+      (e) => e.poolparam
+    );
+
+    const param = [
+      "optimizeMultiHopBatch",
+      JSON.stringify({
+        pools: poolParams,
+        jobs: paths.map((path) => [path.borrowAddress, path.pools]),
+      }),
+      maxWorkers ? maxWorkers.toString() : "",
+      deadline ? deadline.toString() : "",
+    ];
+
+    const result: any = await new Promise(function (resolve, reject) {
+      call_router(async (data) => resolve(data), param);
+    });
+
+    // Results are returned in the order of the input paths
+    let profits: any[] = paths.map((path) => ({ status: 1, data: "not optimized" }));
+    if (result.status == 0) {
+      for (const row of JSON.parse(result.data)) {
+        profits[row.job] = row.error ? { status: 1, data: row.error } : row;
+      }
+    } else {
+      profits = profits.map(() => result);
+    }
+    return profits;
+  }
+
   async unpackMultiPoolParams(
     swapPath: string[],
   ) {
@@ -88,6 +88,85 @@ export function run_python(
   });
 }
 
+// Long running router process (router.py serve), requests and responses are newline-delimited JSON matched by id
+let routerServer: any;
+let routerRequestId = 0;
+// Milliseconds a router request may wait for its response before it fails with status 1
+const routerRequestTimeout = 120000;
+const routerPending = new Map<
+  number,
+  { callback: (arg0: { data: string; status: number }) => void; timer: any }
+>();
+
+function settleRouterRequest(id: number, result: { data: string; status: number }) {
+  const pending = routerPending.get(id);
+  if (pending) {
+    routerPending.delete(id);
+    clearTimeout(pending.timer);
+    pending.callback(result);
+  }
+}
+
+function getRouterServer() {
+  if (!routerServer) {
+    const spawn = require("child_process").spawn;
+    const readline = require("readline");
+
+    routerServer = spawn("python", [pythonRouterPath, "serve"]);
+    readline
+      .createInterface({ input: routerServer.stdout })
+      .on("line", (line: string) => {
+        let response: any;
+        try {
+          response = JSON.parse(line);
+        } catch (err) {
+          // Stray prints from python are not responses
+          console.log(`router: ${line}`);
+          return;
+        }
+        if (response.id == null) {
+          // Request line the router could not read, no pending request to settle
+          console.log(`router: ${response.error}`);
+          return;
+        }
+        settleRouterRequest(response.id, { data: response.data, status: response.status });
+      });
+
+    // Drain stderr so warnings and tracebacks can not fill the pipe and block the router
+    routerServer.stderr.on("data", (err: any) => {
+      console.log(`router stderr: ${err.toString()}`);
+    });
+
+    routerServer.on("close", () => {
+      routerServer = undefined;
+      for (const id of [...routerPending.keys()]) {
+        settleRouterRequest(id, { data: "router server closed", status: 1 });
+      }
+    });
+  }
+  return routerServer;
+}
+
+// Same callback contract as run_python, param is the function name followed by the function arguments
+export function call_router(
+  callback: {
+    (data: any): Promise<void>;
+    (arg0: { data: string; status: number }): void;
+  },
+  param: any[],
+  timeout: number = routerRequestTimeout
+) {
+  const id = ++routerRequestId;
+  const timer = setTimeout(
+    () => settleRouterRequest(id, { data: `router request ${param[0]} timed out`, status: 1 }),
+    timeout
+  );
+  routerPending.set(id, { callback, timer });
+  getRouterServer().stdin.write(
+    JSON.stringify({ id, method: param[0], args: param.slice(1) }) + "\n"
+  );
+}
+
 export async function test_run_python(message: string) {
   const param = [pythonRouterPath, "test", message];
 
@@ -411,7 +490,6 @@ export async function optimizeV3(
   }
 
   const param = [
-    pythonRouterPath,
     "optimizePool",
     borrowAddress,
     JSON.stringify(poolparam1),
@@ -426,37 +504,88 @@ export async function optimizeV3(
   // console.log(JSON.stringify(poolparam2))
 
   const result: any = await new Promise(function (resolve, reject) {
-    run_python(async (data) => resolve(data), param);
+    call_router(async (data) => resolve(data), param);
   });
   if (result.status == 0) {
-    let datastr = JSON.parse(result.data);
-
-    const contract_input = {
-      tokenBorrow: datastr.tokenBorrow,
-      tokenBase: datastr.tokenBase,
-      pool1: datastr.pool1,
-      pool2: datastr.pool2,
-      pool1Type: datastr.pool1Type,
-      pool2Type: datastr.pool2Type,
-      pool1sqrtPriceLimitX96: datastr.p1sqrtPriceX96,
-      pool2sqrtPriceLimitX96: datastr.p2sqrtPriceX96,
-      borrowAmount: datastr.optimal_borrow,
-      repayAmount: datastr.repayAmount,
-      swapOutAmount: datastr.swapOutAmount,
-    };
+    return formatOptimizeV3Output(JSON.parse(result.data));
+  } else {
+    return result;
+  }
+}
 
-    const formatted_output = {
-      borrowAmount: datastr.optimal_borrow,
-      profitAmount: datastr.profit,
-      repayAmount: datastr.repayAmount,
-      swapOutAmount: datastr.swapOutAmount,
-      contract_input,
-      status: 0,
-    };
+// Format one optimizePool result from python into the contract input
+function formatOptimizeV3Output(datastr: any) {
+  const contract_input = {
+    tokenBorrow: datastr.tokenBorrow,
+    tokenBase: datastr.tokenBase,
+    pool1: datastr.pool1,
+    pool2: datastr.pool2,
+    pool1Type: datastr.pool1Type,
+    pool2Type: datastr.pool2Type,
+    pool1sqrtPriceLimitX96: datastr.p1sqrtPriceX96,
+    pool2sqrtPriceLimitX96: datastr.p2sqrtPriceX96,
+    borrowAmount: datastr.optimal_borrow,
+    repayAmount: datastr.repayAmount,
+    swapOutAmount: datastr.swapOutAmount,
+  };
 
-    return formatted_output;
+  const formatted_output = {
+    borrowAmount: datastr.optimal_borrow,
+    profitAmount: datastr.profit,
+    repayAmount: datastr.repayAmount,
+    swapOutAmount: datastr.swapOutAmount,
+    contract_input,
+    status: 0,
+  };
+
+  return formatted_output;
+}
+
+// optimizeV3 over many pool pairs in one router call, each pool is sent and parsed once
+export async function optimizeV3Batch(
+  poolPairs: any[],
+  baseAddress: string = address.token.weth
+) {
+  const poolparams = new Map<string, any>();
+  const jobs: string[][] = [];
+
+  for (const pairs of poolPairs) {
+    if (pairs.length !== 2) continue;
+
+    const { poolparam: poolparam1 } = await unpackPoolParam(pairs[0]);
+    const { poolparam: poolparam2 } = await unpackPoolParam(pairs[1]);
+    if (poolparam1!.status === 1 || poolparam2!.status === 1) {
+      console.log(`poolparam error`);
+      continue;
+    }
+
+    const borrowAddress =
+      poolparam1!.token0Address === baseAddress
+        ? poolparam1!.token1Address!
+        : poolparam1!.token0Address!;
+
+    poolparams.set(poolparam1!.poolAddress, poolparam1);
+    poolparams.set(poolparam2!.poolAddress, poolparam2);
+    jobs.push([borrowAddress, poolparam1!.poolAddress, poolparam2!.poolAddress]);
+  }
+
+  const param = [
+    "optimizePoolsBatch",
+    JSON.stringify({ pools: [...poolparams.values()], jobs }),
+  ];
+
+  const result: any = await new Promise(function (resolve, reject) {
+    call_router(async (data) => resolve(data), param);
+  });
+  if (result.status == 0) {
+    // Ranked by profit, failed jobs come last with an error field
+    return JSON.parse(result.data).map((datastr: any) =>
+      datastr.error
+        ? { profitAmount: 0, status: 1, error: datastr.error }
+        : formatOptimizeV3Output(datastr)
+    );
   } else {
-    return result;
+    return [result];
   }
 }
 
@@ -472,7 +601,6 @@ export async function calc_profit(
     await unpackPoolParam(poolexp);
 
   const param = [
-    pythonRouterPath,
     "calc_profit",
     borrowAmount,
     borrowAddress,
@@ -481,7 +609,7 @@ export async function calc_profit(
   ];
 
   const result: any = await new Promise(function (resolve, reject) {
-    run_python(async (data) => resolve(data), param);
+    call_router(async (data) => resolve(data), param);
   });
 
   if (result.status == 0) {
@@ -546,7 +674,6 @@ export async function getSpotPrice(
   const { lp_pool, poolparam } = await unpackPoolParam(pool);
 
   const param = [
-    pythonRouterPath,
     "getSpotPrice",
     JSON.stringify(poolparam),
     baseCurrency,
@@ -554,7 +681,7 @@ export async function getSpotPrice(
   ];
 
   const result: any = await new Promise(function (resolve, reject) {
-    run_python(async (data) => resolve(data), param);
+    call_router(async (data) => resolve(data), param);
   });
   if (result.status == 0) {
     let datastr = result.data;
@@ -897,21 +1024,11 @@ function comparePools(pools: any[]) {
 
 // Calculate profits from multiple pairs of pools and return the best profit
 export async function optimizeV3Bulk(poolPairs: any[]) {
-  const allprofits = await Promise.all(
-    poolPairs.map(async (pairs) => {
-      let pairProfit;
-      if (pairs.length === 2) {
-        pairProfit = optimizeV3(pairs[0], pairs[1]);
-      } else {
-        pairProfit = { profitAmount: 0, status: 1 };
-      }
-      return pairProfit;
-    })
-  );
+  const allprofits = await optimizeV3Batch(poolPairs);
 
-  // Sort by profitAmount and return the first element(max profit)
+  // Results are ranked by profit, the first element is the max profit
   let maxprofit, checkProfit;
-  maxprofit = allprofits.sort((a, b) => b.profitAmount - a.profitAmount)[0];
+  maxprofit = allprofits[0] || { profitAmount: 0, status: 1 };
 
   // Double Check and adjust inaccurate amounts
   if (maxprofit.status === 0) {
@@ -1038,7 +1155,8 @@ export async function updateSpotPrice(poolAddress: string) {
 
 // Graph updating and helper function
 
-export async function constructGraphObjectFromDB(liquidity_criteria:string='medium') {
+// multigraph keeps every pool between two tokens as its own edge instead of the one with most liquidity
+export async function constructGraphObjectFromDB(liquidity_criteria:string='medium',multigraph:boolean=false) {
   const dbgraphData = (
     await query_db(
       `SELECT address,token0_address,token1_address,spot_ratio_f_0to1,spot_ratio_f_1to0,spot_ratio_timestamp,base_value_locked_usd FROM lp_pool WHERE liquidity_criteria_${liquidity_criteria}=true AND blacklist=false;`
@@ -1087,7 +1205,7 @@ export async function constructGraphObjectFromDB(liquidity_criteria:string='medi
     .flat();
 
   // Convert multigraph edges into digraph edges
-  const digraph_edgelist = edgelist
+  const digraph_edgelist = multigraph ? edgelist : edgelist
     .map((edge) => {
       let duplicated_edges = edgelist.filter(
         (row) => row.source === edge.source && row.target === edge.target
@@ -1116,7 +1234,7 @@ export async function constructGraphObjectFromDB(liquidity_criteria:string='medi
 
   const graphObject = {
     directed: true,
-    multigraph: false,
+    multigraph: multigraph,
     graph: {},
     nodes: nodelist,
     links: digraph_edgelist,
@@ -1259,10 +1377,15 @@ export async function updateEdges(
     }
   }).flat()
 
+  if (graph.multigraph) {
+    // Every pool has its own edges, update the ones of the same pool
+    uniqueEdges = edgeObjects;
+  }
+
   let graph_result = uniqueEdges.map((edgeObject) => {
     let pooledges = edges
       .map((elm: { key: string; source: string; target:string;ratiof:number,weight:number,timestamp:number }, idx: any) =>
-        (elm.source === edgeObject.source && elm.target === edgeObject.target)
+        (elm.source === edgeObject.source && elm.target === edgeObject.target && (!graph.multigraph || elm.key === edgeObject.key))
           ? {index:idx,key:elm.key,ratiof:elm.ratiof,weight:elm.weight,timestamp:elm.timestamp,source:elm.source,target:elm.target}
           : ""
       )
@@ -1345,9 +1468,72 @@ export async function convertLogsToEdges(logs: { blockNumber: number; blockHash:
   const edges = ((relatedEdgeData.flat()).map((e: { address: any; spot_ratio_f_0to1: number; token0_address: any; token1_address: any; spot_ratio_timestamp: any; spot_ratio_f_1to0: number; base_value_locked_usd:number; })=>convertDBQuerytoEdges(e))).flat()
   
   const update_result = await updateEdges(edges)
+  await updateResidentGraph(update_result.updatedEdges, logs[0]?.blockNumber)
+  await updateResidentReserves(filterlogs.map(log=>{
+    try{
+      const logArgs = iface.parseLog(log).args
+      return logArgs.sqrtPriceX96
+        ? {poolAddress:log.address,sqrtPriceX96:logArgs.sqrtPriceX96.toString(),liquidity:logArgs.liquidity.toString()}
+        : {poolAddress:log.address,reserve0:logArgs.reserve0.toString(),reserve1:logArgs.reserve1.toString()}
+    }catch(err){
+      return undefined
+    }
+  }).filter(e=>e!==undefined))
   return update_result
 }
 
+// Apply the edges updated in the DB graph to the graph kept in memory by the python router
+export async function updateResidentGraph(edges: any[], blockNumber?: number) {
+  const param = [
+    "updateGraphEdges",
+    JSON.stringify(edges),
+    blockNumber !== undefined ? blockNumber.toString() : "",
+  ];
+
+  const result: any = await new Promise(function (resolve, reject) {
+    call_router(async (data) => resolve(data), param);
+  });
+
+  if (result.status == 0) {
+    return JSON.parse(result.data);
+  } else {
+    console.log(result.data);
+    return result;
+  }
+}
+
+// Pool depth from the Swap / Sync logs, used by the python router to size the candidate cycles
+export async function updateResidentReserves(pools: any[]) {
+  const param = ["updateGraphReserves", JSON.stringify(pools)];
+
+  const result: any = await new Promise(function (resolve, reject) {
+    call_router(async (data) => resolve(data), param);
+  });
+
+  if (result.status == 0) {
+    return JSON.parse(result.data);
+  } else {
+    console.log(result.data);
+    return result;
+  }
+}
+
+// Hit/miss counters of the optimizer result cache kept by the python router
+export async function getOptimizerCacheStats() {
+  const param = ["optimizerCacheStats"];
+
+  const result: any = await new Promise(function (resolve, reject) {
+    call_router(async (data) => resolve(data), param);
+  });
+
+  if (result.status == 0) {
+    return JSON.parse(result.data);
+  } else {
+    console.log(result.data);
+    return result;
+  }
+}
+
 export async function updateAllEdgesInGraph() {
   console.log('Start updating edges')
   await updateAllEdgesInDB()
@@ -1468,12 +1654,11 @@ export async function findBestProfitCycles(tokenPaths: string[][]) {
   pathResults = await Promise.all(
     tokenPaths.map(async (tokenPath) => {
       const param = [
-        pythonRouterPath,
-        "findPossibleCyclesEdges",
+        "findSizedCyclesEdges",
         JSON.stringify(tokenPath),
       ];
       const result: any = await new Promise(function (resolve, reject) {
-        run_python(async (data) => resolve(data), param);
+        call_router(async (data) => resolve(data), param);
       });
 
       if (result.status == 0) {
@@ -1501,12 +1686,10 @@ export async function findBestProfitCycles(tokenPaths: string[][]) {
 
   let multiPool = new LpPools({ pools: poollist });
   await multiPool.init();
-  let profits = await Promise.all(
-    finalResults.map(async (row: any) => {
-      let profit = await multiPool.optimizeMultiHop(row.pools, row.tokens[1]);
-      return { path: row, profit };
-    })
+  const batchProfits = await multiPool.optimizeMultiHopBatch(
+    finalResults.map((row: any) => ({ pools: row.pools, borrowAddress: row.tokens[1] }))
   );
+  let profits = finalResults.map((row: any, i: number) => ({ path: row, profit: batchProfits[i] }));
 
   let sortprofit = [];
   let tokenBaselist: any[] = [];
@@ -1,5 +1,6 @@
 from typing import Tuple
 import SqrtPriceMath, FullMath
+from FixedPoint96 import Q96
 from Helpers import uint256
 
 MIN_SQRT_RATIO = 4295128739
@@ -101,3 +102,110 @@ def computeSwapStep(
         amountOut,
         feeAmount,
     )
+
+
+def computeSwapStepFast(
+    sqrtRatioCurrentX96: int,
+    sqrtRatioTargetX96: int,
+    liquidity: int,
+    amountRemaining: int,
+    feePips: int,
+) -> Tuple[int, int, int, int]:
+    """
+    computeSwapStep with SqrtPriceMath and FullMath inlined as plain int operations, for the swap loops.
+    Returns the same values, computeSwapStep stays the reference. Rounding up is divmod plus the remainder
+    check, as in FullMath.mulDivRoundingUp and UnsafeMath.divRoundingUp. The asserts of the reference can not
+    fail on a step (liquidity 0 or below always reaches the target) and are left out
+    """
+    zeroForOne = sqrtRatioCurrentX96 >= sqrtRatioTargetX96
+    exactIn = amountRemaining >= 0
+    numerator1 = liquidity << 96
+
+    if exactIn:
+        amountRemainingLessFee = amountRemaining * (1000000 - feePips) // 1000000
+        if zeroForOne:
+            # getAmount0Delta(target, current, liquidity, True)
+            q, r = divmod(numerator1 * (sqrtRatioCurrentX96 - sqrtRatioTargetX96), sqrtRatioCurrentX96)
+            q, r = divmod(q + (r > 0), sqrtRatioTargetX96)
+            amountIn = q + (r > 0)
+        else:
+            # getAmount1Delta(current, target, liquidity, True)
+            q, r = divmod(liquidity * (sqrtRatioTargetX96 - sqrtRatioCurrentX96), Q96)
+            amountIn = q + (r > 0)
+
+        if amountRemainingLessFee >= amountIn:
+            sqrtRatioNextX96 = sqrtRatioTargetX96
+        elif zeroForOne:
+            # getNextSqrtPriceFromAmount0RoundingUp(current, liquidity, amountRemainingLessFee, True)
+            if amountRemainingLessFee == 0:
+                sqrtRatioNextX96 = sqrtRatioCurrentX96
+            else:
+                q, r = divmod(
+                    numerator1 * sqrtRatioCurrentX96,
+                    numerator1 + amountRemainingLessFee * sqrtRatioCurrentX96,
+                )
+                sqrtRatioNextX96 = q + (r > 0)
+        else:
+            # getNextSqrtPriceFromAmount1RoundingDown(current, liquidity, amountRemainingLessFee, True)
+            sqrtRatioNextX96 = sqrtRatioCurrentX96 + (amountRemainingLessFee << 96) // liquidity
+    else:
+        amountOutRemaining = -amountRemaining
+        if zeroForOne:
+            # getAmount1Delta(target, current, liquidity, False)
+            amountOut = liquidity * (sqrtRatioCurrentX96 - sqrtRatioTargetX96) // Q96
+        else:
+            # getAmount0Delta(current, target, liquidity, False)
+            amountOut = (
+                numerator1 * (sqrtRatioTargetX96 - sqrtRatioCurrentX96) // sqrtRatioTargetX96
+            ) // sqrtRatioCurrentX96
+
+        if amountOutRemaining >= amountOut:
+            sqrtRatioNextX96 = sqrtRatioTargetX96
+        elif zeroForOne:
+            # getNextSqrtPriceFromAmount1RoundingDown(current, liquidity, amountOutRemaining, False)
+            q, r = divmod(amountOutRemaining << 96, liquidity)
+            sqrtRatioNextX96 = sqrtRatioCurrentX96 - q - (r > 0)
+        elif amountOutRemaining == 0:
+            sqrtRatioNextX96 = sqrtRatioCurrentX96
+        else:
+            # getNextSqrtPriceFromAmount0RoundingUp(current, liquidity, amountOutRemaining, False)
+            q, r = divmod(
+                numerator1 * sqrtRatioCurrentX96,
+                numerator1 - amountOutRemaining * sqrtRatioCurrentX96,
+            )
+            sqrtRatioNextX96 = q + (r > 0)
+
+    max = sqrtRatioTargetX96 == sqrtRatioNextX96
+    # get the input/output amounts
+    if zeroForOne:
+        if not (max and exactIn):
+            # getAmount0Delta(next, current, liquidity, True)
+            q, r = divmod(numerator1 * (sqrtRatioCurrentX96 - sqrtRatioNextX96), sqrtRatioCurrentX96)
+            q, r = divmod(q + (r > 0), sqrtRatioNextX96)
+            amountIn = q + (r > 0)
+        if not (max and not exactIn):
+            # getAmount1Delta(next, current, liquidity, False)
+            amountOut = liquidity * (sqrtRatioCurrentX96 - sqrtRatioNextX96) // Q96
+    else:
+        if not (max and exactIn):
+            # getAmount1Delta(current, next, liquidity, True)
+            q, r = divmod(liquidity * (sqrtRatioNextX96 - sqrtRatioCurrentX96), Q96)
+            amountIn = q + (r > 0)
+        if not (max and not exactIn):
+            # getAmount0Delta(current, next, liquidity, False)
+            amountOut = (
+                numerator1 * (sqrtRatioNextX96 - sqrtRatioCurrentX96) // sqrtRatioNextX96
+            ) // sqrtRatioCurrentX96
+
+    # cap the output amount to not exceed the remaining output amount
+    if not exactIn and amountOut > amountOutRemaining:
+        amountOut = amountOutRemaining
+
+    if exactIn and sqrtRatioNextX96 != sqrtRatioTargetX96:
+        # we didn't reach the target, so take the remainder of the maximum input as fee
+        feeAmount = amountRemaining - amountIn
+    else:
+        q, r = divmod(amountIn * feePips, 1000000 - feePips)
+        feeAmount = q + (r > 0)
+
+    return (sqrtRatioNextX96, amountIn, amountOut, feeAmount)
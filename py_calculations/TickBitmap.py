@@ -9,6 +9,15 @@ def position(tick: int) -> Tuple[int, int]:
     return (wordPos, bitPos)
 
 
+def tickBitmapFromTicks(ticks, tickSpacing: int) -> dict:
+    # Sparse word -> bitmap of the initialized ticks, the tickBitmap mapping of the pool for the fetched ticks
+    tick_mapping = {}
+    for tick in ticks:
+        wordPos, bitPos = position(tick // tickSpacing)
+        tick_mapping[wordPos] = tick_mapping.get(wordPos, 0) | (1 << bitPos)
+    return tick_mapping
+
+
 def nextInitializedTickWithinOneWord(
     tick_mapping: dict,
     tick: int,
@@ -16,9 +25,8 @@ def nextInitializedTickWithinOneWord(
     lte: bool,
 ) -> Tuple[int, bool]:
 
+    # Python floor division already rounds towards negative infinity, as the contract does with its -1 adjustment
     compressed: int = tick // tickSpacing
-    if tick < 0 and tick % tickSpacing != 0:
-        compressed -= 1  # round towards negative infinity
 
     if lte:
         wordPos: int
@@ -26,7 +34,7 @@ def nextInitializedTickWithinOneWord(
         wordPos, bitPos = position(compressed)
         # all the 1s at or to the right of the current bitPos
         mask: int = (1 << bitPos) - 1 + (1 << bitPos)
-        masked: int = tick_mapping[wordPos] & mask
+        masked: int = tick_mapping.get(wordPos, 0) & mask
 
         # if there are no initialized ticks to the right of or at the current tick, return rightmost in the word
         initialized_status = masked != 0
@@ -42,7 +50,7 @@ def nextInitializedTickWithinOneWord(
         wordPos, bitPos = position(compressed + 1)
         # all the 1s at or to the left of the bitPos
         mask: int = ~((1 << bitPos) - 1)
-        masked: int = tick_mapping[wordPos] & mask
+        masked: int = tick_mapping.get(wordPos, 0) & mask
 
         # if there are no initialized ticks to the left of the current tick, return leftmost in the word
         initialized_status = masked != 0
@@ -51,7 +59,34 @@ def nextInitializedTickWithinOneWord(
             (compressed + 1 + int24(BitMath.leastSignificantBit(masked) - bitPos))
             * tickSpacing
             if initialized_status
-            else (compressed + 1 + int24(type(uint8).max - bitPos)) * tickSpacing
+            else (compressed + 1 + int24(255 - bitPos)) * tickSpacing
         )
 
     return next_tick, initialized_status
+
+
+def nextInitializedTick(
+    tick_mapping: dict,
+    tick: int,
+    tickSpacing: int,
+    lte: bool,
+    boundaryTick: int,
+):
+    """
+    Next initialized tick at or below tick (lte) or above it, searching word by word from tick.
+    Words missing from the sparse tick_mapping are empty. None once the search passes boundaryTick
+    """
+    while True:
+        next_tick, initialized_status = nextInitializedTickWithinOneWord(
+            tick_mapping, tick, tickSpacing, lte
+        )
+        if initialized_status:
+            return next_tick
+        if lte:
+            if next_tick <= boundaryTick:
+                return None
+            tick = next_tick - 1
+        else:
+            if next_tick >= boundaryTick:
+                return None
+            tick = next_tick
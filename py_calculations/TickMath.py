@@ -1,3 +1,5 @@
+from functools import lru_cache
+from math import log2
 from Helpers import int24, int256, uint160, uint256
 import YulOperations as yul
 
@@ -6,6 +8,11 @@ MAX_TICK = -MIN_TICK
 MIN_SQRT_RATIO = 4295128739
 MAX_SQRT_RATIO = 1461446703485210103287273052203988822378723970342
 
+# Ticks memoized by getSqrtRatioAtTickCached, enough for the tick maps of the loaded pools
+SQRT_RATIO_CACHE_SIZE = 1 << 16
+# log2 of sqrt(1.0001), one tick in log2 of a sqrt price
+LOG2_SQRT_TICK = log2(1.0001) / 2
+
 
 def getSqrtRatioAtTick(tick: int) -> int:
 
@@ -198,3 +205,29 @@ def getTickAtSqrtRatio(sqrtPriceX96: int) -> int:
     )
 
     return tick
+
+
+@lru_cache(maxsize=SQRT_RATIO_CACHE_SIZE)
+def getSqrtRatioAtTickCached(tick: int) -> int:
+    # Same result as getSqrtRatioAtTick, initialized ticks repeat across swaps and blocks
+    return getSqrtRatioAtTick(tick)
+
+
+def getTickAtSqrtRatioFast(sqrtPriceX96: int) -> int:
+    """
+    Same result as getTickAtSqrtRatio: the greatest tick with getSqrtRatioAtTick(tick) <= sqrtPriceX96
+
+    The tick is estimated from a float log2 of the price, built from its top 53 bits with int.bit_length,
+    then settled against the exact (cached) sqrt ratios of the neighbouring ticks
+    """
+    assert sqrtPriceX96 >= MIN_SQRT_RATIO and sqrtPriceX96 < MAX_SQRT_RATIO, "R"
+
+    shift = max(sqrtPriceX96.bit_length() - 53, 0)
+    tick = int((log2(sqrtPriceX96 >> shift) + shift - 96) // LOG2_SQRT_TICK)
+    tick = min(max(tick, MIN_TICK), MAX_TICK - 1)
+
+    while tick > MIN_TICK and getSqrtRatioAtTickCached(tick) > sqrtPriceX96:
+        tick -= 1
+    while getSqrtRatioAtTickCached(tick + 1) <= sqrtPriceX96:
+        tick += 1
+    return tick
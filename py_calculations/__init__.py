@@ -4,8 +4,12 @@ from SqrtPriceMath import *
 from SwapMath import *
 from TickBitmap import *
 from TickMath import *
+from tickIndex import *
+from poolSnapshot import *
+from optimizerCache import *
 from UnsafeMath import *
 from optimizeV3 import *
+from csrGraph import *
 from network import *
 from provider import *
 import YulOperations as yul
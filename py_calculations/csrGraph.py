@@ -0,0 +1,426 @@
+import heapq
+import json
+import math
+import numpy as np
+
+
+class CSRGraph:
+    """
+    Directed token graph with token addresses interned to ints, CSR adjacency and edge attribute arrays
+
+    Edges of a token keep the order they have in the source graph, so walks visit neighbors in the same
+    order as networkx does. Attribute arrays are indexed by edge id.
+
+    In multigraph mode every pool between two tokens is kept as a parallel edge. The CSR edges are then the
+    token pairs, and their attributes are those of the best (lowest weight) parallel edge of the pair
+    """
+
+    def __init__(self, nodes, nodeData, links, multigraph=False):
+        self.nodes = list(nodes)
+        self.nodeIds = {node: i for i, node in enumerate(self.nodes)}
+        self.nodeData = list(nodeData)
+        self.poolKeys = []
+        self.poolKeyIds = {}
+        self.multigraph = multigraph
+
+        numNodes = len(self.nodes)
+        linkSource = np.array([self.nodeIds[link["source"]] for link in links], dtype=np.int64)
+        linkTarget = np.array([self.nodeIds[link["target"]] for link in links], dtype=np.int64)
+
+        # Token pairs in order of first appearance, then by source. Stable, so edges of a token stay in link order
+        pairKeys, firstLink, linkPair = np.unique(
+            linkSource * numNodes + linkTarget, return_index=True, return_inverse=True
+        )
+        pairOrder = np.lexsort((firstLink, pairKeys // max(numNodes, 1)))
+        pairRank = np.empty(len(pairKeys), dtype=np.int64)
+        pairRank[pairOrder] = np.arange(len(pairKeys))
+        linkPair = pairRank[linkPair.reshape(-1)]
+        pairLinks = firstLink[pairOrder]
+
+        self.source = linkSource[pairLinks].astype(np.int32)
+        self.indices = linkTarget[pairLinks].astype(np.int32)
+        self.indptr = np.zeros(numNodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.source, minlength=numNodes), out=self.indptr[1:])
+
+        # Sorted source * numNodes + target keys and their edge ids, for lookups by token pair
+        self.edgeKeys = pairKeys[pairOrder]
+        self.edgeKeyOrder = np.argsort(self.edgeKeys, kind="stable").astype(np.int32)
+        self.edgeKeys = self.edgeKeys[self.edgeKeyOrder]
+
+        if multigraph:
+            # Parallel edges grouped by pair, pair i owns parallelIndptr[i]:parallelIndptr[i + 1]
+            order = np.lexsort((np.arange(len(links)), linkPair))
+            links = [links[i] for i in order]
+            self.parallelPair = linkPair[order].astype(np.int32)
+            self.parallelIndptr = np.zeros(len(pairKeys) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.parallelPair, minlength=len(pairKeys)), out=self.parallelIndptr[1:])
+            self.parallelWeight, self.parallelRatiof, self.parallelLiquidityUSD, self.parallelTimestamp, self.parallelPoolKey = self._linkArrays(links)
+            self.bestEdge = np.zeros(len(pairKeys), dtype=np.int64)
+            self.weight = np.zeros(len(pairKeys), dtype=np.float64)
+            self.ratiof = np.zeros(len(pairKeys), dtype=np.float64)
+            self.liquidityUSD = np.zeros(len(pairKeys), dtype=np.float64)
+            self.timestamp = np.zeros(len(pairKeys), dtype=np.int64)
+            self.poolKey = np.zeros(len(pairKeys), dtype=np.int32)
+        else:
+            if len(pairKeys) != len(links):
+                raise ValueError("parallel edges in a simple graph, use multigraph=True")
+            links = [links[i] for i in pairLinks]
+            self.weight, self.ratiof, self.liquidityUSD, self.timestamp, self.poolKey = self._linkArrays(links)
+
+        self._adjacency = None
+        self._reverseAdjacency = None
+        # Bumped on every weight change, cached weight derived data is keyed on it
+        self.weightVersion = 0
+        self._reducedWeights = None
+        # Topology version of the graph it was built from, set by the owner
+        self.topologyVersion = None
+
+        if multigraph:
+            self.refreshBestEdges()
+
+    def _linkArrays(self, links):
+        weight = np.array([link["weight"] for link in links], dtype=np.float64)
+        ratiof = np.array([link.get("ratiof", math.nan) for link in links], dtype=np.float64)
+        liquidityUSD = np.array([link.get("liquidityUSD", math.nan) for link in links], dtype=np.float64)
+        timestamp = np.array([link.get("timestamp") or 0 for link in links], dtype=np.int64)
+        poolKey = np.array([self.internPoolKey(link["key"]) for link in links], dtype=np.int32)
+        return weight, ratiof, liquidityUSD, timestamp, poolKey
+
+    @classmethod
+    def fromNodeLink(cls, data):
+        # Node-link JSON as stored in graph_db
+        if isinstance(data, str):
+            data = json.loads(data)
+
+        links = data["links"] if "links" in data else data["edges"]
+        nodes = [node["id"] for node in data["nodes"]]
+        nodeData = [{k: v for k, v in node.items() if k != "id"} for node in data["nodes"]]
+        # Tokens only referenced by links, networkx adds them the same way
+        known = set(nodes)
+        for link in links:
+            for node in (link["source"], link["target"]):
+                if node not in known:
+                    known.add(node)
+                    nodes.append(node)
+                    nodeData.append({})
+        return cls(nodes, nodeData, links, data.get("multigraph", False))
+
+    @classmethod
+    def fromGraph(cls, G):
+        nodes = list(G.nodes())
+        nodeData = [dict(G.nodes[node]) for node in nodes]
+        if G.is_multigraph():
+            # networkx keeps the pool address as the edge key
+            links = [
+                dict(attr, source=source, target=target, key=key)
+                for source, target, key, attr in G.edges(keys=True, data=True)
+            ]
+        else:
+            links = [dict(attr, source=source, target=target) for source, target, attr in G.edges(data=True)]
+        return cls(nodes, nodeData, links, G.is_multigraph())
+
+    def toNodeLink(self):
+        # Same layout as the graph object built by constructGraphObjectFromDB in helpers.ts
+        if self.multigraph:
+            arrays = (self.parallelRatiof, self.parallelWeight, self.parallelLiquidityUSD, self.parallelTimestamp, self.parallelPoolKey)
+            pairs = self.parallelPair
+        else:
+            arrays = (self.ratiof, self.weight, self.liquidityUSD, self.timestamp, self.poolKey)
+            pairs = np.arange(len(self.indices))
+
+        ratiof, weight, liquidityUSD, timestamp, poolKey = arrays
+        links = []
+        for i in range(len(pairs)):
+            link = {
+                "ratiof": float(ratiof[i]),
+                "weight": float(weight[i]),
+                "liquidityUSD": float(liquidityUSD[i]),
+                "timestamp": int(timestamp[i]),
+                "source": self.nodes[self.source[pairs[i]]],
+                "target": self.nodes[self.indices[pairs[i]]],
+                "key": self.poolKeys[poolKey[i]],
+            }
+            links.append({k: v for k, v in link.items() if not (isinstance(v, float) and math.isnan(v))})
+
+        return {
+            "directed": True,
+            "multigraph": self.multigraph,
+            "graph": {},
+            "nodes": [dict(data, id=node) for node, data in zip(self.nodes, self.nodeData)],
+            "links": links,
+        }
+
+    def refreshBestEdges(self, edgeIds=None):
+        """
+        Multigraph mode: pick the lowest weight parallel edge of each pair (or of edgeIds) as the pair edge
+
+        All pairs at once is one lexsort over the parallel edges, ties go to the first pool
+        """
+        if edgeIds is None:
+            order = np.lexsort((self.parallelWeight, self.parallelPair))
+            edgeIds = np.arange(len(self.indices))
+            best = order[self.parallelIndptr[:-1]]
+        else:
+            edgeIds = np.asarray(edgeIds, dtype=np.int64)
+            best = np.array(
+                [
+                    self.parallelIndptr[i] + int(np.argmin(self.parallelWeight[self.parallelIndptr[i] : self.parallelIndptr[i + 1]]))
+                    for i in edgeIds
+                ],
+                dtype=np.int64,
+            )
+
+        self.bestEdge[edgeIds] = best
+        self.weight[edgeIds] = self.parallelWeight[best]
+        self.ratiof[edgeIds] = self.parallelRatiof[best]
+        self.liquidityUSD[edgeIds] = self.parallelLiquidityUSD[best]
+        self.timestamp[edgeIds] = self.parallelTimestamp[best]
+        self.poolKey[edgeIds] = self.parallelPoolKey[best]
+        self.weightVersion += 1
+
+    def parallelEdgeId(self, edgeId, key):
+        # Multigraph mode: parallel edge of pool key within pair edgeId, None if the pool is not on that pair
+        poolKeyId = self.poolKeyIds.get(key)
+        if poolKeyId is None:
+            return None
+        start, end = self.parallelIndptr[edgeId], self.parallelIndptr[edgeId + 1]
+        found = np.flatnonzero(self.parallelPoolKey[start:end] == poolKeyId)
+        return int(start + found[0]) if len(found) > 0 else None
+
+    def parallelEdges(self, edgeId):
+        # Multigraph mode: (pool key, weight) of every pool on pair edgeId
+        start, end = self.parallelIndptr[edgeId], self.parallelIndptr[edgeId + 1]
+        return [
+            (self.poolKeys[poolKey], float(weight))
+            for poolKey, weight in zip(self.parallelPoolKey[start:end], self.parallelWeight[start:end])
+        ]
+
+    def internPoolKey(self, key):
+        poolKeyId = self.poolKeyIds.get(key)
+        if poolKeyId is None:
+            poolKeyId = len(self.poolKeys)
+            self.poolKeys.append(key)
+            self.poolKeyIds[key] = poolKeyId
+        return poolKeyId
+
+    def numberOfEdges(self):
+        return len(self.indices)
+
+    def edgeId(self, source, target):
+        # Edge id of source -> target by token address, None if there is no such edge
+        sourceId = self.nodeIds.get(source)
+        targetId = self.nodeIds.get(target)
+        if sourceId is None or targetId is None:
+            return None
+        key = sourceId * len(self.nodes) + targetId
+        i = int(np.searchsorted(self.edgeKeys, key))
+        if i == len(self.edgeKeys) or self.edgeKeys[i] != key:
+            return None
+        return int(self.edgeKeyOrder[i])
+
+    def edgeNodes(self, edgeId):
+        return self.nodes[self.source[edgeId]], self.nodes[self.indices[edgeId]]
+
+    def setEdge(self, edgeId, key=None, ratiof=None, weight=None, liquidityUSD=None, timestamp=None):
+        """
+        Update the attributes of edge edgeId. In multigraph mode the update goes to the parallel edge of
+        pool key, which must exist, and the pair edge is re-picked from its parallel edges
+        """
+        if self.multigraph:
+            parallelId = self.parallelEdgeId(edgeId, key)
+            if parallelId is None:
+                return False
+            arrays = (self.parallelRatiof, self.parallelWeight, self.parallelLiquidityUSD, self.parallelTimestamp)
+            for array, value in zip(arrays, (ratiof, weight, liquidityUSD, timestamp)):
+                if value is not None:
+                    array[parallelId] = value
+            self.refreshBestEdges([edgeId])
+            return True
+
+        if key is not None:
+            self.poolKey[edgeId] = self.internPoolKey(key)
+        if ratiof is not None:
+            self.ratiof[edgeId] = ratiof
+        if weight is not None:
+            self.weight[edgeId] = weight
+            self.weightVersion += 1
+        if liquidityUSD is not None:
+            self.liquidityUSD[edgeId] = liquidityUSD
+        if timestamp is not None:
+            self.timestamp[edgeId] = timestamp
+        return True
+
+    def adjacency(self):
+        # indptr and indices as python lists for the walks below, indexing numpy arrays per element is slow
+        if self._adjacency is None:
+            self._adjacency = (self.indptr.tolist(), self.indices.tolist())
+        return self._adjacency
+
+    def reverseAdjacency(self):
+        # Per token [(source, edge id), ...] of its incoming edges
+        if self._reverseAdjacency is None:
+            reverse = [[] for i in range(len(self.nodes))]
+            for edgeId, (source, target) in enumerate(zip(self.source.tolist(), self.indices.tolist())):
+                reverse[target].append((source, edgeId))
+            self._reverseAdjacency = reverse
+        return self._reverseAdjacency
+
+    def cyclesFrom(self, edgeId, maxPathLength):
+        """
+        Cycles starting with edge edgeId, as lists of edge ids grouped by expansion round
+
+        Same cycles in the same order as findPossibleCycles in network.py expanding that edge
+        """
+        indptr, indices = self.adjacency()
+        rounds = maxPathLength - 2
+        cycles = [[] for i in range(rounds)]
+        start = int(self.source[edgeId])
+        onPath = {start, indices[edgeId]}
+        edgePath = [edgeId]
+
+        def expand(node, roundIndex):
+            lastRound = roundIndex == rounds - 1
+            for nextEdge in range(indptr[node], indptr[node + 1]):
+                target = indices[nextEdge]
+                if target == start:
+                    cycles[roundIndex].append(edgePath + [nextEdge])
+                elif not lastRound and target not in onPath:
+                    onPath.add(target)
+                    edgePath.append(nextEdge)
+                    expand(target, roundIndex + 1)
+                    edgePath.pop()
+                    onPath.discard(target)
+
+        if rounds > 0:
+            expand(indices[edgeId], 0)
+        return cycles
+
+    def pathWeight(self, edgePath):
+        return float(self.weight[edgePath].sum())
+
+    def reducedWeights(self):
+        """
+        Edge weights reduced by node potentials, w + pi[source] - pi[target], with per node minimum out weight
+
+        pi is the weight distance along a BFS tree, so tree edges reduce to 0 and the rest to about the
+        profit of closing a cycle through them. Cycle weights do not change, which keeps bounds on partial
+        paths tight: the token price part of -log(ratio) cancels out
+        """
+        if self._reducedWeights is not None and self._reducedWeights[0] == self.weightVersion:
+            return self._reducedWeights[1:]
+
+        indptr, indices = self.adjacency()
+        weights = self.weight.tolist()
+        numNodes = len(self.nodes)
+        potential = [0.0] * numNodes
+        seen = [False] * numNodes
+        for root in range(numNodes):
+            if seen[root]:
+                continue
+            seen[root] = True
+            queue = [root]
+            for node in queue:
+                for edgeId in range(indptr[node], indptr[node + 1]):
+                    target = indices[edgeId]
+                    if not seen[target]:
+                        seen[target] = True
+                        potential[target] = potential[node] + weights[edgeId]
+                        queue.append(target)
+
+        potential = np.array(potential, dtype=np.float64)
+        reduced = self.weight + potential[self.source] - potential[self.indices]
+        minOut = np.full(numNodes, math.inf)
+        np.minimum.at(minOut, self.source, reduced)
+        minReduced = float(reduced.min()) if len(reduced) > 0 else 0.0
+
+        self._reducedWeights = (self.weightVersion, reduced.tolist(), minOut.tolist(), minReduced)
+        return self._reducedWeights[1:]
+
+    def iterCycles(self, startEdges, maxPathLength, threshold=None):
+        """
+        Generator of (edge ids, weight) for the cycles starting with one of startEdges, depth first
+
+        Only cycles with weight below threshold() (0 by default) are yielded, and a partial path is dropped
+        as soon as its weight plus the lowest possible weight of the remaining hops can not get below it.
+        threshold is called again at every step, so a consumer can tighten it while iterating
+        """
+        indptr, indices = self.adjacency()
+        sources = self.source.tolist()
+        weights = self.weight.tolist()
+        reduced, minOut, minReduced = self.reducedWeights()
+        # Lowest total of the hops after the next one
+        hopBound = min(minReduced, 0.0)
+        maxHops = maxPathLength - 1
+        # Slack for the rounding of reduced weight sums, the bound never drops a cycle that qualifies
+        tolerance = 1e-9
+
+        for startEdge in startEdges:
+            start = sources[startEdge]
+            edgePath = [startEdge]
+            pathReduced = [reduced[startEdge]]
+            onPath = {start, indices[startEdge]}
+            stack = [[indices[startEdge], indptr[indices[startEdge]]]]
+
+            while stack:
+                frame = stack[-1]
+                node, edgeId = frame
+                if edgeId == indptr[node + 1]:
+                    stack.pop()
+                    if len(stack) > 0:
+                        edgePath.pop()
+                        pathReduced.pop()
+                        onPath.discard(node)
+                    continue
+                frame[1] = edgeId + 1
+
+                limit = 0.0 if threshold is None else threshold()
+                target = indices[edgeId]
+                hops = len(edgePath) + 1
+                bound = pathReduced[-1] + reduced[edgeId]
+                if target == start:
+                    if bound < limit + tolerance:
+                        cycle = edgePath + [edgeId]
+                        weight = sum(weights[e] for e in cycle)
+                        if weight < limit:
+                            yield cycle, weight
+                elif hops < maxHops and target not in onPath:
+                    if bound + minOut[target] + (maxHops - hops - 1) * hopBound < limit + tolerance:
+                        edgePath.append(edgeId)
+                        pathReduced.append(bound)
+                        onPath.add(target)
+                        stack.append([target, indptr[target]])
+
+    def topCycles(self, startEdges, maxPathLength, k=10):
+        """
+        The k lowest weight negative cycles starting with one of startEdges, lowest first, as (edge ids, weight)
+
+        Streams iterCycles with the k-th best weight so far as the pruning threshold
+        """
+        heap = []
+        count = 0
+
+        def threshold():
+            return min(-heap[0][0], 0.0) if len(heap) == k else 0.0
+
+        for cycle, weight in self.iterCycles(startEdges, maxPathLength, threshold):
+            # Max heap on weight, earlier cycles win ties
+            item = (-weight, -count, cycle)
+            count += 1
+            if len(heap) < k:
+                heapq.heappush(heap, item)
+            else:
+                heapq.heapreplace(heap, item)
+
+        return [(cycle, -negWeight) for negWeight, negCount, cycle in sorted(heap, key=lambda x: (-x[0], -x[1]))]
+
+    def outEdges(self, nodes):
+        # Edge ids leaving any of the tokens
+        edgeIds = []
+        for node in nodes:
+            nodeId = self.nodeIds.get(node)
+            if nodeId is not None:
+                edgeIds.extend(range(int(self.indptr[nodeId]), int(self.indptr[nodeId + 1])))
+        return edgeIds
+
+    def cycleTokens(self, edgePath):
+        return [self.nodes[self.source[e]] for e in edgePath] + [self.nodes[self.source[edgePath[0]]]]
@@ -1,6 +1,22 @@
 import networkx as nx
+import numpy as np
 import math, json
+from collections import deque
 from provider import query_db
+from csrGraph import CSRGraph
+
+# Tokens a cycle may start from (borrowed and repaid in)
+BASE_TOKEN_LIST = [
+    "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2",
+    "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48",
+    "0x6B175474E89094C44Da98b954EedeAC495271d0F",
+    "0xdAC17F958D2ee523a2206206994597C13D831ec7",
+    "0x4Fabb145d64652a948d72533023f6E7A623C7C53",
+    "0x0000000000085d4780B73119b644AE5ecd22b376",
+    "0x0C10bF8FcB7Bf5412187A595ab97a3609160b5c6",
+    "0x8e870d67f660d95d5be530380d0ec0bd388289e1",
+    "0x853d955aCEf822Db058eb8505911ED77F175b99e",
+]
 
 
 def getGraph():
@@ -11,6 +27,639 @@ def getGraph():
     return G
 
 
+class ResidentGraph:
+    # Graph loaded once and kept in memory, updated in place with per block edge deltas
+    def __init__(self, graphData=None):
+        self.graph = None
+        # Bumped on every applied delta batch
+        self.version = 0
+        # Bumped only when edges are added or removed
+        self.topologyVersion = 0
+        self.blockNumber = None
+        # Pool key -> directed edges (source, target) currently served by that pool
+        self.poolEdges = {}
+        self.core = None
+        self.cycleIndex = None
+        self.negativeCycleDetector = None
+        # Pool key -> {token: virtual reserve}, the depth used by the size aware cycle ranking
+        self.poolReserves = {}
+        self.load(graphData)
+
+    def load(self, graphData=None):
+        if graphData is None:
+            graphData = query_db(
+                f"SELECT graph_object FROM graph_db WHERE graph_number=1;"
+            )[0][0]
+        if isinstance(graphData, str):
+            graphData = json.loads(graphData)
+
+        self.graph = nx.node_link_graph(graphData)
+        self.poolEdges = {}
+        self.poolReserves = {}
+        if self.graph.is_multigraph():
+            # Multigraph mode, every pool keeps its own edge keyed by the pool address
+            poolEdges = self.graph.edges(keys=True, data=True)
+        else:
+            poolEdges = ((source, target, attr.get("key"), attr) for source, target, attr in self.graph.edges(data=True))
+        for source, target, key, attr in poolEdges:
+            self.poolEdges.setdefault(key, set()).add((source, target))
+            self._setEdgeReserves(key, source, target, attr)
+
+        self.version += 1
+        self.topologyVersion += 1
+        return self
+
+    def _setEdgeKey(self, source, target, key):
+        oldKey = self.graph[source][target].get("key")
+        if oldKey == key:
+            return
+        if oldKey in self.poolEdges:
+            self.poolEdges[oldKey].discard((source, target))
+            if len(self.poolEdges[oldKey]) == 0:
+                del self.poolEdges[oldKey]
+        self.poolEdges.setdefault(key, set()).add((source, target))
+
+    def _setEdgeReserves(self, key, source, target, edge):
+        # Optional reserveIn / reserveOut of an edge, virtual reserves of its pool in the edge direction
+        if key is None:
+            return
+        for token, name in ((source, "reserveIn"), (target, "reserveOut")):
+            if edge.get(name) is not None:
+                self.poolReserves.setdefault(key, {})[token] = float(edge[name])
+
+    def applyEdgeDeltas(self, edges, blockNumber=None):
+        """
+        Update edge attributes in place, edges: [{key, source, target, ratiof, weight, liquidityUSD, timestamp}]
+
+        Same rule as updateEdges in helpers.ts: the edge is updated if its pool is the same as the delta key
+        or the delta has a lower weight. In multigraph mode the edge of that pool is updated.
+        source/target may be omitted for a pool serving a single edge. Optional reserveIn/reserveOut
+        set the virtual reserves of the pool
+        """
+        if isinstance(edges, str):
+            edges = json.loads(edges)
+
+        updated = []
+        for edge in edges:
+            source, target = edge.get("source"), edge.get("target")
+            if source is None or target is None:
+                poolEdges = self.poolEdges.get(edge["key"], ())
+                if len(poolEdges) != 1:
+                    continue
+                source, target = next(iter(poolEdges))
+
+            if self.graph.is_multigraph():
+                if not self.graph.has_edge(source, target, edge["key"]):
+                    continue
+                attr = self.graph[source][target][edge["key"]]
+            else:
+                if not self.graph.has_edge(source, target):
+                    continue
+                attr = self.graph[source][target]
+                if not (edge["key"] == attr.get("key") or edge["weight"] < attr["weight"]):
+                    continue
+                self._setEdgeKey(source, target, edge["key"])
+                attr["key"] = edge["key"]
+
+            self._setEdgeReserves(edge["key"], source, target, edge)
+            attr["ratiof"] = edge["ratiof"]
+            attr["weight"] = edge["weight"]
+            if edge.get("liquidityUSD") is not None:
+                attr["liquidityUSD"] = edge["liquidityUSD"]
+            if edge.get("timestamp") is not None:
+                attr["timestamp"] = edge["timestamp"]
+
+            if self.core is not None and self.core.topologyVersion == self.topologyVersion:
+                self.core.setEdge(
+                    self.core.edgeId(source, target),
+                    edge["key"],
+                    edge["ratiof"],
+                    edge["weight"],
+                    edge.get("liquidityUSD"),
+                    edge.get("timestamp"),
+                )
+            if self.cycleIndex is not None:
+                self.cycleIndex.setWeight(source, target, self.pairWeight(source, target))
+            if self.negativeCycleDetector is not None:
+                self.negativeCycleDetector.edgeChanged(source, target)
+            updated.append((source, target))
+
+        self.version += 1
+        if blockNumber is not None:
+            self.blockNumber = int(blockNumber)
+        return updated
+
+    def addEdges(self, edges):
+        # New pools, edges with the same source and target keep the one with more liquidity like the graph builder
+        if isinstance(edges, str):
+            edges = json.loads(edges)
+
+        for edge in edges:
+            source, target = edge["source"], edge["target"]
+            self._setEdgeReserves(edge["key"], source, target, edge)
+            if self.graph.is_multigraph():
+                self.poolEdges.setdefault(edge["key"], set()).add((source, target))
+                attrs = {k: v for k, v in edge.items() if k not in ("source", "target", "key")}
+                self.graph.add_edge(source, target, key=edge["key"], **attrs)
+                continue
+
+            if self.graph.has_edge(source, target):
+                attr = self.graph[source][target]
+                if edge.get("liquidityUSD", 0) <= attr.get("liquidityUSD", 0):
+                    continue
+                self._setEdgeKey(source, target, edge["key"])
+            else:
+                self.poolEdges.setdefault(edge["key"], set()).add((source, target))
+            attrs = {k: v for k, v in edge.items() if k not in ("source", "target")}
+            self.graph.add_edge(source, target, **attrs)
+
+        self.version += 1
+        self.topologyVersion += 1
+        return self.state()
+
+    def removePools(self, poolAddresses):
+        # Blacklisted pools, their edges are dropped until the graph is rebuilt
+        if isinstance(poolAddresses, str):
+            poolAddresses = json.loads(poolAddresses)
+
+        for poolAddress in poolAddresses:
+            for source, target in self.poolEdges.pop(poolAddress, ()):
+                if self.graph.is_multigraph():
+                    self.graph.remove_edge(source, target, poolAddress)
+                else:
+                    self.graph.remove_edge(source, target)
+
+        self.version += 1
+        self.topologyVersion += 1
+        return self.state()
+
+    def updatePoolReserves(self, pools):
+        """
+        Set the virtual reserves of pools, pools: [{poolAddress, reserve0, reserve1}] for V2 or
+        [{poolAddress, sqrtPriceX96, liquidity}] for V3, full pool params work as well.
+        Without token0Address/token1Address the tokens are taken from the pool edges, token0 sorts first
+        """
+        if isinstance(pools, str):
+            pools = json.loads(pools)
+
+        updated = 0
+        for pool in pools:
+            key = pool["poolAddress"]
+            if "token0Address" in pool and "token1Address" in pool:
+                tokens = (pool["token0Address"], pool["token1Address"])
+            else:
+                tokens = sorted({token for edge in self.poolEdges.get(key, ()) for token in edge}, key=lambda token: int(token, 16))
+                if len(tokens) != 2:
+                    continue
+            self.poolReserves[key] = dict(zip(tokens, poolVirtualReserves(pool)))
+            updated += 1
+
+        return dict(self.state(), updated=updated)
+
+    def edgeReserves(self):
+        """
+        Virtual reserve of the output token of every core edge, by edge id, nan when unknown.
+        The extra last entry is the infinitely deep padding hop of shorter cycles
+        """
+        core = self.getCore()
+        reserveOut = np.full(core.numberOfEdges() + 1, np.inf, dtype=np.float64)
+        poolKeys, nodes = core.poolKeys, core.nodes
+        for edgeId, (poolKey, target) in enumerate(zip(core.poolKey.tolist(), core.indices.tolist())):
+            reserveOut[edgeId] = self.poolReserves.get(poolKeys[poolKey], {}).get(nodes[target], np.nan)
+        return reserveOut
+
+    def baseTokenValues(self):
+        # Value of one unit of each token in units of the first base token (WETH), by node id, nan off the base tokens
+        core = self.getCore()
+        values = np.full(len(core.nodes), np.nan, dtype=np.float64)
+        reference = BASE_TOKEN_LIST[0]
+        for token in BASE_TOKEN_LIST:
+            nodeId = core.nodeIds.get(token)
+            if nodeId is None:
+                continue
+            if token == reference:
+                values[nodeId] = 1.0
+                continue
+            edgeId = core.edgeId(token, reference)
+            if edgeId is not None:
+                values[nodeId] = math.exp(-core.weight[edgeId])
+        return values
+
+    def pairWeight(self, source, target):
+        # Weight of the best pool from source to target
+        if self.graph.is_multigraph():
+            return min(attr["weight"] for attr in self.graph[source][target].values())
+        return self.graph[source][target]["weight"]
+
+    def getCore(self):
+        # Array backed copy of the graph, rebuilt per topology version and updated in place with the deltas
+        if self.core is None or self.core.topologyVersion != self.topologyVersion:
+            self.core = CSRGraph.fromGraph(self.graph)
+            self.core.topologyVersion = self.topologyVersion
+        return self.core
+
+    def getCycleIndex(self, maxPathLength=4):
+        # Rebuilt only when the topology changed since the last build, weight updates keep the index
+        index = self.cycleIndex
+        if (
+            index is None
+            or index.topologyVersion != self.topologyVersion
+            or index.maxPathLength != maxPathLength
+        ):
+            index = CycleIndex(self.getCore(), maxPathLength, self.topologyVersion)
+            self.cycleIndex = index
+        return index
+
+    def getNegativeCycleDetector(self):
+        # Distance labels survive weight updates, a topology change starts over cold
+        detector = self.negativeCycleDetector
+        if detector is None or detector.topologyVersion != self.topologyVersion:
+            detector = NegativeCycleDetector(
+                self.getCore(), BASE_TOKEN_LIST, self.topologyVersion
+            )
+            self.negativeCycleDetector = detector
+        return detector
+
+    def cycleIdsThroughPools(self, poolAddresses):
+        edges = [edge for key in poolAddresses for edge in self.poolEdges.get(key, ())]
+        return self.getCycleIndex().cycleIdsThroughEdges(edges)
+
+    def state(self):
+        return {
+            "version": self.version,
+            "topologyVersion": self.topologyVersion,
+            "blockNumber": self.blockNumber,
+            "nodes": self.graph.number_of_nodes(),
+            "edges": self.graph.number_of_edges(),
+        }
+
+
+_residentGraph = None
+
+
+def getResidentGraph(reload=False):
+    # Graph engine shared by every query of this process, loaded from the DB on first use
+    global _residentGraph
+    if _residentGraph is None:
+        _residentGraph = ResidentGraph()
+    elif reload:
+        _residentGraph.load()
+    return _residentGraph
+
+
+class CycleIndex:
+    """
+    Cycles of the graph enumerated once per topology version on its CSRGraph core
+
+    Each cycle is found from its first edge the same way findPossibleCycles expands a starting edge,
+    so findCycles returns the same cycles in the same order without walking the graph.
+    Cycles are also kept as rows of edge ids into a weight array so they can be scored at once
+    """
+
+    def __init__(self, core, maxPathLength=4, topologyVersion=None):
+        self.core = core
+        self.maxPathLength = maxPathLength
+        self.topologyVersion = topologyVersion
+        self.cycles = []
+        # First edge id -> cycle ids per expansion round
+        self.startCycles = []
+        # Edge id -> ids of every cycle using that edge
+        self.edgeCycles = {}
+
+        # Edge weights by edge id, the extra last weight is the 0 padding of shorter cycles
+        numEdges = core.numberOfEdges()
+        self.weights = np.zeros(numEdges + 1, dtype=np.float64)
+        self.weights[:numEdges] = core.weight
+
+        cycleEdges = []
+        nodes = core.nodes
+        sources = core.source.tolist()
+        for edgeId in range(numEdges):
+            startRounds = []
+            for roundCycles in core.cyclesFrom(edgeId, maxPathLength):
+                cycleIds = []
+                for edgePath in roundCycles:
+                    cycleId = len(self.cycles)
+                    self.cycles.append([nodes[sources[e]] for e in edgePath] + [nodes[sources[edgeId]]])
+                    for e in edgePath:
+                        self.edgeCycles.setdefault(e, []).append(cycleId)
+                    cycleEdges.append(edgePath)
+                    cycleIds.append(cycleId)
+                startRounds.append(cycleIds)
+            self.startCycles.append(startRounds)
+
+        self.cycleEdges = np.full(
+            (len(cycleEdges), maxPathLength - 1), numEdges, dtype=np.int32
+        )
+        for cycleId, edgePath in enumerate(cycleEdges):
+            self.cycleEdges[cycleId, : len(edgePath)] = edgePath
+
+        baseTokens = set(BASE_TOKEN_LIST)
+        self.startsAtBase = np.array(
+            [cycle[0] in baseTokens for cycle in self.cycles], dtype=bool
+        )
+
+    def cycleEdgeIds(self, cycleId):
+        return self.cycleEdges[cycleId, : len(self.cycles[cycleId]) - 1].tolist()
+
+    def setWeight(self, source, target, weight):
+        edgeId = self.core.edgeId(source, target)
+        if edgeId is not None:
+            self.weights[edgeId] = weight
+
+    def findCycleIds(self, startingEdge):
+        # Ids of findPossibleCycles(G, startingEdge, maxPathLength) in the same order
+        source, target = startingEdge
+        forwardEdge = self.core.edgeId(source, target)
+        backwardEdge = self.core.edgeId(target, source)
+        forward = [] if forwardEdge is None else self.startCycles[forwardEdge]
+        backward = [] if backwardEdge is None else self.startCycles[backwardEdge]
+        cycleIds = []
+        for i in range(self.maxPathLength - 2):
+            for rounds in (forward, backward):
+                if i < len(rounds):
+                    cycleIds.extend(rounds[i])
+        return np.array(cycleIds, dtype=np.int64)
+
+    def findCycles(self, startingEdge):
+        return [self.cycles[cycleId] for cycleId in self.findCycleIds(startingEdge)]
+
+    def cycleIdsThroughEdges(self, edges):
+        # Every cycle that uses at least one of the directed edges, the ones to re-score after an update
+        cycleIds = set()
+        for source, target in edges:
+            cycleIds.update(self.edgeCycles.get(self.core.edgeId(source, target), ()))
+        return np.array(sorted(cycleIds), dtype=np.int64)
+
+    def cyclesThroughEdges(self, edges):
+        return [self.cycles[cycleId] for cycleId in self.cycleIdsThroughEdges(edges)]
+
+    def estimateCycles(self, cycleIds, reserveOut):
+        """
+        Approximate optimal input and profit of each cycle, in raw units of its start token
+
+        Every hop is taken as a constant product pool on its virtual reserves, out = r x / (1 + c x) with r the
+        spot ratio (fee included) and c = r / reserveOut. Hops compose into the same form, R = r1 r2 and
+        C = c1 + r1 c2, so the cycle optimum is x = (sqrt(R) - 1) / C with profit (sqrt(R) - 1)^2 / C.
+        Cycles with a hop of unknown depth come out as nan
+        """
+        cycleEdges = self.cycleEdges[cycleIds]
+        ratio = np.exp(-self.weights[cycleEdges])
+        impact = ratio / reserveOut[cycleEdges]
+
+        totalRatio = np.ones(len(cycleIds), dtype=np.float64)
+        totalImpact = np.zeros(len(cycleIds), dtype=np.float64)
+        for hop in range(cycleEdges.shape[1]):
+            totalImpact += totalRatio * impact[:, hop]
+            totalRatio *= ratio[:, hop]
+
+        gain = np.sqrt(totalRatio) - 1
+        with np.errstate(divide="ignore", invalid="ignore"):
+            amountIn = gain / totalImpact
+            profit = gain * gain / totalImpact
+        return amountIn, profit
+
+    def scoreCycles(self, cycleIds):
+        # Total weight of each cycle, one gather and a row sum
+        return self.weights[self.cycleEdges[cycleIds]].sum(axis=1)
+
+    def topCycles(self, cycleIds, k=10):
+        """
+        Ids and total weights of the k lowest weight negative cycles starting at a base token, lowest first
+        Same selection as graphFindBulkCycleWeights on the base token cycles
+        """
+        cycleIds = cycleIds[self.startsAtBase[cycleIds]]
+        totalWeights = self.scoreCycles(cycleIds)
+        negative = totalWeights < 0
+        cycleIds, totalWeights = cycleIds[negative], totalWeights[negative]
+
+        if len(cycleIds) > k:
+            top = np.argpartition(totalWeights, k - 1)[:k]
+            top.sort()
+            cycleIds, totalWeights = cycleIds[top], totalWeights[top]
+        order = np.argsort(totalWeights, kind="stable")
+        return cycleIds[order], totalWeights[order]
+
+
+class NegativeCycleDetector:
+    """
+    Multi source SPFA from every base token over a CSRGraph, reporting many distinct negative cycles
+
+    A found cycle is cut by masking its highest weight edge, so the search goes on to the next cycle.
+    Distance labels, found cycles and their cuts are kept between runs. A run only re-seeds the edges changed
+    since the last run and the cuts of cycles that are no longer negative, and drops the shortest path subtree
+    hanging off a changed edge, so after a few edge updates only the affected region is relaxed again
+    """
+
+    # Minimum improvement of a distance label, keeps zero weight loops from relaxing forever
+    EPSILON = 1e-12
+    # Relaxation budget per run in multiples of the edge count, past it the next run starts cold
+    MAX_RELAXATIONS_FACTOR = 50
+
+    def __init__(self, core, sources=BASE_TOKEN_LIST, topologyVersion=None):
+        self.core = core
+        self.sources = [core.nodeIds[source] for source in sources if source in core.nodeIds]
+        self.topologyVersion = topologyVersion
+        self.dist = {}
+        # Token -> edge id it was last relaxed through
+        self.pred = {}
+        self.changedEdges = set()
+        # Cut edge id -> cycle it was cut for, and the other way round. Cycles are tuples of edge ids
+        self.maskedEdges = {}
+        self.cycles = {}
+        self.coldStart = True
+
+    def edgeChanged(self, source, target):
+        edgeId = self.core.edgeId(source, target)
+        if edgeId is not None:
+            self.changedEdges.add(edgeId)
+
+    def _push(self, node):
+        if node not in self.inQueue:
+            self.queue.append(node)
+            self.inQueue.add(node)
+
+    def _invalidate(self, root):
+        # Drop the labels of the shortest path subtree under root and re-seed it from its boundary
+        children = {}
+        for node, edgeId in self.pred.items():
+            children.setdefault(self.edgeSources[edgeId], []).append(node)
+
+        subtree = {root}
+        stack = [root]
+        while stack:
+            for child in children.get(stack.pop(), ()):
+                if child not in subtree:
+                    subtree.add(child)
+                    stack.append(child)
+
+        for node in subtree:
+            self.dist.pop(node, None)
+            self.pred.pop(node, None)
+        reverseAdjacency = self.core.reverseAdjacency()
+        for node in subtree:
+            if node in self.sources:
+                self.dist[node] = 0.0
+                self._push(node)
+            for parent, edgeId in reverseAdjacency[node]:
+                if parent not in subtree and parent in self.dist:
+                    self._push(parent)
+
+    def _predCycles(self):
+        # Cycles of the predecessor graph, each as edge ids in forward order
+        cycles = []
+        walk = {}
+        for start in self.pred:
+            if start in walk:
+                continue
+            path = []
+            node = start
+            while node is not None and node not in walk:
+                walk[node] = start
+                path.append(node)
+                edgeId = self.pred.get(node)
+                node = None if edgeId is None else self.edgeSources[edgeId]
+            if node is not None and walk[node] == start:
+                cycles.append([self.pred[node] for node in path[path.index(node) :][::-1]])
+        return cycles
+
+    def _cycleWeight(self, cycle):
+        return sum(self.weights[edgeId] for edgeId in cycle)
+
+    def _canonicalCycle(self, cycle):
+        # Rotate to start at the first base token it contains
+        nodes = [self.edgeSources[edgeId] for edgeId in cycle]
+        start = None
+        for source in self.sources:
+            if source in nodes:
+                start = nodes.index(source)
+                break
+        if start is None:
+            start = nodes.index(min(nodes))
+        return tuple(cycle[start:] + cycle[:start])
+
+    def _cutCycles(self):
+        cycles = self._predCycles()
+        for cycle in cycles:
+            cycle = self._canonicalCycle(cycle)
+            edgeId = max(cycle, key=lambda edgeId: self.weights[edgeId])
+            self.maskedEdges[edgeId] = cycle
+            self.cycles[cycle] = edgeId
+            target = self.edgeTargets[edgeId]
+            if self.pred.get(target) == edgeId:
+                self._invalidate(target)
+        return len(cycles) > 0
+
+    def _unmask(self, edgeId):
+        cycle = self.maskedEdges.pop(edgeId)
+        del self.cycles[cycle]
+
+    def run(self):
+        """
+        Negative cycles reachable from the base tokens, {cycle edge ids: totalweight}
+        """
+        self.queue = deque()
+        self.inQueue = set()
+        core = self.core
+        indptr, indices = core.adjacency()
+        self.edgeSources = core.source.tolist()
+        self.edgeTargets = indices
+        # Weights are fixed for the run
+        self.weights = core.weight.tolist()
+
+        if self.coldStart:
+            self.dist = {source: 0.0 for source in self.sources}
+            self.pred = {}
+            self.maskedEdges = {}
+            self.cycles = {}
+            for source in self.sources:
+                self._push(source)
+        else:
+            # Cuts of cycles that changed or stopped being negative are lifted and re-seeded with the changed edges
+            seeds = set(self.changedEdges)
+            for cycle, edgeId in list(self.cycles.items()):
+                if edgeId in self.changedEdges or self._cycleWeight(cycle) >= 0:
+                    self._unmask(edgeId)
+                    seeds.add(edgeId)
+
+            for edgeId in seeds:
+                if self.pred.get(self.edgeTargets[edgeId]) == edgeId:
+                    self._invalidate(self.edgeTargets[edgeId])
+                if self.edgeSources[edgeId] in self.dist:
+                    self._push(self.edgeSources[edgeId])
+
+        self.changedEdges = set()
+        self.coldStart = False
+
+        weights = self.weights
+        relaxations = 0
+        checkEvery = max(len(core.nodes), 1)
+        maxRelaxations = self.MAX_RELAXATIONS_FACTOR * max(core.numberOfEdges(), 1)
+        while True:
+            while self.queue and relaxations <= maxRelaxations:
+                node = self.queue.popleft()
+                self.inQueue.discard(node)
+                if node not in self.dist:
+                    continue
+
+                nodeDist = self.dist[node]
+                for edgeId in range(indptr[node], indptr[node + 1]):
+                    if edgeId in self.maskedEdges:
+                        continue
+                    target = indices[edgeId]
+                    newDist = nodeDist + weights[edgeId]
+                    if newDist < self.dist.get(target, math.inf) - self.EPSILON:
+                        self.dist[target] = newDist
+                        self.pred[target] = edgeId
+                        self._push(target)
+
+                        relaxations += 1
+                        # Labels may have been dropped by a cut, node goes back to the queue to finish its edges
+                        if relaxations % checkEvery == 0 and self._cutCycles():
+                            self._push(node)
+                            break
+
+            if relaxations > maxRelaxations:
+                self.coldStart = True
+                break
+            # Converged, unless cycles are left in the predecessor graph
+            if not self._cutCycles():
+                break
+
+        found = {}
+        for cycle in self.cycles:
+            totalWeight = self._cycleWeight(cycle)
+            if totalWeight < 0:
+                found[cycle] = totalWeight
+        return found
+
+
+def findNegativeCyclesEdges(engine, maxCycles=10):
+    # Negative cycles from all base tokens in one pass, ranked like findPossibleCyclesEdges
+    detector = engine.getNegativeCycleDetector()
+    found = detector.run()
+    core = detector.core
+    baseTokens = set(detector.sources)
+    cyclesProfit = sorted(
+        (
+            {"cycle": list(cycle), "totalweight": totalWeight}
+            for cycle, totalWeight in found.items()
+            if core.source[cycle[0]] in baseTokens
+        ),
+        key=lambda d: d["totalweight"],
+    )
+
+    cyclePaths = list(map(lambda x: x["cycle"], cyclesProfit[: int(maxCycles)]))
+    paths = coreCyclesPoolPaths(core, cyclePaths)
+    return json.dumps(paths)
+
+
+def updateGraphEdges(edges, blockNumber=None):
+    engine = getResidentGraph()
+    updated = engine.applyEdgeDeltas(edges, blockNumber)
+    return json.dumps(dict(engine.state(), updated=len(updated)))
+
+
 def graphFindPoolEdge(G, poolAddress):
     result = []
     for edge in G.edges(data=True):
@@ -23,7 +672,14 @@ def graphFindPoolEdge(G, poolAddress):
 def graphFindCycleEdges(G, cycle):
     edges = []
     for i in range(len(cycle) - 1):
-        edge = [cycle[i], cycle[i + 1], G.get_edge_data(cycle[i], cycle[i + 1])]
+        data = G.get_edge_data(cycle[i], cycle[i + 1])
+        if G.is_multigraph():
+            # Best of the parallel pool edges, the pool address is the edge key
+            keys = list(data)
+            weights = np.array([data[key]["weight"] for key in keys])
+            bestKey = keys[int(np.argmin(weights))]
+            data = dict(data[bestKey], key=bestKey)
+        edge = [cycle[i], cycle[i + 1], data]
         edges.append(edge)
 
     return edges
@@ -117,24 +773,115 @@ def findPossibleCycles(G, startingEdge, maxPathLength):
     return all_cycle_flatten
 
 
-def findPossibleCyclesEdges(G, tokenPath):
+def findPossibleCyclesEdges(G, tokenPath, cycleIndex=None):
+    if isinstance(tokenPath, str):
+        tokenPath = json.loads(tokenPath)
+
+    if cycleIndex is None:
+        cycles = findPossibleCycles(G, tokenPath, 4)
+        return rankCyclesEdges(G, cycles)
+
+    return rankCycleIdsEdges(G, cycleIndex, cycleIndex.findCycleIds(tokenPath))
+
+
+# Cycles through the updated pools from the cycle index, ranked like findPossibleCyclesEdges
+def findPoolCyclesEdges(engine, poolAddresses):
+    if isinstance(poolAddresses, str):
+        poolAddresses = json.loads(poolAddresses)
+
+    cycleIds = engine.cycleIdsThroughPools(poolAddresses)
+    return rankCycleIdsEdges(engine.graph, engine.getCycleIndex(), cycleIds)
+
+
+def findTopCyclesEdges(engine, tokenPath=None, maxPathLength=4, k=10):
+    """
+    Streaming version of findPossibleCyclesEdges that allows longer cycles (maxPathLength 5-6)
+
+    Cycles start with the tokenPath edge in either direction from its base token end,
+    or from every base token when tokenPath is None. The top k are kept while enumerating
+    """
+    if isinstance(tokenPath, str):
+        tokenPath = json.loads(tokenPath)
+
+    core = engine.getCore()
+    if tokenPath is None:
+        startEdges = core.outEdges(BASE_TOKEN_LIST)
+    else:
+        source, target = tokenPath
+        startEdges = [
+            core.edgeId(start, end)
+            for start, end in ((source, target), (target, source))
+            if start in BASE_TOKEN_LIST and core.edgeId(start, end) is not None
+        ]
+
+    topCycles = core.topCycles(startEdges, int(maxPathLength), int(k))
+    paths = coreCyclesPoolPaths(core, [edgePath for edgePath, weight in topCycles])
+    return json.dumps(paths)
+
+
+def findSizedCyclesEdges(engine, tokenPath=None, k=10):
+    """
+    findPossibleCyclesEdges ranked by estimated profit at the optimal size instead of spot weight
+
+    Negative cycles from a base token are sized on the virtual reserves of their pools (CycleIndex.estimateCycles)
+    and ranked by profit in WETH. Cycles through a pool of unknown depth follow, by weight as before.
+    Rows carry the estimated amountIn and profit in start token units, null when unknown
+    """
     if isinstance(tokenPath, str):
         tokenPath = json.loads(tokenPath)
 
-    cycles = findPossibleCycles(G, tokenPath, 4)
-    baseTokenList = [
-        "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2",
-        "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48",
-        "0x6B175474E89094C44Da98b954EedeAC495271d0F",
-        "0xdAC17F958D2ee523a2206206994597C13D831ec7",
-        "0x4Fabb145d64652a948d72533023f6E7A623C7C53",
-        "0x0000000000085d4780B73119b644AE5ecd22b376",
-        "0x0C10bF8FcB7Bf5412187A595ab97a3609160b5c6",
-        "0x8e870d67f660d95d5be530380d0ec0bd388289e1",
-        "0x853d955aCEf822Db058eb8505911ED77F175b99e",
+    cycleIndex = engine.getCycleIndex()
+    if tokenPath is None:
+        cycleIds = np.arange(len(cycleIndex.cycles), dtype=np.int64)
+    else:
+        cycleIds = cycleIndex.findCycleIds(tokenPath)
+    cycleIds = cycleIds[cycleIndex.startsAtBase[cycleIds]]
+    totalWeights = cycleIndex.scoreCycles(cycleIds)
+    negative = totalWeights < 0
+    cycleIds, totalWeights = cycleIds[negative], totalWeights[negative]
+
+    amountIn, profit = cycleIndex.estimateCycles(cycleIds, engine.edgeReserves())
+    startNodes = cycleIndex.core.source[cycleIndex.cycleEdges[cycleIds, 0]]
+    value = profit * engine.baseTokenValues()[startNodes]
+    sized = np.isfinite(value) & (value > 0)
+
+    order = np.lexsort((totalWeights, np.where(sized, -value, 0), ~sized))[: int(k)]
+    paths = coreCyclesPoolPaths(cycleIndex.core, [cycleIndex.cycleEdgeIds(cycleId) for cycleId in cycleIds[order]])
+    for path, i in zip(paths, order):
+        path["amountIn"] = float(amountIn[i]) if sized[i] else None
+        path["profit"] = float(profit[i]) if sized[i] else None
+    return json.dumps(paths)
+
+
+def poolVirtualReserves(pool):
+    # reserve0, reserve1 of a V2 pool, or the virtual reserves L / sqrtP, L * sqrtP of the V3 liquidity at the current tick
+    if pool.get("sqrtPriceX96") is not None and pool.get("liquidity") is not None:
+        sqrtPrice = int(pool["sqrtPriceX96"]) / 2**96
+        liquidity = int(pool["liquidity"])
+        if sqrtPrice == 0:
+            return math.nan, math.nan
+        return liquidity / sqrtPrice, liquidity * sqrtPrice
+    return float(int(pool["reserve0"])), float(int(pool["reserve1"]))
+
+
+def rankCycleIdsEdges(G, cycleIndex, cycleIds):
+    # Vectorized rankCyclesEdges over cycle index ids
+    topIds, totalWeights = cycleIndex.topCycles(cycleIds, 10)
+    paths = coreCyclesPoolPaths(cycleIndex.core, [cycleIndex.cycleEdgeIds(cycleId) for cycleId in topIds])
+    return json.dumps(paths)
+
+
+def coreCyclesPoolPaths(core, edgePaths):
+    # graphFindCyclesPoolPaths for cycles given as CSRGraph edge ids, with the best pool of each hop
+    return [
+        {"tokens": core.cycleTokens(edgePath), "pools": [core.poolKeys[core.poolKey[e]] for e in edgePath]}
+        for edgePath in edgePaths
     ]
+
+
+def rankCyclesEdges(G, cycles):
     # Filter cycles that only contains base token at the start of the path
-    filteredcycles = [cycle for cycle in cycles if cycle[0] in baseTokenList]
+    filteredcycles = [cycle for cycle in cycles if cycle[0] in BASE_TOKEN_LIST]
 
     cyclesProfit = graphFindBulkCycleWeights(G, filteredcycles)
 
@@ -1,11 +1,59 @@
-from TickMath import getSqrtRatioAtTick,getTickAtSqrtRatio
-from SwapMath import computeSwapStep
+from TickMath import getSqrtRatioAtTickCached,getTickAtSqrtRatioFast
+from SwapMath import computeSwapStepFast
 import json
+import os
+import tempfile
+import time
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor,wait
+from concurrent.futures.process import BrokenProcessPool
 from TickBitmap import position
+from tickIndex import TickIndex
+from poolSnapshot import PoolSnapshot,getPoolSnapshot,getPoolSnapshots
+from optimizerCache import getOptimizerCache,optimizerCacheKey,optimizerPathKey
 from fractions import Fraction
+from math import isqrt
+from bisect import bisect_left
+from FixedPoint96 import Q96
 from scipy.optimize import minimize_scalar
+import numpy as np
+from typing import NamedTuple
 
 ## V2 Functions
+# V2 fees are in pips like V3, 3000 is the 997/1000 of UniswapV2Library
+V2_FEE = 3000
+
+def getAmountOutV2(amountIn:int,reserveIn:int,reserveOut:int,fee:int=V2_FEE)->int:
+    # UniswapV2Library.getAmountOut with the fee numerator of the pool, 0 where the library reverts
+    if (amountIn<=0 or reserveIn<=0 or reserveOut<=0):
+        return 0
+    amountInWithFee = amountIn*(1000000-fee)
+    return (amountInWithFee*reserveOut)//(reserveIn*1000000+amountInWithFee)
+
+def getAmountInV2(amountOut:int,reserveIn:int,reserveOut:int,fee:int=V2_FEE)->int:
+    # UniswapV2Library.getAmountIn with the fee numerator of the pool, 0 where the library reverts or the pool can not pay out
+    if (amountOut<=0 or reserveIn<=0 or amountOut>=reserveOut):
+        return 0
+    return (reserveIn*amountOut*1000000)//((reserveOut-amountOut)*(1000000-fee))+1
+
+def getAmountsOutV2(amountsIn,reserveIn:int,reserveOut:int,fee:int=V2_FEE)->list:
+    # getAmountOutV2 over many input amounts, pool constants hoisted out of the loop
+    if (reserveIn<=0 or reserveOut<=0):
+        return [0 for amountIn in amountsIn]
+    g = 1000000-fee
+    d = reserveIn*1000000
+    return [(amountIn*g*reserveOut)//(d+amountIn*g) if amountIn>0 else 0 for amountIn in amountsIn]
+
+def getAmountsInV2(amountsOut,reserveIn:int,reserveOut:int,fee:int=V2_FEE)->list:
+    # getAmountInV2 over many output amounts
+    g = 1000000-fee
+    n = reserveIn*1000000
+    return [
+        (n*amountOut)//((reserveOut-amountOut)*g)+1 if (amountOut>0 and reserveIn>0 and amountOut<reserveOut) else 0
+        for amountOut in amountsOut
+    ]
+
 def swapAmountV2(
     reserves_token0:int,
     reserves_token1:int,
@@ -14,7 +62,7 @@ def swapAmountV2(
     token_quantity:int,
     token_address:str,
     is_input:bool,
-    fee=Fraction(3, 1000),
+    fee:int=V2_FEE,
     ):
 
     assert (token_address==token0_address or token_address==token1_address), 'Token not found in LP pool'
@@ -28,7 +76,7 @@ def swapAmountV2(
             token_in='token1'
 
         
-        amount = getAmountOut(reserves_token0,reserves_token1,token_in_quantity,token_in)
+        amount = getAmountOut(reserves_token0,reserves_token1,token_in_quantity,token_in,fee)
         return amount
         
     if not is_input:
@@ -39,7 +87,7 @@ def swapAmountV2(
         else:
             token_out='token1'
         
-        amount = getAmountIn(reserves_token0,reserves_token1,token_out_quantity,token_out)
+        amount = getAmountIn(reserves_token0,reserves_token1,token_out_quantity,token_out,fee)
         return amount
         
 def getAmountIn(
@@ -47,282 +95,555 @@ def getAmountIn(
     reserves_token1,
     token_out_quantity,
     token_out,
-    fee=Fraction(3, 1000),
+    fee:int=V2_FEE,
 ):
     """
-    Calculates the required token INPUT of token_in for a target OUTPUT at current pool reserves.
-    Uses the self.token0 and self.token1 pointers to determine which token is being swapped in
-    and uses the appropriate formula
-
-    Assumes token_in is token0, token_out is token1
+    Calculates the required token INPUT of token_in for a target OUTPUT at current pool reserves,
+    token_out is 'token0' or 'token1'. Same integer result as UniswapV2Library.getAmountIn,
+    0 when the pool can not pay out token_out_quantity
     """
 
     if token_out == "token1":
-        if (token_out_quantity>reserves_token1): 
-            return 0
-
-        return int(
-            (reserves_token0 * token_out_quantity)
-            // ((1 - fee) * (reserves_token1 - token_out_quantity))
-            + 1
-        )
+        return getAmountInV2(token_out_quantity,reserves_token0,reserves_token1,fee)
 
     if token_out == "token0":
-        if (token_out_quantity>reserves_token0): 
-            return 0
-        return int(
-            (reserves_token1 * token_out_quantity)
-            // ((1 - fee) * (reserves_token0 - token_out_quantity))
-            + 1
-        )
+        return getAmountInV2(token_out_quantity,reserves_token1,reserves_token0,fee)
 
 def getAmountOut(
     reserves_token0,
     reserves_token1,
     token_in_quantity,
     token_in,
-    fee=Fraction(3, 1000),
+    fee:int=V2_FEE,
 ):
     """
-    Calculates the expected token OUTPUT for a target INPUT at current pool reserves.
-    Uses the self.token0 and self.token1 pointers to determine which token is being swapped in
-    and uses the appropriate formula
-
-    Assumes token_in is token1, token_out is token0
+    Calculates the expected token OUTPUT for a target INPUT at current pool reserves,
+    token_in is 'token0' or 'token1'. Same integer result as UniswapV2Library.getAmountOut
     """
 
     if token_in == "token0":
-        return int(reserves_token1 * token_in_quantity * (1 - fee)) // int(
-            reserves_token0 + token_in_quantity * (1 - fee)
-        )-1
+        return getAmountOutV2(token_in_quantity,reserves_token0,reserves_token1,fee)
 
     if token_in == "token1":
-        return int(reserves_token0 * token_in_quantity * (1 - fee)) // int(
-            reserves_token1 + token_in_quantity * (1 - fee)
-        )-1
+        return getAmountOutV2(token_in_quantity,reserves_token1,reserves_token0,fee)
+
+def foldV2Path(pools:list,tokenIn:str):
+    """
+    Folds exact-input V2 hops into one virtual pool, output = P*amountIn // (Q + R*amountIn)
+
+    Each hop is out = g*reserveOut*x / (d*reserveIn + g*x) with fee g/d = (10**6-fee)/10**6,
+    substituting one hop into the next keeps the same form with integer coefficients
+    """
+    P,Q,R = 1,1,0
+    token = tokenIn
+    for pool in pools:
+        if (token==pool.token0Address):
+            reserveIn,reserveOut,token = pool.reserve0,pool.reserve1,pool.token1Address
+        else:
+            reserveIn,reserveOut,token = pool.reserve1,pool.reserve0,pool.token0Address
+
+        g = 1000000-pool.fee
+        d = 1000000
+        P,Q,R = g*reserveOut*P, d*reserveIn*Q, d*reserveIn*R+g*P
+
+    return P,Q,R,token
+
+def optimalBorrowV2(borrowAddress:str,pools:list,upperBound:int=None)->int:
+    """
+    Closed-form optimal borrow for an all-V2 path, pools[0] lends borrowAddress and is repaid in its other token,
+    pools[1:] swap the borrowed amount back into that token
+
+    Seen from the repay token the path is one cycle out(y) = P*y/(Q+R*y), profit out(y)-y peaks at
+    y = (sqrt(P*Q)-Q)/R, the borrow is the first hop's output at y. The rounded root and its two neighbours,
+    clamped to [1, upperBound], are checked with the integer swap math. Returns 0 when the cycle is not profitable
+    """
+    repayPool = pools[0]
+    baseAddress = repayPool.token1Address if borrowAddress==repayPool.token0Address else repayPool.token0Address
+
+    P,Q,R,_ = foldV2Path(pools,baseAddress)
+    if P<=Q:
+        return 0
+    repayOptimal = (isqrt(P*Q)-Q)//R
+
+    P0,Q0,R0,_ = foldV2Path(pools[:1],baseAddress)
+    borrow = P0*repayOptimal//(Q0+R0*repayOptimal)
+
+    # getAmountOutV2/getAmountInV2 round, the integer optimum can be one off the rounded root
+    candidates = {max(borrow+offset,1) for offset in (-1,0,1)}
+    if (upperBound!=None):
+        candidates = {min(candidate,upperBound) for candidate in candidates}
+    return max(sorted(candidates),key=lambda candidate: calcProfitMultiHop(candidate,borrowAddress,pools))
+
+
+def quoteV2PathBatch(amounts,path,tokenIn:str,exact:bool=True):
+    """
+    Exact-input outputs of a V2 path for many input amounts in one pass over the hops, path is a list of pool params.
+    exact gives Python ints equal to swapping each amount hop by hop, otherwise a float64 array for screening
+    """
+    pools = getPoolSnapshots(path)
+    if exact:
+        amounts = [int(amount) for amount in amounts]
+    else:
+        amounts = np.asarray(amounts,dtype=np.float64)
+
+    token = tokenIn
+    for pool in pools:
+        if (token==pool.token0Address):
+            reserveIn,reserveOut,token = pool.reserve0,pool.reserve1,pool.token1Address
+        else:
+            reserveIn,reserveOut,token = pool.reserve1,pool.reserve0,pool.token0Address
+        if exact:
+            amounts = getAmountsOutV2(amounts,reserveIn,reserveOut,pool.fee)
+        else:
+            amountsWithFee = np.maximum(amounts,0)*(1000000-pool.fee)
+            amounts = amountsWithFee*reserveOut/(reserveIn*1000000.0+amountsWithFee)
+
+    return amounts
+
+def calcProfitV2PathBatch(amounts,borrowAddress:str,pools:list,exact:bool=True):
+    # calcProfitMultiHop of an all-V2 path for many borrow amounts, float64 profits are -inf where the repay can not be paid
+    repayPool = pools[0]
+    if (borrowAddress==repayPool.token0Address):
+        reserveIn,reserveOut = repayPool.reserve1,repayPool.reserve0
+    else:
+        reserveIn,reserveOut = repayPool.reserve0,repayPool.reserve1
+
+    amountsOut = quoteV2PathBatch(amounts,pools[1:],borrowAddress,exact)
+    if exact:
+        repays = getAmountsInV2([int(amount) for amount in amounts],reserveIn,reserveOut,repayPool.fee)
+        return [amountOut-repay if repay!=0 else 0 for amountOut,repay in zip(amountsOut,repays)]
+
+    amounts = np.asarray(amounts,dtype=np.float64)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        repays = reserveIn*1000000.0*amounts/((reserveOut-amounts)*(1000000-repayPool.fee))
+    return np.where((amounts>0)&(amounts<reserveOut),amountsOut-repays,-np.inf)
+
+# Points per pass of the grid optimizer
+V2_GRID_POINTS = 33
+
+def optimalBorrowGrid(borrowAddress:str,pools:list,upperBound:int,points:int=V2_GRID_POINTS):
+    """
+    Coarse to fine grid search of the optimal borrow for an all-V2 path, [borrow, profit]
+
+    A log spaced float64 pass over (1, upperBound) finds the peak, linear float64 passes zoom in on the best point
+    and its neighbours while they still resolve it, then exact integer passes finish down to single units
+    """
+    def narrow(grid,profits):
+        i = int(np.argmax(profits))
+        return int(grid[max(i-1,0)]),min(int(grid[min(i+1,len(grid)-1)]),upperBound)
+
+    # Float64 profits are the difference of two repay sized amounts, rounding to about 1e-16 of the repay
+    repayPool = pools[0]
+    if (borrowAddress==repayPool.token0Address):
+        reserveIn,reserveOut = repayPool.reserve1,repayPool.reserve0
+    else:
+        reserveIn,reserveOut = repayPool.reserve0,repayPool.reserve1
+    def resolution(amount):
+        return 1e-13*reserveIn*amount/max(reserveOut-amount,1)
+
+    # Spaced as floats, a wei bound is past int64 for anything over ~18 tokens
+    upperBound = max(int(upperBound),1)
+    grid = np.unique(np.floor(np.geomspace(1,float(upperBound),points)))
+    low,high = narrow(grid,calcProfitV2PathBatch(grid,borrowAddress,pools,False))
+
+    # Float passes while float64 profits still tell the best point from the ones outside its neighbours
+    while (high-low>points and high-low>high*1e-6):
+        grid = np.unique(np.floor(np.linspace(float(low),float(high),points)))
+        profits = calcProfitV2PathBatch(grid,borrowAddress,pools,False)
+        i = int(np.argmax(profits))
+        outside = np.concatenate((profits[:max(i-1,0)],profits[i+2:]))
+        if (len(outside)>0 and outside.max()>profits[i]-resolution(high)):
+            break
+        (low,high) = narrow(grid,profits)
+
+    while (high-low>points):
+        step = (high-low)//(points-1)
+        grid = [low+i*step for i in range(points-1)]+[high]
+        (low,high) = narrow(grid,calcProfitV2PathBatch(grid,borrowAddress,pools))
+
+    grid = list(range(low,high+1))
+    profits = calcProfitV2PathBatch(grid,borrowAddress,pools)
+    i = max(range(len(grid)),key=lambda i: profits[i])
+    return [grid[i],profits[i]]
 
 
 # V3 Functions
-def getNextTick(tickMap,currentTick:int,toLeft:bool,tickMapRange):
+# How swapAmount finds the next initialized tick: 'index' bisects the sorted ticks,
+# 'bitmap' walks the word bitmap like the pool contract, both give the same ticks
+TICK_TRAVERSAL = 'index'
+
+def getNextTick(tickIndex:TickIndex,currentTick:int,toLeft:bool,tickMapRange,tickSpacing:int=None):
 
     # Check if current Tick is in the tick range
     if (currentTick<=tickMapRange[0] or currentTick>=tickMapRange[1]):
         return None
 
     # If no next tick to fetch but within the tickMapRange, create a virtual tick
-    if (len(tickMap)>0):
-        if (toLeft and currentTick<tickMap[len(tickMap)-1][0]):
-                return [tickMapRange[0],0,0]
-        elif((not toLeft) and currentTick>tickMap[0][0]):
-                return [tickMapRange[1],0,0]
+    if (len(tickIndex)>0):
+        if (toLeft and currentTick<tickIndex.ticks[0]):
+                return (tickMapRange[0],0,getSqrtRatioAtTickCached(tickMapRange[0]))
+        elif((not toLeft) and currentTick>tickIndex.ticks[-1]):
+                return (tickMapRange[1],0,getSqrtRatioAtTickCached(tickMapRange[1]))
     else:
         if (toLeft):
-            return [tickMapRange[0],0,0]
+            return (tickMapRange[0],0,getSqrtRatioAtTickCached(tickMapRange[0]))
         else:
-            return [tickMapRange[1],0,0]
-    
-    newtickMap = []
-
-    if toLeft:
-        # Find all ticks below current tick
-        for i in range(len(tickMap)):
-            if (tickMap[i][0]<currentTick):
-                newtickMap.append(tickMap[i])
+            return (tickMapRange[1],0,getSqrtRatioAtTickCached(tickMapRange[1]))
 
-        if(len(newtickMap)==0): 
-            return None
-        else:
-            return newtickMap[0]
-    else:
-        # Find all ticks above current tick
-        for i in range(len(tickMap)):
-            if (tickMap[i][0]>currentTick):
-                newtickMap.append(tickMap[i])
-        if(len(newtickMap)==0): 
-            return None
+    # Closest initialized tick in the swap direction, (tick, liquidityNet, sqrtRatio)
+    if (tickSpacing!=None):
+        if toLeft:
+            return tickIndex.nextBelowBitmap(currentTick,tickSpacing)
         else:
-            return newtickMap[len(newtickMap)-1]
-
-def swapAmount(amount:int,tokenAddress:str,isInput:str,poolparam):
-    if isinstance(poolparam,str):
-        pool_data = json.loads(poolparam)
+            return tickIndex.nextAboveBitmap(currentTick,tickSpacing)
+    if toLeft:
+        return tickIndex.nextBelow(currentTick)
     else:
-        pool_data = poolparam
-    
-    assert (pool_data["token0Address"]==tokenAddress) or (pool_data["token1Address"]==tokenAddress), 'tokenAddress not found in this LP pool'
-    poolType = pool_data['poolType']
+        return tickIndex.nextAbove(currentTick)
 
-    if(poolType=='uniswapV3'):
-        
-        state = {
-            'amountSpecifiedRemaining': amount,
-            'amountCalculated': 0,
-            'sqrtPriceX96': int(pool_data['sqrtPriceX96']),
-            'tick': pool_data['currentTick'],
-            'liquidity': int(pool_data['liquidity']),       
-        }
-        fee = pool_data['fee']
-        currentTick = pool_data['currentTick']
-        tickSpacing = pool_data['tickSpacing']
-        tickMapRange = pool_data['tickMapRange']
-        tickMapraw = pool_data['tickMap']
-        tickMap = []
-        # TickMap map tick to liquidityNet
-        for i in range(len(tickMapraw)):
-            tickMap.append([tickMapraw[i][0],tickMapraw[i][1]])
-
-        pos = position(currentTick//tickSpacing)
-        
-        if(isInput=='true'):
-            if (pool_data["token0Address"]==tokenAddress):
-                # tokenIn = 'token0'
-                toLeft = True
-            else:
-                # tokenIn = 'token1'
-                toLeft = False
-
-            while (state['amountSpecifiedRemaining']>0):
-                sqrtPriceStartX96 = state['sqrtPriceX96']
-                nextTick = getNextTick(tickMap,state['tick'],toLeft,tickMapRange)
-                # If cannot fetch next tick return with the last state value
-
-                if (nextTick==None):
-                    lastTick = state['tick']
-                    lastsqrtPrice = getSqrtRatioAtTick(lastTick)
-                    return [state['amountCalculated'],lastsqrtPrice]
-                        
-                # Calculate amount in and out to the next tick
-                sqrtPriceNextX96 = getSqrtRatioAtTick(nextTick[0])
-                computeAmounts = computeSwapStep(sqrtPriceStartX96,sqrtPriceNextX96,state['liquidity'],state['amountSpecifiedRemaining'],fee)
-
-                amountIn = int(computeAmounts[1])+int(computeAmounts[3])
-                amountOut = int(computeAmounts[2])
-
-                # Update State
-                state['sqrtPriceX96'] = sqrtPriceNextX96
-                state['tick'] = nextTick[0]
-                state['amountSpecifiedRemaining'] -= amountIn
-                state['amountCalculated'] +=amountOut
-                
-
-                if (toLeft):
-                    state['liquidity']-= int(nextTick[1])
-
-                    if (sqrtPriceNextX96<computeAmounts[0]):
-                        state['sqrtPriceX96'] = computeAmounts[0]
-                        state['tick'] = getTickAtSqrtRatio(state['sqrtPriceX96'])
-                else:
-                    state['liquidity']+= int(nextTick[1])
-
-                    if (sqrtPriceNextX96>computeAmounts[0]):
-                        state['sqrtPriceX96'] = computeAmounts[0]
-                        state['tick'] = getTickAtSqrtRatio(state['sqrtPriceX96'])            
-        else:
-            if (pool_data["token0Address"]==tokenAddress):
-                # tokenIn = 'token1'
-                toLeft = False
-            else:
-                # tokenIn = 'token0'
-                toLeft = True
+# Swaps on V3 snapshots skip the fully crossed tick segments with the prefix tables
+SWAP_PREFIX_TABLES = True
 
-            while (state['amountSpecifiedRemaining']>0):
-                
-                sqrtPriceStartX96 = state['sqrtPriceX96']
-                nextTick = getNextTick(tickMap,state['tick'],toLeft,tickMapRange)
-
-                if (nextTick==None):
-                    lastTick = state['tick']
-                    lastsqrtPrice = getSqrtRatioAtTick(lastTick)
-                    return [0,lastsqrtPrice]
-
-                sqrtPriceNextX96 = getSqrtRatioAtTick(nextTick[0])
-
-                computeAmounts = computeSwapStep(sqrtPriceStartX96,sqrtPriceNextX96,state['liquidity'],-state['amountSpecifiedRemaining'],fee)
+class SwapPrefixTable:
+    """
+    Swap state of one V3 pool snapshot after each tick crossed in one direction, extended lazily
 
-                amountIn = int(computeAmounts[1])+int(computeAmounts[3])
-                amountOut = int(computeAmounts[2])
+    Entry i holds the total input (fee included) and output of the first i full tick segments with the
+    price, tick and liquidity after them. A full segment moves the same amounts in exact input and exact
+    output swaps, and an exact input swap of amount crosses segment i exactly when amount>=amountsIn[i+1]
+    (amountRemainingLessFee>=amountIn of the step), so any swap starts from the last entry it reaches
+    """
+    __slots__ = ('pool','toLeft','amountsIn','amountsOut','sqrtPrices','ticks','liquidities','complete')
+
+    def __init__(self,pool,toLeft:bool):
+        self.pool = pool
+        self.toLeft = toLeft
+        self.amountsIn = [0]
+        self.amountsOut = [0]
+        self.sqrtPrices = [pool.sqrtPriceX96]
+        self.ticks = [pool.currentTick]
+        self.liquidities = [pool.liquidity]
+        # Nothing to extend after the last entry, swaps beyond it continue in the swap loop
+        self.complete = False
+
+    def extend(self,amount:int,exactIn:bool):
+        # Cross segments until the totals reach amount or the swap loop would stop
+        pool = self.pool
+        toLeft = self.toLeft
+        tickIndex = pool.tickIndex
+        tickMapRange = pool.tickMapRange
+        totals = self.amountsIn if exactIn else self.amountsOut
+        while (not self.complete and totals[-1]<amount):
+            tick = self.ticks[-1]
+            liquidity = self.liquidities[-1]
+            nextTick = getNextTick(tickIndex,tick,toLeft,tickMapRange)
+            # Negative liquidity (inconsistent tick data) breaks the ordering of the totals, the swap loop takes over
+            if (nextTick==None or liquidity<0):
+                self.complete = True
+                break
+
+            if (liquidity==0):
+                exhausted = len(tickIndex)==0 or (tick<tickIndex.ticks[0] if toLeft else tick>tickIndex.ticks[-1])
+                amountIn = 0
+                amountOut = 0
+            else:
+                computeAmounts = computeSwapStepFast(self.sqrtPrices[-1],nextTick[2],liquidity,MAX_SWAP_AMOUNT,pool.fee)
+                exhausted = False
+                amountIn = computeAmounts[1]+computeAmounts[3]
+                amountOut = computeAmounts[2]
+
+            self.amountsIn.append(self.amountsIn[-1]+amountIn)
+            self.amountsOut.append(self.amountsOut[-1]+amountOut)
+            self.sqrtPrices.append(nextTick[2])
+            self.ticks.append(nextTick[0])
+            self.liquidities.append(liquidity-nextTick[1] if toLeft else liquidity+nextTick[1])
+            if (exhausted or nextTick[0]<=tickMapRange[0] or nextTick[0]>=tickMapRange[1]):
+                self.complete = True
+
+    def reach(self,amount:int,exactIn:bool)->int:
+        # Index of the last entry a swap of amount gets to with full segments
+        self.extend(amount,exactIn)
+        totals = self.amountsIn if exactIn else self.amountsOut
+        i = bisect_left(totals,amount)
+        if (i<len(totals) and totals[i]==amount):
+            return i
+        return i-1
+
+def getSwapPrefixTable(pool,toLeft:bool)->SwapPrefixTable:
+    table = pool.swapTables[toLeft]
+    if (table==None):
+        table = SwapPrefixTable(pool,toLeft)
+        pool.swapTables[toLeft] = table
+    return table
+
+class SwapResult(NamedTuple):
+    # Outcome of simulateSwap, amounts in raw token units
+    amountCalculated: int   # output of an exact-input swap, input of an exact-output swap
+    amountFilled: int       # part of the specified amount the pool swapped
+    amountRemaining: int    # part of the specified amount left unfilled at the end of the liquidity
+    sqrtPriceX96: int       # final pool price, from the reserves after the swap for V2
+    tick: int               # final tick, None for V2
+    ticksCrossed: int
+
+    @property
+    def filled(self)->bool:
+        return self.amountRemaining<=0
+
+def sqrtPriceV2(reserve0:int,reserve1:int)->int:
+    # V2 reserve ratio as a V3 sqrtPriceX96
+    if (reserve0<=0):
+        return 0
+    return isqrt((reserve1<<192)//reserve0)
 
-                # Update State
-                state['sqrtPriceX96'] = sqrtPriceNextX96
-                state['tick'] = nextTick[0]
-                state['amountSpecifiedRemaining'] -= amountOut
-                state['amountCalculated'] +=amountIn
-                
+# Specified amount that no pool can fill, simulateSwap with it gives the max fillable amount
+MAX_SWAP_AMOUNT = 2**255-1
 
-                if (toLeft):
-                    state['liquidity']-= int(nextTick[1])
+def simulateSwap(amount:int,tokenAddress:str,isInput,poolparam,traversal:str=None)->SwapResult:
+    """
+    Swap of amount of tokenAddress (input if isInput else output), reporting how much of it the pool can fill
 
-                    if (sqrtPriceNextX96<computeAmounts[0]):
-                        state['sqrtPriceX96'] = computeAmounts[0]
-                        state['tick'] = getTickAtSqrtRatio(state['sqrtPriceX96'])
-                else:
-                    state['liquidity']+= int(nextTick[1])
+    Stops at the end of the fetched tick range, or right away once liquidity is 0 with no initialized tick ahead.
+    Ticks passed with 0 liquidity are crossed without a swap step
+    """
+    pool = getPoolSnapshot(poolparam)
+    assert (pool.token0Address==tokenAddress) or (pool.token1Address==tokenAddress), 'tokenAddress not found in this LP pool'
+    exactIn = (isInput=='true' or isInput==True)
+
+    if (pool.poolType=='uniswapV2'):
+        zeroIn = (tokenAddress==pool.token0Address)==exactIn
+        if zeroIn:
+            reserveIn,reserveOut = pool.reserve0,pool.reserve1
+        else:
+            reserveIn,reserveOut = pool.reserve1,pool.reserve0
+        if exactIn:
+            amountIn,amountOut = amount,getAmountOutV2(amount,reserveIn,reserveOut,pool.fee)
+        else:
+            amountIn,amountOut = getAmountInV2(amount,reserveIn,reserveOut,pool.fee),amount
+            if (amountIn==0 and amount>0):
+                return SwapResult(0,0,amount,sqrtPriceV2(pool.reserve0,pool.reserve1),None,0)
+        reserveIn,reserveOut = reserveIn+amountIn,reserveOut-amountOut
+        sqrtPriceX96 = sqrtPriceV2(reserveIn,reserveOut) if zeroIn else sqrtPriceV2(reserveOut,reserveIn)
+        return SwapResult(amountOut if exactIn else amountIn,amount,0,sqrtPriceX96,None,0)
+
+    fee = pool.fee
+    tickMapRange = pool.tickMapRange
+    tickIndex = pool.tickIndex
+    # Tick spacing given to getNextTick selects the bitmap traversal
+    traversalSpacing = pool.tickSpacing if (traversal or TICK_TRAVERSAL)=='bitmap' else None
+    # token0 in moves the price left: exact input of token0 or exact output of token1
+    toLeft = (pool.token0Address==tokenAddress)==exactIn
+
+    remaining = amount
+    calculated = 0
+    sqrtPriceX96 = pool.sqrtPriceX96
+    tick = pool.currentTick
+    liquidity = pool.liquidity
+    crossed = 0
+
+    if (SWAP_PREFIX_TABLES and amount>0):
+        # Jump over the full segments, the loop below only does the last partial step
+        table = getSwapPrefixTable(pool,toLeft)
+        crossed = table.reach(amount,exactIn)
+        if exactIn:
+            remaining = amount-table.amountsIn[crossed]
+            calculated = table.amountsOut[crossed]
+        else:
+            remaining = amount-table.amountsOut[crossed]
+            calculated = table.amountsIn[crossed]
+        sqrtPriceX96 = table.sqrtPrices[crossed]
+        tick = table.ticks[crossed]
+        liquidity = table.liquidities[crossed]
+
+    while (remaining>0):
+        nextTick = getNextTick(tickIndex,tick,toLeft,tickMapRange,traversalSpacing)
+        if (nextTick==None):
+            break
+
+        if (liquidity==0):
+            # Nothing to swap up to the next tick, cross it. Past the last initialized tick nothing can fill any more
+            exhausted = len(tickIndex)==0 or (tick<tickIndex.ticks[0] if toLeft else tick>tickIndex.ticks[-1])
+            sqrtPriceX96 = nextTick[2]
+            tick = nextTick[0]
+            liquidity = liquidity-nextTick[1] if toLeft else liquidity+nextTick[1]
+            crossed += 1
+            if exhausted:
+                break
+            continue
+
+        computeAmounts = computeSwapStepFast(sqrtPriceX96,nextTick[2],liquidity,remaining if exactIn else -remaining,fee)
+        if exactIn:
+            remaining -= computeAmounts[1]+computeAmounts[3]
+            calculated += computeAmounts[2]
+        else:
+            remaining -= computeAmounts[2]
+            calculated += computeAmounts[1]+computeAmounts[3]
+
+        if (computeAmounts[0]==nextTick[2]):
+            sqrtPriceX96 = nextTick[2]
+            tick = nextTick[0]
+            liquidity = liquidity-nextTick[1] if toLeft else liquidity+nextTick[1]
+            crossed += 1
+            if (tick<=tickMapRange[0] or tick>=tickMapRange[1]):
+                # End of the fetched range
+                break
+        else:
+            sqrtPriceX96 = computeAmounts[0]
+            tick = getTickAtSqrtRatioFast(sqrtPriceX96)
+
+    remaining = max(remaining,0)
+    return SwapResult(calculated,amount-remaining,remaining,sqrtPriceX96,tick,crossed)
+
+def maxFillable(tokenAddress:str,isInput,poolparam)->int:
+    # Largest amount of tokenAddress the pool can take in (isInput) or pay out within its fetched liquidity
+    pool = getPoolSnapshot(poolparam)
+    exactIn = (isInput=='true' or isInput==True)
+    if (pool.poolType=='uniswapV2'):
+        if exactIn:
+            return MAX_SWAP_AMOUNT
+        reserveOut = pool.reserve0 if tokenAddress==pool.token0Address else pool.reserve1
+        return max(reserveOut-1,0)
+    return simulateSwap(MAX_SWAP_AMOUNT,tokenAddress,exactIn,pool).amountFilled
+
+def maxBorrowAmount(borrowAddress:str,pools:list)->int:
+    """
+    Largest borrow of borrowAddress from pools[0] that every pool of the path can fill
 
-                    if (sqrtPriceNextX96>computeAmounts[0]):
-                        state['sqrtPriceX96'] = computeAmounts[0]
-                        state['tick'] = getTickAtSqrtRatio(state['sqrtPriceX96'])
+    The max input of each swap hop is taken back to borrow units with exact output swaps on the hops before it
+    """
+    pools = getPoolSnapshots(pools)
+    borrowMax = maxFillable(borrowAddress,False,pools[0])
+    tokens = [borrowAddress]
+    for pool in pools[1:]:
+        tokens.append(pool.token1Address if pool.token0Address==tokens[-1] else pool.token0Address)
+
+    for i in range(1,len(pools)):
+        hopMax = maxFillable(tokens[i-1],True,pools[i])
+        for j in range(i-1,0,-1):
+            if (hopMax==MAX_SWAP_AMOUNT):
+                break
+            result = simulateSwap(hopMax,tokens[j],False,pools[j])
+            if not result.filled:
+                # Hop j can not pay out that much, its own limit is the tighter one
+                hopMax = MAX_SWAP_AMOUNT
+                break
+            hopMax = result.amountCalculated
+        borrowMax = min(borrowMax,hopMax)
+    return borrowMax
+
+def swapAmount(amount:int,tokenAddress:str,isInput,poolparam,traversal:str=None):
+    pool = getPoolSnapshot(poolparam)
+    exactIn = (isInput=='true' or isInput==True)
+    
+    assert (pool.token0Address==tokenAddress) or (pool.token1Address==tokenAddress), 'tokenAddress not found in this LP pool'
+    poolType = pool.poolType
 
-        
-        lastTick = state['tick']
-        lastsqrtPrice = getSqrtRatioAtTick(lastTick)
-        return [state['amountCalculated'],lastsqrtPrice]
+    if(poolType=='uniswapV3'):
+        # [output or input amount, sqrt ratio of the final tick], an exact output swap that can not fill gives 0
+        result = simulateSwap(amount,tokenAddress,exactIn,pool,traversal)
+        if (not exactIn and not result.filled):
+            return [0,getSqrtRatioAtTickCached(result.tick)]
+        return [result.amountCalculated,getSqrtRatioAtTickCached(result.tick)]
         
     elif(poolType=='uniswapV2'):
-        reserve0 = int(pool_data['reserve0'])
-        reserve1 = int(pool_data['reserve1'])
-        token0_address = pool_data["token0Address"]
-        token1_address = pool_data["token1Address"]
+        reserve0 = pool.reserve0
+        reserve1 = pool.reserve1
+        token0_address = pool.token0Address
+        token1_address = pool.token1Address
 
-        if (isInput=='true' or isInput==True):
-            _isInput = True
-
-        else:
-            _isInput = False
-        
-        resultAmount = swapAmountV2(reserve0,reserve1,token0_address,token1_address,amount,tokenAddress,_isInput,Fraction(3, 1000))
-        # print(f'Borrow Amount: {amount} |  Result Amount: {resultAmount} | Input: {_isInput}')
+        resultAmount = swapAmountV2(reserve0,reserve1,token0_address,token1_address,amount,tokenAddress,exactIn,pool.fee)
+        # print(f'Borrow Amount: {amount} |  Result Amount: {resultAmount} | Input: {exactIn}')
 
         return [int(resultAmount),0]
 
-def swapAmountMultiHop(amount:int,FirstToken:str,isInput:str,poolparams:str):
-    if isinstance(poolparams,str):
-        pool_data = json.loads(poolparams)
-    else:
-        pool_data = poolparams
+def swapAmountMultiHop(amount:int,FirstToken:str,isInput,poolparams:str):
+    pool_data = getPoolSnapshots(poolparams)
+    exactIn = (isInput=='true' or isInput==True)
 
     tempAmount = amount
     swapAmountToken = FirstToken
-    if isInput=='true':
+    if exactIn:
         for i in range(len(pool_data)):
-            resultAmount = swapAmount(tempAmount,swapAmountToken,'true',json.dumps(pool_data[i]))
+            resultAmount = swapAmount(tempAmount,swapAmountToken,True,pool_data[i])
 
             tempAmount = resultAmount[0]
-            if (pool_data[i]['token0Address']==swapAmountToken):
-                swapAmountToken = pool_data[i]['token1Address']
+            if (pool_data[i].token0Address==swapAmountToken):
+                swapAmountToken = pool_data[i].token1Address
             else:
-                swapAmountToken = pool_data[i]['token0Address']
+                swapAmountToken = pool_data[i].token0Address
 
     else:
         for i in range(len(pool_data)):
-            resultAmount = swapAmount(tempAmount,swapAmountToken,'false',json.dumps(pool_data[-(1+i)]))
+            resultAmount = swapAmount(tempAmount,swapAmountToken,False,pool_data[-(1+i)])
 
             tempAmount = resultAmount[0]
             
-            if (pool_data[-(1+i)]['token0Address']==swapAmountToken):
-                swapAmountToken = pool_data[-(1+i)]['token1Address']
+            if (pool_data[-(1+i)].token0Address==swapAmountToken):
+                swapAmountToken = pool_data[-(1+i)].token1Address
             else:
-                swapAmountToken = pool_data[-(1+i)]['token0Address']
+                swapAmountToken = pool_data[-(1+i)].token0Address
 
     return resultAmount
 
+class PathQuote(NamedTuple):
+    # Swap along a path of pools, amounts[i] is the amount of the i-th token of the path (amounts[0] goes in)
+    amountIn: int
+    amountOut: int
+    amounts: list
+    sqrtPrices: list    # final sqrtPriceX96 of each pool
+    ticksCrossed: int
+    filled: bool        # every hop filled its amount
+
+def quotePath(amount:int,tokenAddress:str,isInput,poolparams)->PathQuote:
+    """
+    Exact input quote of amount of tokenAddress going into pools[0] through every pool, or exact output quote
+    of amount of tokenAddress coming out of pools[-1], walking the path backwards from it
+
+    Snapshots are parsed once (cached), a hop that can not fill stops the quote with filled False
+    """
+    pools = getPoolSnapshots(poolparams)
+    exactIn = (isInput=='true' or isInput==True)
+    hops = len(pools)
+    amounts = [0]*(hops+1)
+    sqrtPrices = [0]*hops
+    crossed = 0
+    filled = True
+    token = tokenAddress
+
+    if exactIn:
+        amounts[0] = amount
+        for i in range(hops):
+            pool = pools[i]
+            result = simulateSwap(amounts[i],token,True,pool)
+            amounts[i+1] = result.amountCalculated
+            sqrtPrices[i] = result.sqrtPriceX96
+            crossed += result.ticksCrossed
+            if not result.filled:
+                filled = False
+                break
+            token = pool.token1Address if pool.token0Address==token else pool.token0Address
+    else:
+        amounts[hops] = amount
+        for i in range(hops-1,-1,-1):
+            pool = pools[i]
+            result = simulateSwap(amounts[i+1],token,False,pool)
+            amounts[i] = result.amountCalculated
+            sqrtPrices[i] = result.sqrtPriceX96
+            crossed += result.ticksCrossed
+            if not result.filled:
+                filled = False
+                break
+            token = pool.token1Address if pool.token0Address==token else pool.token0Address
+
+    return PathQuote(amounts[0],amounts[hops],amounts,sqrtPrices,crossed,filled)
+
 def getSpotPrice(poolparam:str,baseCurrency:str=None,feeAdjusted:str='false')->Fraction:
-    pool_data = json.loads(poolparam)
-    poolType = pool_data['poolType']
+    pool = getPoolSnapshot(poolparam)
+    poolType = pool.poolType
 
-    token0_address = pool_data["token0Address"]
-    token1_address = pool_data["token1Address"]
-    token0_decimal = pool_data["token0Decimal"]
-    token1_decimal = pool_data["token1Decimal"]
+    token0_address = pool.token0Address
+    token1_address = pool.token1Address
+    token0_decimal = pool.token0Decimal
+    token1_decimal = pool.token1Decimal
     wethAddress = '0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2'
 
     if(baseCurrency==None):
@@ -340,13 +661,13 @@ def getSpotPrice(poolparam:str,baseCurrency:str=None,feeAdjusted:str='false')->F
         decimal_diff = token0_decimal - token1_decimal
 
         if(poolType=='uniswapV3'):
-            sqrtPriceX96 = int(pool_data["sqrtPriceX96"])
+            sqrtPriceX96 = pool.sqrtPriceX96
             ratio = Fraction((sqrtPriceX96 ** 2) / (2 ** 192))
             price = Fraction(((sqrtPriceX96 ** 2) / (2 ** 192))*(10**(decimal_diff)))
 
         if(poolType=='uniswapV2'):
-            reserve0 = int(pool_data["reserve0"])
-            reserve1 = int(pool_data["reserve1"])
+            reserve0 = pool.reserve0
+            reserve1 = pool.reserve1
             if (reserve0==0 or reserve1==0):
                 return None
             ratio = Fraction(reserve1/reserve0)
@@ -355,48 +676,329 @@ def getSpotPrice(poolparam:str,baseCurrency:str=None,feeAdjusted:str='false')->F
         decimal_diff = token1_decimal - token0_decimal
 
         if(poolType=='uniswapV3'):
-            sqrtPriceX96 = int(pool_data["sqrtPriceX96"])
+            sqrtPriceX96 = pool.sqrtPriceX96
             ratio = Fraction((2 ** 192) / (sqrtPriceX96 ** 2))
             price = Fraction(( (2 ** 192) / (sqrtPriceX96 ** 2) )*(10**(decimal_diff)))
 
         if(poolType=='uniswapV2'):
-            reserve0 = int(pool_data["reserve0"])
-            reserve1 = int(pool_data["reserve1"])
+            reserve0 = pool.reserve0
+            reserve1 = pool.reserve1
             if (reserve0==0 or reserve1==0):
                 return None
             ratio = Fraction(reserve0/reserve1)
             price = Fraction((reserve0/reserve1)*(10**(decimal_diff)))
 
     if feeAdjusted=='true':
-        fee = pool_data["fee"] / 1000000
+        fee = pool.fee / 1000000
         price = price * (1-fee)
         ratio = ratio * (1-fee)
     
 
     return [float(price),float(ratio)]
 
+## Piecewise Functions
+# Between two initialized ticks a V3 pool is a constant product curve on virtual reserves, so along a path
+# the output is a chain of Mobius maps out = (A*x+B)/(C*x+D) that only changes at tick crossings
+PIECEWISE_MAX_ITERATIONS = 16
+
+class OptimizerDeadlineExceeded(Exception):
+    pass
+
+def checkDeadline(deadline:float):
+    # deadline is a time.monotonic() timestamp, None for no limit
+    if (deadline!=None and time.monotonic()>deadline):
+        raise OptimizerDeadlineExceeded('optimizer deadline exceeded')
+
+def swapSegment(amountIn:int,tokenIn:str,pool):
+    """
+    Exact-input swap that also returns the Mobius map [[A,B],[C,D]] of the constant liquidity segment the swap ends in,
+    valid for any input landing in the same segment. Past the fetched tick range the map is the constant output reached
+    """
+    if (pool.poolType=='uniswapV2'):
+        g = 1000000-pool.fee
+        if (tokenIn==pool.token0Address):
+            reserveIn,reserveOut = pool.reserve0,pool.reserve1
+        else:
+            reserveIn,reserveOut = pool.reserve1,pool.reserve0
+        amountOut = swapAmount(amountIn,tokenIn,'true',pool)[0]
+        return amountOut,0,(g*reserveOut,0,g,1000000*reserveIn)
+
+    toLeft = tokenIn==pool.token0Address
+    fee = pool.fee
+    remaining = amountIn
+    cumIn = 0
+    cumOut = 0
+    sqrtPriceX96 = pool.sqrtPriceX96
+    tick = pool.currentTick
+    liquidity = pool.liquidity
+    crossed = 0
+
+    while True:
+        segmentStart = (cumIn,cumOut,sqrtPriceX96,liquidity)
+        if (remaining<=0):
+            break
+        nextTick = getNextTick(pool.tickIndex,tick,toLeft,pool.tickMapRange)
+        if (nextTick==None):
+            # Out of the fetched range, output stays where it is
+            return cumOut,-1,(0,cumOut,0,1)
+
+        sqrtPriceNextX96 = nextTick[2]
+        computeAmounts = computeSwapStepFast(sqrtPriceX96,sqrtPriceNextX96,liquidity,remaining,fee)
+        stepIn = computeAmounts[1]+computeAmounts[3]
+        remaining -= stepIn
+        cumIn += stepIn
+        cumOut += computeAmounts[2]
+
+        if (computeAmounts[0]==sqrtPriceNextX96):
+            sqrtPriceX96 = sqrtPriceNextX96
+            tick = nextTick[0]
+            liquidity = liquidity-nextTick[1] if toLeft else liquidity+nextTick[1]
+            crossed += 1
+        else:
+            break
+
+    (startIn,startOut,sqrtP,L) = segmentStart
+    if (L==0):
+        return cumOut,crossed,(0,cumOut,0,1)
+
+    g = 1000000-fee
+    if toLeft:
+        # token0 in: out = L*sqrtP^2*g*x / (Q96^2*L*10^6 + Q96*sqrtP*g*x)
+        a,c,d = L*sqrtP*sqrtP*g, Q96*sqrtP*g, Q96*Q96*L*1000000
+    else:
+        # token1 in: out = Q96^2*L*g*x / (sqrtP^2*L*10^6 + sqrtP*Q96*g*x)
+        a,c,d = Q96*Q96*L*g, sqrtP*Q96*g, sqrtP*sqrtP*L*1000000
+
+    # Shift the segment map to the cumulative amounts at the segment start
+    return cumOut,crossed,(a+startOut*c, startOut*(d-c*startIn)-a*startIn, c, d-c*startIn)
+
+def probePath(amountIn:int,tokenIn:str,pools:list):
+    # Exact-input through every pool, returns the output, the segment of each hop and the composed map
+    (A,B,C,D) = (1,0,0,1)
+    segments = []
+    token = tokenIn
+    amount = amountIn
+    for pool in pools:
+        amount,segment,(a,b,c,d) = swapSegment(amount,token,pool)
+        segments.append(segment)
+        (A,B,C,D) = (a*A+b*C, a*B+b*D, c*A+d*C, c*B+d*D)
+        token = pool.token1Address if token==pool.token0Address else pool.token0Address
+
+    return amount,tuple(segments),(A,B,C,D)
+
+def solveMobiusProfit(A:int,B:int,C:int,D:int):
+    # Maximizes (A*y+B)/(C*y+D) - y, the slope (A*D-B*C)/(C*y+D)^2 reaches 1 at C*y+D = sqrt(A*D-B*C)
+    det = A*D-B*C
+    if (C<=0 or det<=0):
+        return 0
+    return max((isqrt(det)-D)//C,0)
+
+def optimalBorrowPiecewise(borrowAddress:str,pools:list,upperBound:int,deadline:float=None):
+    """
+    Borrow near the optimum by solving the profit curve segment by segment: probe the path, solve the composed segment
+    maps in closed form, move there and repeat until the solution stays inside the segments it was solved on.
+
+    The segment maps are continuous, the swaps round (the fee is floored off every exact input), so the integer profit
+    is a sawtooth around the modelled curve. The root is only checked over its integer neighbourhood: repay floor/ceil
+    +-1 through the real swapSegment and the borrows +-1 around them, the result can sit up to one fee rounding step
+    below the integer optimum. Returns [borrow, profit] checked against calcProfitMultiHop, None when the model and the
+    simulation disagree
+    """
+    repayPool = pools[0]
+    baseAddress = repayPool.token1Address if borrowAddress==repayPool.token0Address else repayPool.token0Address
+
+    repay = 0
+    visited = []
+    for i in range(PIECEWISE_MAX_ITERATIONS):
+        checkDeadline(deadline)
+        amountOut,segments,(A,B,C,D) = probePath(repay,baseAddress,pools)
+        if (len(visited)>0 and visited[-1][1]==segments):
+            break
+        if (segments in [row[1] for row in visited]):
+            # Optimum sits on a tick crossing, narrow search between the probes that bounced around it
+            repays = [row[0] for row in visited]
+            return optimalBorrowBracket(borrowAddress,pools,min(repays),max(repays),upperBound,deadline)
+        visited.append([repay,segments])
+        repay = solveMobiusProfit(A,B,C,D)
+    else:
+        return None
+
+    predicted = amountOut-repay
+    borrow = min(max(swapSegment(repay,baseAddress,repayPool)[0],1),upperBound)
+
+    # Integer neighbourhood of the root against the exact simulation, the root is floored so ceil is repay+1
+    borrows = set()
+    for repayCandidate in range(max(repay-1,0),repay+3):
+        borrowCandidate = swapSegment(repayCandidate,baseAddress,repayPool)[0]
+        borrows.update(x for x in (borrowCandidate-1,borrowCandidate,borrowCandidate+1) if 1<=x<=upperBound)
+    if (len(borrows)==0):
+        borrows.add(borrow)
+    best = max((calcProfitMultiHop(x,borrowAddress,pools),x) for x in sorted(borrows))
+    tolerance = max(abs(predicted)//10**6,10**4)
+    if (borrow<upperBound and best[0]<predicted-tolerance):
+        return None
+
+    return [best[1],best[0]]
+
+def optimalBorrowBracket(borrowAddress:str,pools:list,repayLow:int,repayHigh:int,upperBound:int,deadline:float=None):
+    # Bounded scalar search over the borrow amounts matching a narrow repay bracket
+    repayPool = pools[0]
+    baseAddress = repayPool.token1Address if borrowAddress==repayPool.token0Address else repayPool.token0Address
+    low = max(swapSegment(repayLow,baseAddress,repayPool)[0],1)
+    high = min(max(swapSegment(repayHigh,baseAddress,repayPool)[0],low+1),upperBound)
+    if (high<=low):
+        return [low,calcProfitMultiHop(low,borrowAddress,pools)]
+
+    def objective(x):
+        checkDeadline(deadline)
+        return -float(calcProfitMultiHop(x,borrowAddress,pools))
+
+    # scipy takes float bounds only, 18 decimal borrows overflow its int64 checks
+    optimal = minimize_scalar(
+        objective,
+        method="bounded",
+        bounds=(float(low),float(high)),
+    )
+    borrow = min(max(int(round(optimal.x)),low),high)
+    return [borrow,calcProfitMultiHop(borrow,borrowAddress,pools)]
+
+# Warm start bracket, half width relative to the hint (at least WARM_START_MIN_WIDTH of the upper bound),
+# growth per widening and widenings before the cold start
+WARM_START_WIDTH = 0.02
+WARM_START_MIN_WIDTH = 0.001
+WARM_START_GROWTH = 4
+WARM_START_STEPS = 6
+# Search tolerance relative to the borrow, the profit lost to it is of its square order
+WARM_START_XATOL = 1e-5
+
+def optimalBorrowWarm(borrowAddress:str,pools:list,upperBound:int,hint:int,deadline:float=None):
+    """
+    Bounded search in a narrow bracket around hint (a previous optimal borrow), None if no bracket is found
+
+    The bracket moves to the better side and widens until the profit at hint is above both ends
+    """
+    def profitAt(x):
+        checkDeadline(deadline)
+        return calcProfitMultiHop(x,borrowAddress,pools)
+
+    hint = min(max(int(hint),1),upperBound)
+    # Rounding makes tiny borrows look like local optima, the bracket never gets that narrow
+    width = max(int(hint*WARM_START_WIDTH),int(upperBound*WARM_START_MIN_WIDTH),1)
+    low = max(hint-width,1)
+    high = min(hint+width,upperBound)
+    [lowProfit,hintProfit,highProfit] = [profitAt(low),profitAt(hint),profitAt(high)]
+    for _ in range(WARM_START_STEPS):
+        if (lowProfit<=hintProfit and highProfit<=hintProfit):
+            break
+        width *= WARM_START_GROWTH
+        if (highProfit>hintProfit):
+            if (high>=upperBound):
+                return None
+            [low,lowProfit,hint,hintProfit] = [hint,hintProfit,high,highProfit]
+            high = min(hint+width,upperBound)
+            highProfit = profitAt(high)
+        else:
+            if (low<=1):
+                return None
+            [high,highProfit,hint,hintProfit] = [hint,hintProfit,low,lowProfit]
+            low = max(hint-width,1)
+            lowProfit = profitAt(low)
+    else:
+        return None
+
+    optimal = minimize_scalar(
+        lambda x: -float(profitAt(x)),
+        method="bounded",
+        bounds=(float(low),float(high)),
+        options={'xatol':max(hint*WARM_START_XATOL,1)},
+    )
+    borrow = min(max(int(round(optimal.x)),low),high)
+    profit = profitAt(borrow)
+    if (profit<hintProfit):
+        return [hint,hintProfit]
+    return [borrow,profit]
+
 # Optimize V3 Borrow amount
+def optimizeBorrow(borrowAddress:str,pools:list,bounds:tuple,bracket:tuple,mode:str='scalar',deadline:float=None,hint:int=None):
+    """
+    Optimal [borrow, profit] for borrowing borrowAddress from pools[0] and swapping it back through pools[1:]
+
+    mode 'scalar' runs minimize_scalar over bounds, 'piecewise' solves tick segments in closed form (up to the swap
+    rounding) and falls back to 'scalar' if the result does not check out. All-V2 paths are solved in closed form,
+    or with the vectorized grid search in mode 'grid'. A hint (previous optimal borrow) warm starts mode 'scalar'
+    in a narrow bracket around it, the full bounds are searched if that finds no bracket.
+    Raises OptimizerDeadlineExceeded once time.monotonic() passes deadline
+    """
+    upperBound = int(bounds[1])
+    if all(pool.poolType=='uniswapV2' for pool in pools):
+        if (mode=='grid'):
+            return optimalBorrowGrid(borrowAddress,pools,upperBound)
+        # Constant product on every hop, solve directly
+        borrow = min(max(optimalBorrowV2(borrowAddress,pools,upperBound),1),upperBound)
+        return [borrow,calcProfitMultiHop(borrow,borrowAddress,pools)]
+
+    if (mode=='piecewise'):
+        result = optimalBorrowPiecewise(borrowAddress,pools,upperBound,deadline)
+        if (result!=None):
+            return result
+
+    if (hint!=None and hint>0):
+        result = optimalBorrowWarm(borrowAddress,pools,upperBound,hint,deadline)
+        if (result!=None):
+            return result
+
+    def objective(x):
+        checkDeadline(deadline)
+        return -float(calcProfitMultiHop(x,borrowAddress,pools))
+
+    # scipy takes the bounds as floats, Python ints past 2**63 (18 decimal tokens) are rejected
+    optimal = minimize_scalar(
+        objective,
+        method="bounded",
+        bounds=(float(bounds[0]),float(bounds[1])),
+        bracket=(float(bracket[0]),float(bracket[1])),
+    )
+    borrow = min(max(int(round(optimal.x)),int(bounds[0])),upperBound)
+    return [borrow,calcProfitMultiHop(borrow,borrowAddress,pools)]
+
 def calc_profit(borrowAmount:int,borrowAddress:str,poolcheap_param:str,poolexp_param:str):
         borrowAmount = int(borrowAmount)
+        poolcheap_param = getPoolSnapshot(poolcheap_param)
+        poolexp_param = getPoolSnapshot(poolexp_param)
         # get repayment INPUT at borrow_amount OUTPUT
         [flash_repay_amount, p1sqrtPriceX96]= swapAmount(borrowAmount,borrowAddress,'false',poolcheap_param)
-        [swap_amount_out, p2sqrtPriceX96] = swapAmount(borrowAmount,borrowAddress,'true',poolexp_param)
-        if (flash_repay_amount==0):
+        swapResult = simulateSwap(borrowAmount,borrowAddress,True,poolexp_param)
+        swap_amount_out = swapResult.amountCalculated
+        # Borrow the pools can not fill completely is not a trade
+        if (flash_repay_amount==0 or not swapResult.filled):
             return 0
         else:
             profit = int(swap_amount_out) - int(flash_repay_amount)
             return int(profit)
 
-def optimizePool(borrowAddress:str,pool1param:str,pool2param:str):
-    pool_data1 = json.loads(pool1param)
-    pool_data2 = json.loads(pool2param)
-    p1t0_address = pool_data1["token0Address"]
-    p1t1_address = pool_data1["token1Address"]
-    p2t0_address = pool_data2["token0Address"]
-    p1t0_decimals = pool_data1['token0Decimal']
-    p1t1_decimals = pool_data1['token1Decimal']
-    p2t0_decimals = pool_data2['token0Decimal']
-    p2t1_decimals = pool_data2['token1Decimal']
+def optimizePool(borrowAddress:str,pool1param:str,pool2param:str,mode:str='scalar',hint:int=None):
+    output = json.dumps(optimizePoolResult(borrowAddress,pool1param,pool2param,mode,hint))
+    return output
+
+def optimizePoolResult(borrowAddress:str,pool1param,pool2param,mode:str='scalar',hint:int=None)->dict:
+    # hint: previous optimal borrow to warm start from, the last profitable one of this pair by default
+    # Parse once, every objective evaluation below reuses the snapshots
+    pool_data1 = getPoolSnapshot(pool1param)
+    pool_data2 = getPoolSnapshot(pool2param)
+    # Pair unchanged since the last call, same result
+    cacheKey = optimizerCacheKey('optimizePool',borrowAddress,[pool_data1,pool_data2],mode)
+    cached = getOptimizerCache().get(cacheKey)
+    if (cached!=None):
+        return dict(cached)
+    pool1param = pool_data1
+    pool2param = pool_data2
+    p1t0_address = pool_data1.token0Address
+    p1t1_address = pool_data1.token1Address
+    p2t0_address = pool_data2.token0Address
+    p1t0_decimals = pool_data1.token0Decimal
+    p1t1_decimals = pool_data1.token1Decimal
+    p2t0_decimals = pool_data2.token0Decimal
+    p2t1_decimals = pool_data2.token1Decimal
 
     # Determine pool rates
     if (borrowAddress==p1t0_address):
@@ -416,13 +1018,13 @@ def optimizePool(borrowAddress:str,pool1param:str,pool2param:str):
 
     # Pool1 Cheaper than Pool2 (borrow from p1 and sell on p2)
     def getmaxBorrowReserve(pool_data,borrowAddress,price):
-            if(borrowAddress==pool_data['token0Address']):
-                borrowReserve = int(pool_data['token0balance'])
-                baseReserve = int(pool_data['token1balance'])
+            if(borrowAddress==pool_data.token0Address):
+                borrowReserve = pool_data.token0balance
+                baseReserve = pool_data.token1balance
                 baseEquivBorrowReserve = int((baseReserve*price)*(10**(p1t0_decimals-p1t1_decimals)))
             else:
-                borrowReserve = int(pool_data['token1balance'])
-                baseReserve = int(pool_data['token0balance'])
+                borrowReserve = pool_data.token1balance
+                baseReserve = pool_data.token0balance
                 baseEquivBorrowReserve = int((baseReserve*price)*(10**(p1t1_decimals-p1t0_decimals)))
             
             return min(borrowReserve,baseEquivBorrowReserve)
@@ -441,16 +1043,24 @@ def optimizePool(borrowAddress:str,pool1param:str,pool2param:str):
         p2maxBorrow = getmaxBorrowReserve(pool_data2,borrowAddress,p2Price)
 
     
-    borrowLimit = min(p1maxBorrow,p2maxBorrow)
+    # Search up to the largest borrow both pools can fill
+    borrowLimit = min(p1maxBorrow,p2maxBorrow,maxBorrowAmount(borrowAddress,[poolcheap_param,poolexp_param]))
+    pathKey = optimizerPathKey('optimizePool',borrowAddress,[poolcheap_param,poolexp_param],mode)
+    if (hint==None):
+        hint = getOptimizerCache().lastOptimum(pathKey)
     
-    optimal = minimize_scalar(
-        lambda x: -float(calc_profit(x,borrowAddress,poolcheap_param,poolexp_param)),
-        method="bounded",
-        bounds=(1,0.8*borrowLimit+2),
+    [borrow,profit] = optimizeBorrow(
+        borrowAddress,
+        [poolcheap_param,poolexp_param],
+        bounds=(1,borrowLimit+2),
         bracket=(0.01*borrowLimit,0.05*borrowLimit),
+        mode=mode,
+        hint=int(hint) if hint else None,
     )
-    optimal_borrow = str(int(optimal.x))
-    profit = str(int(-optimal.fun))
+    if (profit>0):
+        getOptimizerCache().putOptimum(pathKey,borrow)
+    optimal_borrow = str(borrow)
+    profit = str(profit)
 
     # Calculate Repay on poolcheap and swapout amount on poolexp
     [repayAmount, p1sqrtPriceX96] = swapAmount(int(optimal_borrow),borrowAddress,'false',poolcheap_param)
@@ -461,14 +1071,14 @@ def optimizePool(borrowAddress:str,pool1param:str,pool2param:str):
     p2sqrtPriceX96 = str(int(p2sqrtPriceX96))
 
 
-    poolcheap_data = json.loads(poolcheap_param)
-    poolexp_data = json.loads(poolexp_param)
+    poolcheap_data = poolcheap_param
+    poolexp_data = poolexp_param
 
     pool1Type=0
     pool2Type=0
-    if poolcheap_data['poolType']=='uniswapV3':
+    if poolcheap_data.poolType=='uniswapV3':
         pool1Type=1
-    if poolexp_data['poolType']=='uniswapV3':
+    if poolexp_data.poolType=='uniswapV3':
         pool2Type=1
 
     outputraw = {
@@ -476,8 +1086,8 @@ def optimizePool(borrowAddress:str,pool1param:str,pool2param:str):
         'profit':profit,
         'repayAmount':repayAmount,
         'swapOutAmount':swapOutAmount,
-        'pool1':poolcheap_data['poolAddress'],
-        'pool2':poolexp_data['poolAddress'],
+        'pool1':poolcheap_data.poolAddress,
+        'pool2':poolexp_data.poolAddress,
         'pool1Type':pool1Type,
         'pool2Type':pool2Type,
         'p1sqrtPriceX96':p1sqrtPriceX96,
@@ -485,45 +1095,98 @@ def optimizePool(borrowAddress:str,pool1param:str,pool2param:str):
         'tokenBorrow':borrowAddress,
         'tokenBase':baseAddress,
         }
+    getOptimizerCache().put(cacheKey,dict(outputraw))
+
+    return outputraw
+
+def optimizePoolsBatch(batchparam,mode:str='scalar'):
+    """
+    optimizePool over many pool pairs in one call, ranked by profit (highest first)
 
-    output = json.dumps(outputraw)
+    batchparam: {"pools":[poolparam,...],"jobs":[[borrowAddress,pool1Address,pool2Address],...]}
+    Each pool is parsed once and shared by every job using it, a failing job is reported with its error after the ranked results
+    """
+    if isinstance(batchparam,str):
+        batchparam = json.loads(batchparam)
+
+    pools = {}
+    for poolparam in batchparam['pools']:
+        pool = getPoolSnapshot(poolparam)
+        pools[pool.poolAddress] = pool
+
+    results = []
+    errors = []
+    for [borrowAddress,pool1Address,pool2Address] in batchparam['jobs']:
+        try:
+            results.append(optimizePoolResult(borrowAddress,pools[pool1Address],pools[pool2Address],mode))
+        except Exception as err:
+            errors.append({
+                'pool1':pool1Address,
+                'pool2':pool2Address,
+                'tokenBorrow':borrowAddress,
+                'error':f'{type(err).__name__}: {err}',
+                })
+
+    results.sort(key=lambda result: int(result['profit']),reverse=True)
+    output = json.dumps(results+errors)
     return output
     
 def calcProfitMultiHop(borrowAmount:int,borrowAddress:str,poolparams):
-    if isinstance(poolparams,str):
-        pool_data = json.loads(poolparams)
-    else:
-        pool_data = poolparams
+    pool_data = getPoolSnapshots(poolparams)
 
     borrowAmount = int(borrowAmount)
 
-    [flash_repay_amount, p1sqrtPriceX96]= swapAmount(borrowAmount,borrowAddress,'false',pool_data[0])
-    [swap_amount_out, p2sqrtPriceX96] = swapAmountMultiHop(borrowAmount,borrowAddress,'true',pool_data[1:])
-
-    if (flash_repay_amount==0):
+    # Repay of the borrow on pool_data[0], then the borrow swapped through the rest of the path
+    repay = simulateSwap(borrowAmount,borrowAddress,False,pool_data[0])
+    if (repay.amountCalculated==0 or not repay.filled):
+        return 0
+    quote = quotePath(borrowAmount,borrowAddress,True,pool_data[1:])
+    # A hop that can not take its whole input makes the borrow unfillable
+    if not quote.filled:
         return 0
-    else:
-        profit = int(swap_amount_out) - int(flash_repay_amount)
-        return int(profit)
 
-def optimizeMultiHop(borrowAddress:str,poolparams:str):
-    pool_data = json.loads(poolparams)
+    profit = quote.amountOut - repay.amountCalculated
+    return int(profit)
 
-    if (pool_data[0]['token0Address']==borrowAddress):
-        borrowLimit = int(pool_data[0]['token0balance'])
-        baseAddress = pool_data[0]['token1Address']
-    else:
-        borrowLimit = int(pool_data[0]['token1balance'])
-        baseAddress = pool_data[0]['token0Address']
+def optimizeMultiHop(borrowAddress:str,poolparams:str,mode:str='scalar',hint:int=None):
+    output = json.dumps(optimizeMultiHopResult(borrowAddress,poolparams,mode,hint=hint))
+    return output
 
-    optimal = minimize_scalar(
-        lambda x: -float(calcProfitMultiHop(x,borrowAddress,pool_data)),
-        method="bounded",
-        bounds=(1,0.8*borrowLimit),
+def optimizeMultiHopResult(borrowAddress:str,poolparams,mode:str='scalar',deadline:float=None,hint:int=None)->dict:
+    # hint: previous optimal borrow to warm start from, the last profitable one of this path by default
+    # Parse once, every objective evaluation below reuses the snapshots
+    pool_data = getPoolSnapshots(poolparams)
+    # Path unchanged since the last call, same result
+    cacheKey = optimizerCacheKey('optimizeMultiHop',borrowAddress,pool_data,mode)
+    cached = getOptimizerCache().get(cacheKey)
+    if (cached!=None):
+        return dict(cached)
+
+    if (pool_data[0].token0Address==borrowAddress):
+        borrowLimit = pool_data[0].token0balance
+        baseAddress = pool_data[0].token1Address
+    else:
+        borrowLimit = pool_data[0].token1balance
+        baseAddress = pool_data[0].token0Address
+    # Search up to the largest borrow every pool on the path can fill
+    borrowLimit = min(borrowLimit,maxBorrowAmount(borrowAddress,pool_data))
+    pathKey = optimizerPathKey('optimizeMultiHop',borrowAddress,pool_data,mode)
+    if (hint==None):
+        hint = getOptimizerCache().lastOptimum(pathKey)
+
+    [borrow,profit] = optimizeBorrow(
+        borrowAddress,
+        pool_data,
+        bounds=(1,borrowLimit+2),
         bracket=(0.01*borrowLimit,0.05*borrowLimit),
+        mode=mode,
+        deadline=deadline,
+        hint=int(hint) if hint else None,
     )
-    optimal_borrow = str(int(optimal.x))
-    profit = str(int(-optimal.fun))
+    if (profit>0):
+        getOptimizerCache().putOptimum(pathKey,borrow)
+    optimal_borrow = str(borrow)
+    profit = str(profit)
 
     [repayAmount, pInsqrtPriceX96] = swapAmount(int(optimal_borrow),borrowAddress,'false',pool_data[0])
     [swapOutAmount, pOutsqrtPriceX96] = swapAmountMultiHop(int(optimal_borrow),borrowAddress,'true',pool_data[1:])
@@ -546,9 +1209,159 @@ def optimizeMultiHop(borrowAddress:str,poolparams:str):
         'tokenBorrow':borrowAddress,
         'tokenBase':baseAddress,
         }
+    getOptimizerCache().put(cacheKey,dict(outputraw))
+    return outputraw
+
+# Parallel multi hop optimization
+MULTIHOP_BATCH_WORKERS = os.cpu_count() or 1
+# Seconds allowed on top of the per job deadlines before unfinished jobs of a batch are dropped
+MULTIHOP_BATCH_TIMEOUT_SLACK = 5
+# Submissions of a job, a worker that dies breaks the whole pool and its jobs go to a new one
+MULTIHOP_BATCH_ATTEMPTS = 2
+
+_multiHopExecutor = None
+_multiHopExecutorWorkers = 0
+_workerBatchPath = None
+_workerPools = {}
+
+def _warmMultiHopWorker():
+    return os.getpid()
+
+def _optimizeMultiHopJob(batchPath:str,borrowAddress:str,poolAddresses:list,mode:str,deadlineSeconds:float,hint:int=None):
+    # Pool snapshots of a batch are loaded once per worker, jobs only carry pool addresses
+    global _workerBatchPath,_workerPools
+    if (_workerBatchPath!=batchPath):
+        with open(batchPath) as batchFile:
+            snapshots = getPoolSnapshots(batchFile.read())
+        _workerPools = {pool.poolAddress:pool for pool in snapshots}
+        _workerBatchPath = batchPath
+
+    deadline = None if deadlineSeconds==None else time.monotonic()+deadlineSeconds
+    pools = [_workerPools[poolAddress] for poolAddress in poolAddresses]
+    return optimizeMultiHopResult(borrowAddress,pools,mode,deadline,hint)
+
+def getMultiHopExecutor(maxWorkers:int=None)->ProcessPoolExecutor:
+    # Long lived worker processes, started and warmed up once and reused by every batch
+    # A pool broken by a dead worker (killed, crashed in native code) takes no more jobs and is replaced
+    global _multiHopExecutor,_multiHopExecutorWorkers
+    maxWorkers = maxWorkers or MULTIHOP_BATCH_WORKERS
+
+    if (_multiHopExecutor==None or _multiHopExecutorWorkers!=maxWorkers or _multiHopExecutor._broken):
+        if (_multiHopExecutor!=None):
+            _multiHopExecutor.shutdown(wait=False,cancel_futures=True)
+
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        _multiHopExecutor = ProcessPoolExecutor(max_workers=maxWorkers,mp_context=context)
+        _multiHopExecutorWorkers = maxWorkers
+        wait([_multiHopExecutor.submit(_warmMultiHopWorker) for i in range(maxWorkers)])
+
+    return _multiHopExecutor
+
+def _removeWhenDone(path:str,futures:list):
+    # Deletes path once no job can open it any more, jobs already handed to a worker can not be cancelled
+    for future in futures:
+        future.cancel()
+    pending = [future for future in futures if not future.done()]
+    if (len(pending)==0):
+        os.remove(path)
+        return
+
+    lock = threading.Lock()
+    remaining = [len(pending)]
+    def release(future):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0]==0
+        if last:
+            os.remove(path)
+    for future in pending:
+        future.add_done_callback(release)
+
+def optimizeMultiHopBatch(batchparam,maxWorkers:int=None,deadline:float=None,mode:str='scalar'):
+    """
+    optimizeMultiHop over many candidate cycles on a pool of worker processes, ranked by profit (highest first)
 
-    output = json.dumps(outputraw)
-    return output
-
-    
+    batchparam: {"pools":[poolparam,...],"jobs":[[borrowAddress,[poolAddress,...]],...]}
+    deadline is the time limit in seconds for each job. Jobs that run past it or fail are reported
+    with their error after the ranked results. Every entry carries its job index. The worker processes
+    have optimizer caches of their own, so results and warm start hints are looked up and kept here
+    """
+    if isinstance(batchparam,str):
+        batchparam = json.loads(batchparam)
+
+    jobs = batchparam['jobs']
+    cache = getOptimizerCache()
+    try:
+        snapshots = {pool.poolAddress:pool for pool in getPoolSnapshots(batchparam['pools'])}
+    except Exception:
+        # The jobs report the pools that do not parse
+        snapshots = {}
+
+    cacheKeys = {}
+    results = {}
+    hints = {}
+    for i in range(len(jobs)):
+        [borrowAddress,poolAddresses] = jobs[i]
+        if not all(poolAddress in snapshots for poolAddress in poolAddresses):
+            continue
+        pools = [snapshots[poolAddress] for poolAddress in poolAddresses]
+        cacheKeys[i] = (
+            optimizerCacheKey('optimizeMultiHop',borrowAddress,pools,mode),
+            optimizerPathKey('optimizeMultiHop',borrowAddress,pools,mode),
+        )
+        cached = cache.get(cacheKeys[i][0])
+        if (cached!=None):
+            results[i] = dict(cached)
+        else:
+            hints[i] = cache.lastOptimum(cacheKeys[i][1])
+
+    with tempfile.NamedTemporaryFile('w',suffix='.json',delete=False) as batchFile:
+        json.dump(batchparam['pools'],batchFile)
+        batchPath = batchFile.name
+
+    futures = {}
+    notDone = set()
+    pending = [i for i in range(len(jobs)) if i not in results]
+    try:
+        for attempt in range(MULTIHOP_BATCH_ATTEMPTS):
+            executor = getMultiHopExecutor(maxWorkers)
+            workers = _multiHopExecutorWorkers
+            for i in pending:
+                [borrowAddress,poolAddresses] = jobs[i]
+                futures[i] = executor.submit(_optimizeMultiHopJob,batchPath,borrowAddress,poolAddresses,mode,deadline,hints.get(i))
+            # Jobs stop themselves at their deadline, this only guards against a single evaluation hanging
+            timeout = None if deadline==None else deadline*(len(pending)//workers+2)+MULTIHOP_BATCH_TIMEOUT_SLACK
+            done,attemptNotDone = wait([futures[i] for i in pending],timeout=timeout)
+            notDone |= attemptNotDone
+            pending = [i for i in pending if futures[i] in done and isinstance(futures[i].exception(),BrokenProcessPool)]
+            if (len(pending)==0):
+                break
+    finally:
+        # Unfinished jobs are cancelled, the ones already queued on a worker still read the batch file
+        _removeWhenDone(batchPath,list(futures.values()))
+
+    errors = []
+    for i,future in futures.items():
+        [borrowAddress,poolAddresses] = jobs[i]
+        error = None
+        if (future in notDone):
+            error = 'OptimizerDeadlineExceeded: batch timed out'
+        elif (future.exception()!=None):
+            err = future.exception()
+            error = f'{type(err).__name__}: {err}'
+
+        if (error==None):
+            results[i] = future.result()
+            if (i in cacheKeys):
+                cache.put(cacheKeys[i][0],dict(results[i]))
+                if (int(results[i]['profit'])>0):
+                    cache.putOptimum(cacheKeys[i][1],int(results[i]['optimal_borrow']))
+        else:
+            errors.append({'job':i,'pools':poolAddresses,'tokenBorrow':borrowAddress,'error':error})
 
+    for i in results:
+        results[i]['job'] = i
+    ranked = sorted(results.values(),key=lambda result: int(result['profit']),reverse=True)
+    output = json.dumps(ranked+errors)
+    return output
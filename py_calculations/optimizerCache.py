@@ -0,0 +1,125 @@
+import time
+from collections import OrderedDict
+
+OPTIMIZER_CACHE_SIZE = 4096
+# Seconds an optimizer result is served for, a few blocks at most
+OPTIMIZER_CACHE_TTL = 36
+
+
+def poolStateFingerprint(pool) -> tuple:
+    # Every PoolSnapshot field the optimizers read, equal fingerprints give equal optimizer results
+    if pool.poolType == "uniswapV3":
+        tickIndex = pool.tickIndex
+        return (
+            pool.poolAddress,
+            pool.sqrtPriceX96,
+            pool.liquidity,
+            pool.currentTick,
+            pool.fee,
+            pool.tickMapRange,
+            # Digest of every initialized tick, the keys stay small while any liquidityNet change is a new key
+            hash((tuple(tickIndex.ticks), tuple(tickIndex.liquidityNet))),
+            pool.token0balance,
+            pool.token1balance,
+        )
+
+    return (
+        pool.poolAddress,
+        pool.reserve0,
+        pool.reserve1,
+        pool.fee,
+        pool.token0balance,
+        pool.token1balance,
+    )
+
+
+def optimizerCacheKey(method: str, borrowAddress: str, pools: list, mode: str) -> tuple:
+    # Path order matters, the pools are fingerprinted in path order
+    return (method, borrowAddress, mode) + tuple(poolStateFingerprint(pool) for pool in pools)
+
+
+def optimizerPathKey(method: str, borrowAddress: str, pools: list, mode: str) -> tuple:
+    # Same path whatever the pool states, for the warm start hints
+    return (method, borrowAddress, mode) + tuple(pool.poolAddress for pool in pools)
+
+
+class OptimizerCache:
+    # Bounded LRU of optimizer results with a time to live, counters for monitoring
+    def __init__(self, maxSize: int = OPTIMIZER_CACHE_SIZE, ttl: float = OPTIMIZER_CACHE_TTL):
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        # Last profitable optimal borrow by path, kept past the ttl as the warm start of the next search
+        self.optima = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        storedAt, value = entry
+        if time.monotonic() - storedAt > self.ttl:
+            del self.entries[key]
+            self.expired += 1
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = (time.monotonic(), value)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+            self.evicted += 1
+
+    def lastOptimum(self, pathKey):
+        return self.optima.get(pathKey)
+
+    def putOptimum(self, pathKey, borrow: int):
+        self.optima[pathKey] = borrow
+        self.optima.move_to_end(pathKey)
+        if len(self.optima) > self.maxSize:
+            self.optima.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.optima.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "optima": len(self.optima),
+            "maxSize": self.maxSize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "hitRate": self.hits / lookups if lookups > 0 else 0,
+        }
+
+
+_optimizerCache = None
+
+
+def getOptimizerCache() -> OptimizerCache:
+    global _optimizerCache
+    if _optimizerCache is None:
+        _optimizerCache = OptimizerCache()
+    return _optimizerCache
+
+
+def clearOptimizerCache() -> dict:
+    # Drops every cached result, the counters keep running
+    cache = getOptimizerCache()
+    cache.clear()
+    return cache.stats()
@@ -0,0 +1,151 @@
+import json
+from collections import OrderedDict
+from tickIndex import TickIndex
+
+POOL_SNAPSHOT_CACHE_SIZE = 512
+
+
+class PoolSnapshot:
+    # Parsed pool params of one pool at one block, numeric fields converted to int once
+    __slots__ = (
+        "data",
+        "poolAddress",
+        "poolType",
+        "blockNumber",
+        "token0Address",
+        "token1Address",
+        "token0Decimal",
+        "token1Decimal",
+        "token0balance",
+        "token1balance",
+        "fee",
+        # uniswapV3
+        "sqrtPriceX96",
+        "liquidity",
+        "currentTick",
+        "tickSpacing",
+        "tickMapRange",
+        "tickIndex",
+        # Swap prefix tables by direction, [token1 in, token0 in], extended by the swaps on this snapshot
+        "swapTables",
+        # uniswapV2
+        "reserve0",
+        "reserve1",
+    )
+
+    def __init__(self, pool_data: dict):
+        init = object.__setattr__
+        poolType = pool_data["poolType"]
+
+        init(self, "data", pool_data)
+        init(self, "poolAddress", pool_data["poolAddress"])
+        init(self, "poolType", poolType)
+        init(self, "blockNumber", pool_data.get("blockNumber"))
+        init(self, "token0Address", pool_data["token0Address"])
+        init(self, "token1Address", pool_data["token1Address"])
+        init(self, "token0Decimal", pool_data["token0Decimal"])
+        init(self, "token1Decimal", pool_data["token1Decimal"])
+        init(self, "token0balance", int(pool_data["token0balance"]))
+        init(self, "token1balance", int(pool_data["token1balance"]))
+        init(self, "fee", int(pool_data.get("fee", 3000)))
+
+        if poolType == "uniswapV3":
+            init(self, "sqrtPriceX96", int(pool_data["sqrtPriceX96"]))
+            init(self, "liquidity", int(pool_data["liquidity"]))
+            init(self, "currentTick", int(pool_data["currentTick"]))
+            init(self, "tickSpacing", int(pool_data["tickSpacing"]))
+            tickMapRange = pool_data.get("tickMapRange")
+            init(self, "tickMapRange", tuple(tickMapRange) if tickMapRange else None)
+            init(self, "tickIndex", TickIndex(pool_data["tickMap"]))
+        else:
+            init(self, "sqrtPriceX96", None)
+            init(self, "liquidity", None)
+            init(self, "currentTick", None)
+            init(self, "tickSpacing", None)
+            init(self, "tickMapRange", None)
+            init(self, "tickIndex", None)
+
+        init(self, "swapTables", [None, None])
+
+        if poolType == "uniswapV2":
+            init(self, "reserve0", int(pool_data["reserve0"]))
+            init(self, "reserve1", int(pool_data["reserve1"]))
+        else:
+            init(self, "reserve0", None)
+            init(self, "reserve1", None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PoolSnapshot is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("PoolSnapshot is immutable")
+
+    def __reduce__(self):
+        return (PoolSnapshot, (self.data,))
+
+    def __repr__(self):
+        return f"PoolSnapshot({self.poolAddress}, {self.poolType}, block={self.blockNumber})"
+
+
+_poolSnapshotCache = OrderedDict()
+
+
+def poolSnapshotKey(pool_data: dict):
+    # Every field a PoolSnapshot is built from, params of the same pool and block can still differ
+    # (helpers.unpackPoolParam sends no tickMapRange), so the block number alone is not a key
+    key = (
+        pool_data["poolAddress"],
+        pool_data.get("blockNumber"),
+        pool_data["poolType"],
+        pool_data["token0Address"],
+        pool_data["token1Address"],
+        pool_data["token0Decimal"],
+        pool_data["token1Decimal"],
+        str(pool_data["token0balance"]),
+        str(pool_data["token1balance"]),
+        str(pool_data.get("fee", 3000)),
+    )
+
+    if pool_data["poolType"] == "uniswapV3":
+        tickMapRange = pool_data.get("tickMapRange")
+        return key + (
+            str(pool_data["sqrtPriceX96"]),
+            str(pool_data["liquidity"]),
+            str(pool_data["currentTick"]),
+            str(pool_data["tickSpacing"]),
+            tuple(str(tick) for tick in tickMapRange) if tickMapRange else None,
+            tuple((str(row[0]), str(row[1])) for row in pool_data["tickMap"]),
+        )
+
+    return key + (
+        str(pool_data.get("reserve0")),
+        str(pool_data.get("reserve1")),
+    )
+
+
+def getPoolSnapshot(poolparam) -> PoolSnapshot:
+    # Accepts a PoolSnapshot, a parsed pool param dict or its JSON string
+    if isinstance(poolparam, PoolSnapshot):
+        return poolparam
+    if isinstance(poolparam, str):
+        poolparam = json.loads(poolparam)
+
+    key = poolSnapshotKey(poolparam)
+    snapshot = _poolSnapshotCache.get(key)
+    if snapshot is None:
+        snapshot = PoolSnapshot(poolparam)
+        _poolSnapshotCache[key] = snapshot
+        if len(_poolSnapshotCache) > POOL_SNAPSHOT_CACHE_SIZE:
+            _poolSnapshotCache.popitem(last=False)
+    else:
+        _poolSnapshotCache.move_to_end(key)
+
+    return snapshot
+
+
+def getPoolSnapshots(poolparams) -> list:
+    # List version of getPoolSnapshot, accepts a JSON string of a list of pool params
+    if isinstance(poolparams, str):
+        poolparams = json.loads(poolparams)
+
+    return [getPoolSnapshot(poolparam) for poolparam in poolparams]
@@ -3,128 +3,174 @@ import json
 from TickMath import getSqrtRatioAtTick,getTickAtSqrtRatio
 from SqrtPriceMath import getNextSqrtPriceFromAmount0RoundingUp,getNextSqrtPriceFromAmount1RoundingDown,getNextSqrtPriceFromInput,getNextSqrtPriceFromOutput,getAmount0Delta,getAmount1Delta
 from UnsafeMath import divRoundingUp
-# from TickBitmap import position,nextInitializedTickWithinOneWord
+from TickBitmap import position,nextInitializedTickWithinOneWord
 from FullMath import mulDiv,mulDivRoundingUp
 from SwapMath import computeSwapStep
-from optimizeV3 import swapAmount,getSpotPrice,optimizePool,calc_profit,swapAmountMultiHop,calcProfitMultiHop,optimizeMultiHop
-from network import getGraph,findPossibleCyclesEdges
+from optimizeV3 import swapAmount,simulateSwap,maxBorrowAmount,getSpotPrice,optimizePool,optimizePoolsBatch,calc_profit,swapAmountMultiHop,calcProfitMultiHop,quotePath,optimizeMultiHop,optimizeMultiHopBatch,quoteV2PathBatch
+from optimizerCache import getOptimizerCache,clearOptimizerCache
+from network import getGraph,getResidentGraph,updateGraphEdges,findPossibleCyclesEdges,findPoolCyclesEdges,findNegativeCyclesEdges,findTopCyclesEdges,findSizedCyclesEdges
 
-args = []
-for line in sys.stdin:
-    if 'Exit' == line.rstrip():
-        break
-
-    line = line.strip()
-    args.append(line)
-    
-if len(args)>1:
-    
-    # Optimize pools
-    if args[1]=='swapAmount':
-        result = swapAmount(int(args[2]),args[3],args[4],args[5])
-        print(result)
-
-    if args[1]=='getSpotPrice':
-        result = getSpotPrice(args[2],args[3],args[4])
-        print(result)
-
-        
-    if args[1]=='optimizePool':
-        result = optimizePool(args[2],args[3],args[4])
-        print(result)
-
-    if args[1]=='calc_profit':
-        result = calc_profit(int(args[2]),args[3],args[4],args[5])
-        print(result)
-
-    if args[1]=='swapAmountMultiHop':
-        result = swapAmountMultiHop(int(args[2]),args[3],args[4],args[5])
-        print(result)
-    
-    if args[1]=='calcProfitMultiHop':
-        result = calcProfitMultiHop(int(args[2]),args[3],args[4])
-        print(result)
-
-    if args[1]=='optimizeMultiHop':
-        result = optimizeMultiHop(args[2],args[3])
-        print(result)
-
-    if args[1]=='findPossibleCyclesEdges':
-        result = findPossibleCyclesEdges(getGraph(),args[2])
-        print(result)
-
-    if args[1]=='test':
-        print(args[2])
-
-
-if len(sys.argv)>1:
+# Dispatch targets, each takes the list of arguments following the method name
+routes = {
     # TickMath
-    if sys.argv[1]=='getSqrtRatioAtTick':
-        result = getSqrtRatioAtTick(int(sys.argv[2]))
-        print(result)
-
-    if sys.argv[1]=='getTickAtSqrtRatio':
-        result = getTickAtSqrtRatio(int(sys.argv[2]))
-        print(result)
+    'getSqrtRatioAtTick': lambda args: getSqrtRatioAtTick(int(args[0])),
+    'getTickAtSqrtRatio': lambda args: getTickAtSqrtRatio(int(args[0])),
 
     # SqrtPriceMath
-    if sys.argv[1]=='getNextSqrtPriceFromAmount0RoundingUp':
-        result = getNextSqrtPriceFromAmount0RoundingUp(int(sys.argv[2]),int(sys.argv[3]),int(sys.argv[4]),sys.argv[5])
-        print(result)
+    'getNextSqrtPriceFromAmount0RoundingUp': lambda args: getNextSqrtPriceFromAmount0RoundingUp(int(args[0]),int(args[1]),int(args[2]),args[3]),
+    'getNextSqrtPriceFromAmount1RoundingDown': lambda args: getNextSqrtPriceFromAmount1RoundingDown(int(args[0]),int(args[1]),int(args[2]),args[3]),
+    'getNextSqrtPriceFromInput': lambda args: getNextSqrtPriceFromInput(int(args[0]),int(args[1]),int(args[2]),args[3]),
+    'getNextSqrtPriceFromOutput': lambda args: getNextSqrtPriceFromOutput(int(args[0]),int(args[1]),int(args[2]),args[3]),
+    'getAmount0Delta': lambda args: getAmount0Delta(int(args[0]),int(args[1]),int(args[2]),args[3]),
+    'getAmount1Delta': lambda args: getAmount1Delta(int(args[0]),int(args[1]),int(args[2]),args[3]),
 
-    if sys.argv[1]=='getNextSqrtPriceFromAmount1RoundingDown':
-        result = getNextSqrtPriceFromAmount1RoundingDown(int(sys.argv[2]),int(sys.argv[3]),int(sys.argv[4]),sys.argv[5])
-        print(result)
+    # TickBitmap, the tick mapping is a JSON object of word position -> bitmap
+    'position': lambda args: position(int(args[0])),
+    'nextInitializedTickWithinOneWord': lambda args: nextInitializedTickWithinOneWord({int(k):int(v) for k,v in json.loads(args[0]).items()},int(args[1]),int(args[2]),args[3]=='true'),
 
-    if sys.argv[1]=='getNextSqrtPriceFromInput':
-        result = getNextSqrtPriceFromInput(int(sys.argv[2]),int(sys.argv[3]),int(sys.argv[4]),sys.argv[5])
-        print(result)
+    # UnsafeMath
+    'divRoundingUp': lambda args: divRoundingUp(int(args[0]),int(args[1])),
 
-    if sys.argv[1]=='getNextSqrtPriceFromOutput':
-        result = getNextSqrtPriceFromOutput(int(sys.argv[2]),int(sys.argv[3]),int(sys.argv[4]),sys.argv[5])
-        print(result)
+    # FullMath
+    'mulDiv': lambda args: mulDiv(int(args[0]),int(args[1]),int(args[2])),
+    'mulDivRoundingUp': lambda args: mulDivRoundingUp(int(args[0]),int(args[1]),int(args[2])),
 
-    if sys.argv[1]=='getAmount0Delta':
-        result = getAmount0Delta(int(sys.argv[2]),int(sys.argv[3]),int(sys.argv[4]),sys.argv[5])
-        print(result)
+    # SwapMath
+    'computeSwapStep': lambda args: computeSwapStep(int(args[0]),int(args[1]),int(args[2]),int(args[3]),int(args[4])),
 
-    if sys.argv[1]=='getAmount1Delta':
-        result = getAmount1Delta(int(sys.argv[2]),int(sys.argv[3]),int(sys.argv[4]),sys.argv[5])
-        print(result)
+    # Optimize pools
+    # Optional trailing argument selects the tick traversal ('index' or 'bitmap')
+    'swapAmount': lambda args: swapAmount(int(args[0]),args[1],args[2],args[3],*args[4:5]),
+    # Filled and unfilled amounts, final price, tick and ticks crossed as JSON
+    'simulateSwap': lambda args: json.dumps({key:(str(value) if value!=None else None) for key,value in simulateSwap(int(args[0]),args[1],args[2],args[3],*args[4:5])._asdict().items()}),
+    'maxBorrowAmount': lambda args: maxBorrowAmount(args[0],args[1]),
+    'getSpotPrice': lambda args: getSpotPrice(args[0],args[1],args[2]),
+    # Optional optimizer mode ('scalar' or 'piecewise') and warm start hint (previous optimal borrow)
+    'optimizePool': lambda args: optimizePool(args[0],args[1],args[2],args[3] if len(args)>3 and args[3] else 'scalar',int(args[4]) if len(args)>4 and args[4] else None),
+    'optimizePoolsBatch': lambda args: optimizePoolsBatch(args[0],*args[1:2]),
+    # amounts as a JSON list, path as a JSON list of V2 pool params, tokenIn of the first hop
+    'quoteV2PathBatch': lambda args: json.dumps([str(amount) for amount in quoteV2PathBatch(json.loads(args[0]),args[1],args[2])]),
+    'calc_profit': lambda args: calc_profit(int(args[0]),args[1],args[2],args[3]),
+    'swapAmountMultiHop': lambda args: swapAmountMultiHop(int(args[0]),args[1],args[2],args[3]),
+    'calcProfitMultiHop': lambda args: calcProfitMultiHop(int(args[0]),args[1],args[2]),
+    # Exact input quote from the first pool or exact output quote into the last pool, per hop amounts and final prices as JSON
+    'quotePath': lambda args: json.dumps({key:(value if isinstance(value,bool) else [str(item) for item in value] if isinstance(value,list) else str(value)) for key,value in quotePath(int(args[0]),args[1],args[2],args[3])._asdict().items()}),
+    'optimizeMultiHop': lambda args: optimizeMultiHop(args[0],args[1],args[2] if len(args)>2 and args[2] else 'scalar',int(args[3]) if len(args)>3 and args[3] else None),
+    # Optional worker count, per job deadline in seconds and optimizer mode
+    'optimizeMultiHopBatch': lambda args: optimizeMultiHopBatch(
+        args[0],
+        int(args[1]) if len(args)>1 and args[1] else None,
+        float(args[2]) if len(args)>2 and args[2] else None,
+        *args[3:4],
+    ),
+    # Hits, misses and size of the optimizer result cache, reset with clearOptimizerCache
+    'optimizerCacheStats': lambda args: json.dumps(getOptimizerCache().stats()),
+    'clearOptimizerCache': lambda args: json.dumps(clearOptimizerCache()),
+
+    # Network
+    # Cycle queries read the resident graph, kept current with updateGraphEdges
+    'findPossibleCyclesEdges': lambda args: findPossibleCyclesEdges(getResidentGraph().graph,args[0],getResidentGraph().getCycleIndex()),
+    'findPoolCyclesEdges': lambda args: findPoolCyclesEdges(getResidentGraph(),args[0]),
+    # tokenPath ('null' for every base token), optional maxPathLength and k
+    'findTopCyclesEdges': lambda args: findTopCyclesEdges(getResidentGraph(),*args[0:3]),
+    # tokenPath ('null' for every base token) and optional k, ranked by profit estimated on the pool reserves
+    'findSizedCyclesEdges': lambda args: findSizedCyclesEdges(getResidentGraph(),*args[0:2]),
+    # Optional maximum number of cycles returned, 10 by default
+    'findNegativeCyclesEdges': lambda args: findNegativeCyclesEdges(getResidentGraph(),*args[0:1]),
+    'updateGraphEdges': lambda args: updateGraphEdges(args[0],int(args[1]) if len(args)>1 and args[1] else None),
+    'updateGraphReserves': lambda args: json.dumps(getResidentGraph().updatePoolReserves(args[0])),
+    'reloadGraph': lambda args: json.dumps(getResidentGraph(reload=True).state()),
+    'addGraphEdges': lambda args: json.dumps(getResidentGraph().addEdges(args[0])),
+    'removeGraphPools': lambda args: json.dumps(getResidentGraph().removePools(args[0])),
+    'graphState': lambda args: json.dumps(getResidentGraph().state()),
+
+    'test': lambda args: args[0],
+}
+
+
+def dispatch(method:str,args:list):
+    return routes[method](args)
+
+
+def handleRequest(line:str)->str:
+    # Request: {"id":..,"method":..,"args":[..]}, response data is what the one-shot mode would print
+    try:
+        request = json.loads(line)
+        if not isinstance(request,dict):
+            raise ValueError('request is not a JSON object')
+    except ValueError as err:
+        # No id to answer to, the serve loop goes on with the next line
+        return json.dumps({'id':None,'status':1,'error':f'{type(err).__name__}: {err}'})
+
+    requestId = request.get('id')
+    try:
+        # Pool params may be sent as JSON values instead of strings
+        args = [arg if isinstance(arg,str) else json.dumps(arg) for arg in request.get('args',[])]
+        result = dispatch(request['method'],args)
+        response = {'id':requestId,'status':0,'data':str(result)}
+    except Exception as err:
+        response = {'id':requestId,'status':1,'data':f'{type(err).__name__}: {err}'}
+
+    return json.dumps(response)
+
+
+def serve(input=sys.stdin,output=sys.stdout):
+    # Long running mode, one JSON request per line until Exit or EOF
+    for line in input:
+        line = line.strip()
+        if line=='Exit':
+            break
+        if not line:
+            continue
+
+        output.write(handleRequest(line)+'\n')
+        output.flush()
+
+
+def serveSocket(socketPath:str):
+    import os
+    import socketserver
+
+    class RouterHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for rawline in self.rfile:
+                line = rawline.decode().strip()
+                if line=='Exit':
+                    break
+                if not line:
+                    continue
+
+                self.wfile.write((handleRequest(line)+'\n').encode())
+                self.wfile.flush()
+
+    if os.path.exists(socketPath):
+        os.remove(socketPath)
+
+    with socketserver.UnixStreamServer(socketPath,RouterHandler) as server:
+        server.serve_forever()
+
+
+if len(sys.argv)>1 and sys.argv[1]=='serve':
+    # python router.py serve [socketPath]
+    if len(sys.argv)>2:
+        serveSocket(sys.argv[2])
+    else:
+        serve()
+    sys.exit(0)
 
-    # UnsafeMath
-    if sys.argv[1]=='divRoundingUp':
-        result = divRoundingUp(int(sys.argv[2]),int(sys.argv[3]))
-        print(result)
+args = []
+for line in sys.stdin:
+    if 'Exit' == line.rstrip():
+        break
 
-    # FullMath
-    if sys.argv[1]=='mulDiv':
-        result = mulDiv(int(sys.argv[2]),int(sys.argv[3]),int(sys.argv[4]))
-        print(result)
+    line = line.strip()
+    args.append(line)
 
-    if sys.argv[1]=='mulDivRoundingUp':
-        result = mulDivRoundingUp(int(sys.argv[2]),int(sys.argv[3]),int(sys.argv[4]))
-        print(result)
+if len(args)>1 and args[1] in routes:
+    result = dispatch(args[1],args[2:])
+    print(result)
 
-    # SwapMath
-    if sys.argv[1]=='computeSwapStep':
-        result = computeSwapStep(int(sys.argv[2]),int(sys.argv[3]),int(sys.argv[4]),int(sys.argv[5]),int(sys.argv[6]))
-        print(result)
 
-    # Optimize pools
-    if sys.argv[1]=='swapAmount':
-        result = swapAmount(int(sys.argv[2]),sys.argv[3],sys.argv[4],sys.argv[5])
-        print(result)
-
-    if sys.argv[1]=='getSpotPrice':
-        result = getSpotPrice(sys.argv[2],sys.argv[3],sys.argv[4])
-        print(result)
-
-        
-    if sys.argv[1]=='optimizePool':
-        result = optimizePool(sys.argv[2],sys.argv[3],sys.argv[4])
-        print(result)
-
-    if sys.argv[1]=='calc_profit':
-        result = calc_profit(int(sys.argv[2]),sys.argv[3],sys.argv[4],sys.argv[5])
-        print(result)
+if len(sys.argv)>1 and sys.argv[1] in routes:
+    result = dispatch(sys.argv[1],sys.argv[2:])
+    print(result)
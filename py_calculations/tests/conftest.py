@@ -0,0 +1,7 @@
+import os
+import sys
+
+# py_calculations modules import each other by flat module name, the package __init__ files import py_calculations
+testsDir = os.path.dirname(os.path.abspath(__file__))
+calculationsDir = os.path.dirname(testsDir)
+sys.path[0:0] = [testsDir, calculationsDir, os.path.dirname(calculationsDir)]
@@ -0,0 +1,82 @@
+# Synthetic token graphs shaped like the graph object helpers.ts builds from the pool table
+import math
+import random
+
+import networkx as nx
+
+from poolParams import v2Pool
+
+
+def tokenAddress(i):
+    return "0x%040x" % (0xA11CE000 + i)
+
+
+def randomV2Pools(seed, tokens, count, noise=0.01, firstAddress=0):
+    # V2 pools on random token pairs, reserves priced off one price per token with noise per pool
+    rnd = random.Random(seed)
+    prices = {token: 10 ** rnd.uniform(-2, 2) for token in tokens}
+    pools = []
+    for i in range(count):
+        token0, token1 = sorted(rnd.sample(tokens, 2), key=lambda token: int(token, 16))
+        depth = 10 ** rnd.uniform(20, 24)
+        pool = v2Pool(
+            i,
+            token0=token0,
+            token1=token1,
+            reserve0=int(depth / prices[token0]),
+            reserve1=int(depth / prices[token1] * math.exp(rnd.gauss(0, noise))),
+            decimals=(18, 18),
+            address="0x%040x" % (0xB0000 + firstAddress + i),
+        )
+        pool["liquidityUSD"] = round(depth / 10**18, 6)
+        pools.append(pool)
+    return pools
+
+
+def poolEdges(pool):
+    # Both directions of a pool, ratiof is the spot rate with the fee taken out
+    fee = pool["fee"] / 10**6
+    reserve0, reserve1 = int(pool["reserve0"]), int(pool["reserve1"])
+    edges = []
+    for source, target, reserveIn, reserveOut in (
+        (pool["token0Address"], pool["token1Address"], reserve0, reserve1),
+        (pool["token1Address"], pool["token0Address"], reserve1, reserve0),
+    ):
+        ratiof = reserveOut / reserveIn * (1 - fee)
+        edges.append(
+            {
+                "source": source,
+                "target": target,
+                "key": pool["poolAddress"],
+                "ratiof": ratiof,
+                "weight": -math.log(ratiof),
+                "liquidityUSD": pool["liquidityUSD"],
+                "timestamp": 0,
+            }
+        )
+    return edges
+
+
+def poolGraph(pools, multigraph=False):
+    # Simple graphs keep the pool with more liquidity on each direction, like the graph builder
+    G = nx.MultiDiGraph() if multigraph else nx.DiGraph()
+    for pool in pools:
+        for edge in poolEdges(pool):
+            source, target = edge["source"], edge["target"]
+            attrs = {k: v for k, v in edge.items() if k not in ("source", "target")}
+            if multigraph:
+                G.add_edge(source, target, key=attrs.pop("key"), **attrs)
+            elif not G.has_edge(source, target) or edge["liquidityUSD"] > G[source][target]["liquidityUSD"]:
+                G.add_edge(source, target, **attrs)
+    return G
+
+
+def graphData(pools, multigraph=False):
+    return nx.node_link_data(poolGraph(pools, multigraph))
+
+
+def edgeMap(G):
+    # (source, target[, key]) -> attributes, for comparing graphs whatever their node and edge order
+    if G.is_multigraph():
+        return {(source, target, key): dict(attr) for source, target, key, attr in G.edges(keys=True, data=True)}
+    return {(source, target): dict(attr) for source, target, attr in G.edges(data=True)}
@@ -0,0 +1,79 @@
+# Synthetic pool params shaped like the ones helpers.ts sends to the router
+import random
+
+from TickMath import getSqrtRatioAtTick
+
+WETH = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
+USDC = "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"
+DAI = "0x6B175474E89094C44Da98b954EedeAC495271d0F"
+
+
+def v3Pool(
+    seed,
+    token0=USDC,
+    token1=WETH,
+    tick=201000,
+    tickSpacing=60,
+    fee=500,
+    positions=40,
+    priceShift=0,
+    decimals=(6, 18),
+    balances=(10**14, 5 * 10**22),
+    address=None,
+    liquidityRange=(10**15, 10**18),
+):
+    # Random positions around tick, liquidity and tick map consistent with them
+    rnd = random.Random(seed)
+    tick = tick + priceShift
+    liquidityNet = {}
+    liquidity = 0
+    for _ in range(positions):
+        lower = (tick // tickSpacing + rnd.randint(-300, 10)) * tickSpacing
+        upper = (tick // tickSpacing + rnd.randint(1, 300)) * tickSpacing
+        if upper <= lower:
+            upper = lower + tickSpacing
+        amount = rnd.randint(*liquidityRange)
+        liquidityNet[lower] = liquidityNet.get(lower, 0) + amount
+        liquidityNet[upper] = liquidityNet.get(upper, 0) - amount
+        if lower <= tick < upper:
+            liquidity += amount
+
+    ticks = sorted([t for t in liquidityNet if liquidityNet[t] != 0], reverse=True)
+    sqrtPriceX96 = getSqrtRatioAtTick(tick)
+    sqrtPriceX96 += (getSqrtRatioAtTick(tick + 1) - sqrtPriceX96) // 3
+    tickMapRange = [min(ticks) - tickSpacing * 5, max(ticks) + tickSpacing * 5] if ticks else [tick - 6000, tick + 6000]
+    return {
+        "poolAddress": address or "0x%040x" % seed,
+        "poolType": "uniswapV3",
+        "token0Address": token0,
+        "token1Address": token1,
+        "token0Decimal": decimals[0],
+        "token1Decimal": decimals[1],
+        "token0balance": str(balances[0]),
+        "token1balance": str(balances[1]),
+        "sqrtPriceX96": str(sqrtPriceX96),
+        "liquidity": str(liquidity),
+        "fee": fee,
+        "currentTick": tick,
+        "tickSpacing": tickSpacing,
+        "tickMap": [[t, str(liquidityNet[t]), str(abs(liquidityNet[t]))] for t in ticks],
+        "tickMapRange": tickMapRange,
+        "status": 0,
+    }
+
+
+def v2Pool(seed, token0=USDC, token1=WETH, reserve0=5 * 10**13, reserve1=2 * 10**22, decimals=(6, 18), address=None):
+    return {
+        "poolAddress": address or "0x%040x" % (10**6 + seed),
+        "poolType": "uniswapV2",
+        "token0Address": token0,
+        "token1Address": token1,
+        "token0Decimal": decimals[0],
+        "token1Decimal": decimals[1],
+        "token0balance": str(reserve0),
+        "token1balance": str(reserve1),
+        "fee": 3000,
+        "reserve0": str(reserve0),
+        "reserve1": str(reserve1),
+        "status": 0,
+    }
@@ -0,0 +1,71 @@
+import random
+
+from SwapMath import computeSwapStep, computeSwapStepFast
+from TickMath import MAX_TICK, MIN_TICK, getSqrtRatioAtTick
+
+FEES = (0, 1, 100, 500, 3000, 10000, 999999)
+
+
+def assertSameStep(sqrtRatioCurrentX96, sqrtRatioTargetX96, liquidity, amountRemaining, feePips):
+    args = (sqrtRatioCurrentX96, sqrtRatioTargetX96, liquidity, amountRemaining, feePips)
+    assert computeSwapStepFast(*args) == computeSwapStep(*args), args
+
+
+def randomStep(rnd):
+    tick = rnd.randint(MIN_TICK + 1, MAX_TICK - 1)
+    # Steps stay within a word of ticks in the swap loops, a few span the whole range
+    if rnd.random() < 0.9:
+        targetTick = min(max(tick + rnd.randint(-2560, 2560), MIN_TICK), MAX_TICK)
+    else:
+        targetTick = rnd.randint(MIN_TICK, MAX_TICK)
+    liquidity = rnd.choice((0, 1, rnd.getrandbits(rnd.randint(1, 128))))
+    return getSqrtRatioAtTick(tick) + rnd.randint(-1, 1), getSqrtRatioAtTick(targetTick), liquidity
+
+
+def amountsAround(sqrtRatioCurrentX96, sqrtRatioTargetX96, liquidity, feePips):
+    # Amounts just short of, at and past the ones that reach the target
+    _, amountIn, amountOut, feeAmount = computeSwapStep(
+        sqrtRatioCurrentX96, sqrtRatioTargetX96, liquidity, 2**200, feePips
+    )
+    amounts = [0, 1, -1]
+    for delta in (-1, 0, 1):
+        amounts.append(max(amountIn + feeAmount + delta, 0))
+        amounts.append(min(-amountOut + delta, 0))
+    return amounts
+
+
+def test_fast_step_matches_the_reference_at_the_target_boundary():
+    rnd = random.Random(17)
+    for _ in range(3000):
+        sqrtRatioCurrentX96, sqrtRatioTargetX96, liquidity = randomStep(rnd)
+        for feePips in FEES:
+            for amountRemaining in amountsAround(
+                sqrtRatioCurrentX96, sqrtRatioTargetX96, liquidity, feePips
+            ):
+                assertSameStep(
+                    sqrtRatioCurrentX96, sqrtRatioTargetX96, liquidity, amountRemaining, feePips
+                )
+
+
+def test_fast_step_matches_the_reference_at_random_amounts():
+    rnd = random.Random(18)
+    for _ in range(20000):
+        sqrtRatioCurrentX96, sqrtRatioTargetX96, liquidity = randomStep(rnd)
+        amountRemaining = rnd.getrandbits(rnd.randint(1, 128))
+        if rnd.random() < 0.5:
+            amountRemaining = -amountRemaining
+        feePips = rnd.choice(FEES + (rnd.randint(0, 999999),))
+        assertSameStep(
+            sqrtRatioCurrentX96, sqrtRatioTargetX96, liquidity, amountRemaining, feePips
+        )
+
+
+def test_fast_step_matches_the_reference_at_the_current_price():
+    rnd = random.Random(19)
+    for _ in range(500):
+        sqrtRatioCurrentX96, _, liquidity = randomStep(rnd)
+        for feePips in FEES:
+            for amountRemaining in (0, 1, -1, 10**18, -(10**18)):
+                assertSameStep(
+                    sqrtRatioCurrentX96, sqrtRatioCurrentX96, liquidity, amountRemaining, feePips
+                )
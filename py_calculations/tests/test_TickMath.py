@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+from TickMath import (
+    MAX_SQRT_RATIO,
+    MAX_TICK,
+    MIN_SQRT_RATIO,
+    MIN_TICK,
+    getSqrtRatioAtTick,
+    getSqrtRatioAtTickCached,
+    getTickAtSqrtRatio,
+    getTickAtSqrtRatioFast,
+)
+
+BOUNDARY_TICKS = 2000
+
+
+def boundaryTicks():
+    ticks = list(range(MIN_TICK, MIN_TICK + BOUNDARY_TICKS))
+    ticks += list(range(-BOUNDARY_TICKS, BOUNDARY_TICKS))
+    ticks += list(range(MAX_TICK - BOUNDARY_TICKS, MAX_TICK + 1))
+    return ticks
+
+
+def randomTicks(count, seed):
+    rnd = random.Random(seed)
+    return [rnd.randint(MIN_TICK, MAX_TICK) for _ in range(count)]
+
+
+def test_cached_sqrt_ratio_matches_the_reference():
+    getSqrtRatioAtTickCached.cache_clear()
+    for tick in boundaryTicks() + randomTicks(5000, 16):
+        assert getSqrtRatioAtTickCached(tick) == getSqrtRatioAtTick(tick)
+        # Served from the cache the second time
+        assert getSqrtRatioAtTickCached(tick) == getSqrtRatioAtTick(tick)
+
+    assert getSqrtRatioAtTickCached(MIN_TICK) == MIN_SQRT_RATIO
+    assert getSqrtRatioAtTickCached(MAX_TICK) == MAX_SQRT_RATIO
+
+
+def test_fast_tick_matches_the_reference_around_every_tick_ratio():
+    for tick in boundaryTicks() + randomTicks(2000, 17):
+        sqrtRatio = getSqrtRatioAtTick(tick)
+        for sqrtPriceX96 in (sqrtRatio - 1, sqrtRatio, sqrtRatio + 1):
+            if sqrtPriceX96 < MIN_SQRT_RATIO or sqrtPriceX96 >= MAX_SQRT_RATIO:
+                continue
+            assert getTickAtSqrtRatioFast(sqrtPriceX96) == getTickAtSqrtRatio(sqrtPriceX96)
+
+
+def test_fast_tick_matches_the_reference_at_random_prices():
+    rnd = random.Random(18)
+    # Uniform in the bit length, every price magnitude gets covered
+    for _ in range(20000):
+        bits = rnd.randint(MIN_SQRT_RATIO.bit_length(), MAX_SQRT_RATIO.bit_length())
+        sqrtPriceX96 = rnd.getrandbits(bits) | (1 << (bits - 1))
+        sqrtPriceX96 = min(max(sqrtPriceX96, MIN_SQRT_RATIO), MAX_SQRT_RATIO - 1)
+        assert getTickAtSqrtRatioFast(sqrtPriceX96) == getTickAtSqrtRatio(sqrtPriceX96)
+
+
+def test_fast_tick_rejects_prices_out_of_range():
+    assert getTickAtSqrtRatioFast(MIN_SQRT_RATIO) == MIN_TICK
+    assert getTickAtSqrtRatioFast(MAX_SQRT_RATIO - 1) == MAX_TICK - 1
+    for sqrtPriceX96 in (MIN_SQRT_RATIO - 1, MAX_SQRT_RATIO):
+        with pytest.raises(AssertionError):
+            getTickAtSqrtRatioFast(sqrtPriceX96)
@@ -0,0 +1,117 @@
+import networkx as nx
+import pytest
+
+from csrGraph import CSRGraph
+from graphParams import edgeMap, poolGraph, randomV2Pools, tokenAddress
+from poolParams import DAI, USDC, WETH
+
+TOKENS = [WETH, USDC, DAI] + [tokenAddress(i) for i in range(6)]
+
+
+def assertSameAdjacency(core, G):
+    assert core.nodes == list(G.nodes())
+    assert core.numberOfEdges() == len({(source, target) for source, target in G.edges()})
+    indptr, indices = core.adjacency()
+    reverse = core.reverseAdjacency()
+    for node in G.nodes():
+        nodeId = core.nodeIds[node]
+        # Out edges in networkx neighbor order, one per token pair
+        edgeIds = list(range(indptr[nodeId], indptr[nodeId + 1]))
+        assert [core.nodes[indices[edgeId]] for edgeId in edgeIds] == list(G.successors(node))
+        for edgeId in edgeIds:
+            assert core.edgeNodes(edgeId) == (node, core.nodes[indices[edgeId]])
+            assert core.edgeId(*core.edgeNodes(edgeId)) == edgeId
+        assert sorted(core.nodes[source] for source, edgeId in reverse[nodeId]) == sorted(G.predecessors(node))
+
+    for source in G.nodes():
+        for target in G.nodes():
+            if not G.has_edge(source, target):
+                assert core.edgeId(source, target) is None
+    assert core.edgeId(WETH, "0xunknown") is None
+
+
+def test_simple_graph_core_matches_networkx():
+    G = poolGraph(randomV2Pools(12, TOKENS, 30))
+    core = CSRGraph.fromGraph(G)
+    assertSameAdjacency(core, G)
+
+    for source, target, attr in G.edges(data=True):
+        edgeId = core.edgeId(source, target)
+        assert core.weight[edgeId] == attr["weight"]
+        assert core.ratiof[edgeId] == attr["ratiof"]
+        assert core.liquidityUSD[edgeId] == attr["liquidityUSD"]
+        assert core.timestamp[edgeId] == attr["timestamp"]
+        assert core.poolKeys[core.poolKey[edgeId]] == attr["key"]
+
+
+def test_multigraph_core_matches_networkx():
+    G = poolGraph(randomV2Pools(13, TOKENS, 40), multigraph=True)
+    core = CSRGraph.fromGraph(G)
+    assertSameAdjacency(core, G)
+
+    for edgeId in range(core.numberOfEdges()):
+        source, target = core.edgeNodes(edgeId)
+        parallel = {key: attr["weight"] for key, attr in G[source][target].items()}
+        assert dict(core.parallelEdges(edgeId)) == parallel
+
+
+@pytest.mark.parametrize("multigraph", [False, True])
+def test_node_link_round_trip(multigraph):
+    G = poolGraph(randomV2Pools(14, TOKENS, 30), multigraph)
+    core = CSRGraph.fromGraph(G)
+    fromData = CSRGraph.fromNodeLink(nx.node_link_data(G, edges="links"))
+    assert fromData.nodes == core.nodes
+    for name in ("indptr", "indices", "source", "weight", "ratiof", "poolKey"):
+        assert getattr(fromData, name).tolist() == getattr(core, name).tolist()
+
+    # Same layout as the graph object the graph builder stores
+    assert edgeMap(nx.node_link_graph(core.toNodeLink(), edges="links")) == edgeMap(G)
+
+
+def test_simple_graph_rejects_parallel_edges():
+    links = [
+        {"source": WETH, "target": USDC, "key": "0x1", "weight": 0.1},
+        {"source": WETH, "target": USDC, "key": "0x2", "weight": 0.2},
+    ]
+    with pytest.raises(ValueError):
+        CSRGraph([WETH, USDC], [{}, {}], links)
+
+
+def pairWeight(G, source, target):
+    if G.is_multigraph():
+        return min(attr["weight"] for attr in G[source][target].values())
+    return G[source][target]["weight"]
+
+
+def bruteForceCycles(G, core, startEdges, maxPathLength):
+    # Every simple cycle starting with a start edge, up to maxPathLength - 1 edges, from the networkx paths
+    cycles = {}
+    for startEdge in startEdges:
+        source, target = core.edgeNodes(startEdge)
+        for path in nx.all_simple_paths(G, target, source, cutoff=maxPathLength - 2):
+            tokens = [source] + path
+            pairs = list(zip(tokens, tokens[1:]))
+            cycles[tuple(core.edgeId(a, b) for a, b in pairs)] = sum(pairWeight(G, a, b) for a, b in pairs)
+    return cycles
+
+
+# Both directions of a pair are on the same pool in a simple graph, so 2 edge cycles only pay off on multigraphs
+@pytest.mark.parametrize("maxPathLength, multigraph", [(3, True), (4, False), (4, True), (5, False), (5, True)])
+def test_top_cycles_match_a_brute_force_search(maxPathLength, multigraph):
+    G = poolGraph(randomV2Pools(15, TOKENS, 40, noise=0.1), multigraph)
+    core = CSRGraph.fromGraph(G)
+    for startEdges in (list(range(core.numberOfEdges())), core.outEdges([WETH, USDC])):
+        cycles = bruteForceCycles(G, core, startEdges, maxPathLength)
+        negative = sorted((weight, cycle) for cycle, weight in cycles.items() if weight < 0)
+        assert len(negative) > 1
+
+        found = {tuple(cycle): weight for cycle, weight in core.iterCycles(startEdges, maxPathLength)}
+        assert found == pytest.approx({cycle: weight for weight, cycle in negative}, rel=0, abs=1e-12)
+        limit = negative[len(negative) // 2][0]
+        below = {tuple(cycle) for cycle, weight in core.iterCycles(startEdges, maxPathLength, lambda: limit)}
+        assert below == {cycle for weight, cycle in negative if weight < limit}
+
+        for k in (1, 5, 10, len(negative) + 5):
+            top = core.topCycles(startEdges, maxPathLength, k)
+            assert [tuple(cycle) for cycle, weight in top] == [cycle for weight, cycle in negative[:k]]
+            assert [weight for cycle, weight in top] == pytest.approx([weight for weight, cycle in negative[:k]], rel=0, abs=1e-12)
@@ -0,0 +1,120 @@
+import json
+import random
+
+import networkx as nx
+import numpy as np
+import pytest
+
+from graphParams import graphData, poolEdges, randomV2Pools, tokenAddress
+from network import (
+    BASE_TOKEN_LIST,
+    ResidentGraph,
+    findPossibleCycles,
+    findPossibleCyclesEdges,
+    findSizedCyclesEdges,
+    graphFindBulkCycleWeights,
+)
+from optimizeV3 import calcProfitMultiHop, optimalBorrowV2
+from poolParams import DAI, USDC, WETH
+from poolSnapshot import getPoolSnapshots
+
+TOKENS = [WETH, USDC, DAI] + [tokenAddress(i) for i in range(5)]
+
+
+def assertSameCycles(engine, maxPathLength):
+    index = engine.getCycleIndex(maxPathLength)
+    assert index.topologyVersion == engine.topologyVersion
+    for source, target in engine.graph.edges():
+        assert index.findCycles((source, target)) == findPossibleCycles(engine.graph, [source, target], maxPathLength)
+    return index
+
+
+@pytest.mark.parametrize("maxPathLength", [3, 4, 5])
+def test_cycle_index_matches_the_graph_walk(maxPathLength):
+    engine = ResidentGraph(graphData(randomV2Pools(9, TOKENS, 20)))
+    index = assertSameCycles(engine, maxPathLength)
+    assert len(index.cycles) > 0
+
+
+def test_cycle_index_follows_topology_changes():
+    pools = randomV2Pools(11, TOKENS, 24)
+    engine = ResidentGraph(graphData(pools[:18]))
+    first = assertSameCycles(engine, 4)
+
+    # Weight updates keep the index
+    source, target, attr = next(iter(engine.graph.edges(data=True)))
+    engine.applyEdgeDeltas([dict(attr, source=source, target=target, weight=attr["weight"] - 0.01)])
+    assert engine.getCycleIndex() is first
+
+    engine.addEdges([edge for pool in pools[18:] for edge in poolEdges(pool)])
+    added = assertSameCycles(engine, 4)
+    assert added is not first
+
+    engine.removePools([pools[0]["poolAddress"], pools[5]["poolAddress"]])
+    removed = assertSameCycles(engine, 4)
+    assert removed is not added
+    assert len(removed.cycles) < len(added.cycles)
+
+
+def test_indexed_ranking_matches_the_graph_ranking():
+    # Spread prices so some cycles are negative
+    engine = ResidentGraph(graphData(randomV2Pools(12, TOKENS, 20, noise=0.05)))
+    index = engine.getCycleIndex()
+    ranked = 0
+    for source, target in engine.graph.edges():
+        indexed = json.loads(findPossibleCyclesEdges(engine.graph, [source, target], index))
+        assert indexed == json.loads(findPossibleCyclesEdges(engine.graph, [source, target]))
+        ranked += len(indexed)
+    assert ranked > 0
+
+
+def assertScoresAreEdgeSums(engine, index):
+    cycleIds = np.arange(len(index.cycles), dtype=np.int64)
+    scores = index.scoreCycles(cycleIds)
+    for cycleId, score in zip(cycleIds, scores):
+        assert score == pytest.approx(nx.path_weight(engine.graph, index.cycles[cycleId], "weight"), rel=0, abs=1e-12)
+
+    # Negative cycles from a base token, lowest first, like graphFindBulkCycleWeights
+    topIds, topWeights = index.topCycles(cycleIds, 10)
+    expected = graphFindBulkCycleWeights(engine.graph, [cycle for cycle in index.cycles if cycle[0] in BASE_TOKEN_LIST])[:10]
+    assert [index.cycles[cycleId] for cycleId in topIds] == [row["cycle"] for row in expected]
+    assert topWeights.tolist() == pytest.approx([row["totalweight"] for row in expected], rel=0, abs=1e-12)
+    return len(expected)
+
+
+@pytest.mark.parametrize("maxPathLength", [4, 5])
+def test_cycle_scores_are_the_sums_of_their_edge_weights(maxPathLength):
+    engine = ResidentGraph(graphData(randomV2Pools(13, TOKENS, 20, noise=0.05)))
+    index = engine.getCycleIndex(maxPathLength)
+    assert assertScoresAreEdgeSums(engine, index) > 0
+
+    # Scores follow the weight deltas without a rebuild
+    rnd = random.Random(13)
+    deltas = []
+    for source, target, attr in engine.graph.edges(data=True):
+        if rnd.random() < 0.3:
+            deltas.append(dict(attr, source=source, target=target, weight=attr["weight"] + rnd.uniform(-0.05, 0.05)))
+    engine.applyEdgeDeltas(deltas)
+    assert engine.getCycleIndex(maxPathLength) is index
+    assertScoresAreEdgeSums(engine, index)
+
+
+def test_sized_ranking_follows_the_profit_at_the_optimal_borrow():
+    # WETH is the only base token, so every ranked cycle starts there and its profit is already in WETH
+    pools = randomV2Pools(17, [WETH] + [tokenAddress(i) for i in range(6)], 30, noise=0.1)
+    engine = ResidentGraph(graphData(pools))
+    engine.updatePoolReserves(pools)
+    rows = json.loads(findSizedCyclesEdges(engine, k=100))
+    assert len(rows) > 5
+
+    snapshots = dict(zip([pool["poolAddress"] for pool in pools], getPoolSnapshots(pools)))
+    profits = []
+    for row in rows:
+        assert row["tokens"][0] == WETH
+        path = [snapshots[poolAddress] for poolAddress in row["pools"]]
+        # Borrow the second token of the cycle from the first pool, repaid in WETH
+        borrowAddress = row["tokens"][1]
+        profit = calcProfitMultiHop(optimalBorrowV2(borrowAddress, path), borrowAddress, path)
+        assert row["profit"] == pytest.approx(profit, rel=1e-6)
+        profits.append(profit)
+    assert profits == sorted(profits, reverse=True)
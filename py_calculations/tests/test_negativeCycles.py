@@ -0,0 +1,101 @@
+import networkx as nx
+
+from graphParams import edgeMap, graphData, poolEdges, poolGraph, randomV2Pools, tokenAddress
+from network import BASE_TOKEN_LIST, NegativeCycleDetector, ResidentGraph
+from poolParams import DAI, USDC, WETH
+
+TOKENS = [WETH, USDC, DAI] + [tokenAddress(i) for i in range(6)]
+
+
+def assertRealNegativeCycles(core, found):
+    # Closed walks of distinct tokens along core edges, with the reported negative total weight
+    seen = set()
+    for cycle, totalWeight in found.items():
+        for edgeId, nextEdge in zip(cycle, cycle[1:] + cycle[:1]):
+            assert core.indices[edgeId] == core.source[nextEdge]
+        tokens = [int(core.source[edgeId]) for edgeId in cycle]
+        assert len(set(tokens)) == len(tokens)
+        assert totalWeight == sum(core.weight[edgeId] for edgeId in cycle)
+        assert totalWeight < 0
+        assert frozenset(cycle) not in seen
+        seen.add(frozenset(cycle))
+
+
+def nxFindsNegativeCycle(G):
+    # Negative cycle reachable from any base token of the graph
+    for source in BASE_TOKEN_LIST:
+        if source not in G:
+            continue
+        try:
+            cycle = nx.find_negative_cycle(G, source)
+        except nx.NetworkXError:
+            continue
+        assert nx.path_weight(G, cycle, "weight") < 0
+        return True
+    return False
+
+
+def assertAgreesWithNetworkx(engine, found):
+    assertRealNegativeCycles(engine.getCore(), found)
+    assert (len(found) > 0) == nxFindsNegativeCycle(engine.graph)
+
+
+def edgeDeltas(engine, pools):
+    # New rates of the edges the pools currently serve
+    return [
+        {k: edge[k] for k in ("key", "source", "target", "ratiof", "weight")}
+        for pool in pools
+        for edge in poolEdges(pool)
+        if engine.graph[edge["source"]][edge["target"]]["key"] == edge["key"]
+    ]
+
+
+def test_cold_run_finds_real_negative_cycles():
+    for seed in range(5):
+        engine = ResidentGraph(graphData(randomV2Pools(seed, TOKENS, 24, noise=0.05)))
+        found = engine.getNegativeCycleDetector().run()
+        assertAgreesWithNetworkx(engine, found)
+        assert len(found) > 1
+
+
+def test_no_cycles_without_price_gaps():
+    # Pools on the same prices, every cycle pays its fees
+    engine = ResidentGraph(graphData(randomV2Pools(3, TOKENS, 24, noise=0)))
+    found = engine.getNegativeCycleDetector().run()
+    assert found == {}
+    assert not nxFindsNegativeCycle(engine.graph)
+
+
+def test_warm_runs_follow_the_edge_updates():
+    gapped = randomV2Pools(4, TOKENS, 24, noise=0.05)
+    # Same pools and liquidity, reserves on the common prices
+    flat = randomV2Pools(4, TOKENS, 24, noise=0)
+    engine = ResidentGraph(graphData(gapped))
+    detector = engine.getNegativeCycleDetector()
+    assertAgreesWithNetworkx(engine, detector.run())
+
+    engine.applyEdgeDeltas(edgeDeltas(engine, flat))
+    assert engine.getNegativeCycleDetector() is detector
+    assert detector.run() == {}
+    assert not nxFindsNegativeCycle(engine.graph)
+
+    # Gaps back on a few pools only, the warm run relaxes from the changed edges
+    for count in (3, 8, 24):
+        engine.applyEdgeDeltas(edgeDeltas(engine, gapped[:count]))
+        warm = detector.run()
+        assertAgreesWithNetworkx(engine, warm)
+        cold = NegativeCycleDetector(engine.getCore(), BASE_TOKEN_LIST).run()
+        assert (len(warm) > 0) == (len(cold) > 0)
+        assert edgeMap(engine.graph) == edgeMap(poolGraph(gapped[:count] + flat[count:]))
+
+
+def test_warm_run_finds_new_gaps_from_the_changed_edges():
+    gapped = randomV2Pools(5, TOKENS, 24, noise=0.05)
+    flat = randomV2Pools(5, TOKENS, 24, noise=0)
+    for count in (2, 4, 6):
+        # Converged labels on gap free pools, only the changed edges can lead to a cycle
+        engine = ResidentGraph(graphData(flat))
+        detector = engine.getNegativeCycleDetector()
+        assert detector.run() == {}
+        engine.applyEdgeDeltas(edgeDeltas(engine, gapped[:count]))
+        assertAgreesWithNetworkx(engine, detector.run())
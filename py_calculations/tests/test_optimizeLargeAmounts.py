@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from optimizeV3 import optimizeMultiHopResult, optimizePoolResult
+from optimizerCache import clearOptimizerCache
+from poolParams import DAI, WETH, v2Pool, v3Pool
+
+
+def daiPools():
+    # 18 decimals on both sides, the borrow limits are far past 2**63
+    v3 = v3Pool(
+        1,
+        token0=DAI,
+        token1=WETH,
+        tick=76000,
+        decimals=(18, 18),
+        balances=(10**26, 5 * 10**22),
+        liquidityRange=(10**21, 10**24),
+    )
+    v2 = v2Pool(3, token0=DAI, token1=WETH, reserve0=10**26, reserve1=5 * 10**22, decimals=(18, 18))
+    return json.dumps(v3), json.dumps(v2)
+
+
+@pytest.mark.parametrize("mode", ["scalar", "piecewise"])
+def test_pool_optimizer_takes_18_decimal_borrow_limits(mode):
+    clearOptimizerCache()
+    v3, v2 = daiPools()
+    result = optimizePoolResult(DAI, v3, v2, mode)
+    borrow = int(result["optimal_borrow"])
+    assert borrow > 2**63
+    assert int(result["profit"]) == int(result["swapOutAmount"]) - int(result["repayAmount"]) > 0
+
+
+@pytest.mark.parametrize("mode", ["scalar", "piecewise"])
+def test_multi_hop_optimizer_takes_18_decimal_borrow_limits(mode):
+    clearOptimizerCache()
+    v3, v2 = daiPools()
+    result = optimizeMultiHopResult(DAI, json.dumps([json.loads(v2), json.loads(v3)]), mode)
+    borrow = int(result["optimal_borrow"])
+    assert borrow > 2**63
+    assert int(result["profit"]) == int(result["swapOutAmount"]) - int(result["repayAmount"]) > 0
+
+
+def test_warm_start_takes_18_decimal_hints():
+    clearOptimizerCache()
+    v3, v2 = daiPools()
+    cold = optimizePoolResult(DAI, v3, v2, "scalar")
+    clearOptimizerCache()
+    warm = optimizePoolResult(DAI, v3, v2, "scalar", int(cold["optimal_borrow"]) * 11 // 10)
+    assert int(warm["optimal_borrow"]) > 2**63
+    assert int(warm["profit"]) == int(warm["swapOutAmount"]) - int(warm["repayAmount"])
+    # Same optimum to the warm start tolerance
+    assert int(warm["profit"]) >= int(cold["profit"]) * (1 - 1e-9)
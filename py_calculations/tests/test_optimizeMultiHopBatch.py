@@ -0,0 +1,100 @@
+import json
+import os
+import signal
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import optimizeV3
+from optimizeV3 import _optimizeMultiHopJob, _removeWhenDone, getMultiHopExecutor, optimizeMultiHopBatch
+from optimizerCache import clearOptimizerCache
+from poolParams import USDC, v3Pool
+
+
+def test_batch_file_outlives_the_jobs_that_can_still_read_it():
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as batchFile:
+        batchPath = batchFile.name
+
+    started = threading.Event()
+    release = threading.Event()
+
+    def job():
+        started.set()
+        release.wait(5)
+        return os.path.exists(batchPath)
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    futures = [executor.submit(job) for _ in range(3)]
+    started.wait(5)
+
+    _removeWhenDone(batchPath, futures)
+    # The queued jobs are cancelled, the running one keeps the file
+    assert [future.cancelled() for future in futures] == [False, True, True]
+    assert os.path.exists(batchPath)
+
+    release.set()
+    assert futures[0].result() is True
+    executor.shutdown()
+    assert not os.path.exists(batchPath)
+
+
+def test_batch_file_is_removed_when_every_job_is_done():
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as batchFile:
+        batchPath = batchFile.name
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        futures = [executor.submit(os.path.exists, batchPath)]
+        futures[0].result()
+
+    _removeWhenDone(batchPath, futures)
+    assert not os.path.exists(batchPath)
+
+
+def test_batch_recovers_from_a_dead_worker():
+    clearOptimizerCache()
+    cheap = v3Pool(11, positions=60)
+    expensive = v3Pool(12, positions=60, priceShift=40)
+    batchparam = {
+        "pools": [cheap, expensive],
+        "jobs": [[USDC, [cheap["poolAddress"], expensive["poolAddress"]]]],
+    }
+    expected = json.loads(optimizeMultiHopBatch(batchparam, 1))
+
+    # A worker killed from outside breaks the pool, the next batch runs on a new one
+    executor = getMultiHopExecutor(1)
+    for process in list(executor._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+    clearOptimizerCache()
+    assert json.loads(optimizeMultiHopBatch(batchparam, 1)) == expected
+    assert getMultiHopExecutor(1) is not executor
+
+
+_crashMarker = None
+
+
+def _crashOnceJob(*args):
+    # First job to run takes its worker down, as an out of memory kill would
+    if not os.path.exists(_crashMarker):
+        open(_crashMarker, "w").close()
+        os._exit(1)
+    return _optimizeMultiHopJob(*args)
+
+
+def test_batch_resubmits_the_jobs_of_a_worker_that_died(monkeypatch, tmp_path):
+    global _crashMarker
+    _crashMarker = str(tmp_path / "crashed")
+    clearOptimizerCache()
+    cheap = v3Pool(11, positions=60)
+    expensive = v3Pool(12, positions=60, priceShift=40)
+    batchparam = {
+        "pools": [cheap, expensive],
+        "jobs": [[USDC, [cheap["poolAddress"], expensive["poolAddress"]]]] * 3,
+    }
+    expected = json.loads(optimizeMultiHopBatch(batchparam, 1))
+
+    # Workers fork from here with the crashing job, a worker count change starts a new pool
+    monkeypatch.setattr(optimizeV3, "_optimizeMultiHopJob", _crashOnceJob)
+    getMultiHopExecutor(2)
+    clearOptimizerCache()
+    assert json.loads(optimizeMultiHopBatch(batchparam, 2)) == expected
+    assert os.path.exists(_crashMarker)
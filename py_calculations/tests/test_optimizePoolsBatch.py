@@ -0,0 +1,58 @@
+import json
+
+from optimizeV3 import optimizePool, optimizePoolsBatch
+from optimizerCache import clearOptimizerCache
+from poolParams import DAI, USDC, WETH, v2Pool, v3Pool
+
+
+def samplePools():
+    return [
+        v3Pool(11, positions=60),
+        v3Pool(12, positions=60, priceShift=40),
+        v2Pool(1, reserve0=5 * 10**13, reserve1=int(2 * 10**22 * 1.004)),
+        v2Pool(2, reserve0=4 * 10**13, reserve1=int(1.6 * 10**22 * 0.995)),
+        # No USDC in it, any USDC borrow through it fails
+        v2Pool(3, token0=DAI, token1=WETH, reserve0=4 * 10**25, reserve1=10**22, decimals=(18, 18)),
+    ]
+
+
+def singleResult(borrowAddress, pool1, pool2):
+    # optimizePool on its own, the batch error row when it raises
+    try:
+        return json.loads(optimizePool(borrowAddress, json.dumps(pool1), json.dumps(pool2)))
+    except Exception as err:
+        return {
+            "pool1": pool1["poolAddress"],
+            "pool2": pool2["poolAddress"],
+            "tokenBorrow": borrowAddress,
+            "error": f"{type(err).__name__}: {err}",
+        }
+
+
+def test_batch_matches_optimize_pool_on_each_pair():
+    pools = samplePools()
+    pairs = [(0, 1), (1, 0), (0, 2), (2, 3), (3, 1), (2, 4), (1, 3)]
+    jobs = [[USDC, pools[i]["poolAddress"], pools[j]["poolAddress"]] for i, j in pairs]
+
+    # Both cold, neither side reads the results or warm start hints of the other
+    clearOptimizerCache()
+    expected = [singleResult(USDC, pools[i], pools[j]) for i, j in pairs]
+    clearOptimizerCache()
+    batch = json.loads(optimizePoolsBatch(json.dumps({"pools": pools, "jobs": jobs})))
+
+    results = [row for row in expected if "error" not in row]
+    errors = [row for row in expected if "error" in row]
+    assert len(errors) == 1 and len(results) == len(pairs) - 1
+    assert any(int(row["profit"]) > 0 for row in results)
+    # Ranked by profit, ties keep the job order, errors after the results in job order
+    assert batch == sorted(results, key=lambda row: int(row["profit"]), reverse=True) + errors
+
+
+def test_batch_reports_a_job_on_an_unknown_pool():
+    pools = samplePools()[:2]
+    unknown = "0x%040x" % 0xDEAD
+    jobs = [[USDC, pools[0]["poolAddress"], unknown], [USDC, pools[0]["poolAddress"], pools[1]["poolAddress"]]]
+    clearOptimizerCache()
+    batch = json.loads(optimizePoolsBatch({"pools": pools, "jobs": jobs}))
+    assert batch[0] == singleResult(USDC, pools[0], pools[1])
+    assert batch[1] == {"pool1": pools[0]["poolAddress"], "pool2": unknown, "tokenBorrow": USDC, "error": f"KeyError: '{unknown}'"}
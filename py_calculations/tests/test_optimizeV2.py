@@ -0,0 +1,159 @@
+import random
+from fractions import Fraction
+from math import isqrt
+
+import pytest
+
+from optimizeV3 import (
+    calcProfitMultiHop,
+    foldV2Path,
+    getAmountInV2,
+    getAmountOutV2,
+    getAmountsInV2,
+    getAmountsOutV2,
+    optimalBorrowGrid,
+    optimalBorrowV2,
+    quoteV2PathBatch,
+    swapAmountMultiHop,
+)
+from poolParams import DAI, USDC, WETH, v2Pool
+from poolSnapshot import getPoolSnapshots
+
+
+def roundedRoot(pools):
+    # Closed form borrow before the integer neighbourhood check
+    P, Q, R, _ = foldV2Path(pools, WETH)
+    repayOptimal = (isqrt(P * Q) - Q) // R
+    P0, Q0, R0, _ = foldV2Path(pools[:1], WETH)
+    return P0 * repayOptimal // (Q0 + R0 * repayOptimal)
+
+
+def test_closed_form_borrow_beats_the_rounded_root_and_its_neighbours():
+    rnd = random.Random(4)
+    for seed in range(200):
+        reserve0 = rnd.randint(10**9, 10**14)
+        reserve1 = reserve0 * 4 * 10**8
+        pools = getPoolSnapshots(
+            [
+                v2Pool(seed, reserve0=reserve0, reserve1=int(reserve1 * rnd.uniform(0.98, 0.995))),
+                v2Pool(1000 + seed, reserve0=rnd.randint(10**9, 10**14) if seed % 2 else reserve0, reserve1=reserve1),
+            ]
+        )
+        root = roundedRoot(pools)
+        if root <= 2:
+            continue
+        profit = calcProfitMultiHop(optimalBorrowV2(USDC, pools), USDC, pools)
+        for borrow in (root - 1, root, root + 1):
+            assert profit >= calcProfitMultiHop(borrow, USDC, pools)
+
+
+def test_closed_form_borrow_respects_the_upper_bound():
+    pools = getPoolSnapshots(
+        [
+            v2Pool(1, reserve0=10**13, reserve1=4 * 10**21),
+            v2Pool(2, reserve0=10**13, reserve1=int(4.2 * 10**21)),
+        ]
+    )
+    assert optimalBorrowV2(USDC, pools) > 1000
+    assert optimalBorrowV2(USDC, pools, 1000) == 1000
+
+
+def libraryAmountOut(amountIn, reserveIn, reserveOut):
+    # UniswapV2Library.getAmountOut, 0 where it reverts
+    if amountIn <= 0 or reserveIn <= 0 or reserveOut <= 0:
+        return 0
+    return amountIn * 997 * reserveOut // (reserveIn * 1000 + amountIn * 997)
+
+
+def libraryAmountIn(amountOut, reserveIn, reserveOut):
+    # UniswapV2Library.getAmountIn, 0 where it reverts or the pool can not pay out
+    if amountOut <= 0 or reserveIn <= 0 or amountOut >= reserveOut:
+        return 0
+    return reserveIn * amountOut * 1000 // ((reserveOut - amountOut) * 997) + 1
+
+
+EDGE_RESERVES = [0, 1, 2, 3, 1000, 10**6, 10**18, 10**30, 2**112 - 1]
+
+
+def amountsFor(reserve, rnd):
+    # Amounts around the edges of a reserve and a few random ones below and above it
+    amounts = {0, 1, 2, reserve - 1, reserve, reserve + 1, 2**112 - 1}
+    amounts |= {rnd.randint(1, max(reserve, 1) * 2) for _ in range(5)}
+    return sorted(amount for amount in amounts if amount >= 0)
+
+
+def test_v2_swap_math_matches_the_library_formulas():
+    rnd = random.Random(19)
+    reserves = EDGE_RESERVES + [rnd.randint(1, 10**rnd.randint(1, 34)) for _ in range(20)]
+    for reserveIn in reserves:
+        for reserveOut in reserves:
+            amountsIn = amountsFor(reserveIn, rnd)
+            expectedOut = [libraryAmountOut(amountIn, reserveIn, reserveOut) for amountIn in amountsIn]
+            assert [getAmountOutV2(amountIn, reserveIn, reserveOut) for amountIn in amountsIn] == expectedOut
+            assert getAmountsOutV2(amountsIn, reserveIn, reserveOut) == expectedOut
+
+            amountsOut = amountsFor(reserveOut, rnd)
+            expectedIn = [libraryAmountIn(amountOut, reserveIn, reserveOut) for amountOut in amountsOut]
+            assert [getAmountInV2(amountOut, reserveIn, reserveOut) for amountOut in amountsOut] == expectedIn
+            assert getAmountsInV2(amountsOut, reserveIn, reserveOut) == expectedIn
+
+
+def test_v2_amount_in_rounds_up_by_one():
+    # Exact division still pays the +1
+    assert libraryAmountIn(1000, 997, 2000) == 1001
+    assert getAmountInV2(1000, 997, 2000) == 1001
+    # One unit out of an even pool rounds up from just over 1
+    assert getAmountInV2(1, 10**18, 10**18) == 2
+
+    rnd = random.Random(20)
+    for _ in range(500):
+        reserveIn, reserveOut = rnd.randint(1, 10**24), rnd.randint(2, 10**24)
+        amountOut = rnd.randint(1, reserveOut - 1)
+        amountIn = getAmountInV2(amountOut, reserveIn, reserveOut)
+        # Always enough for the output, and at most one unit more than the exact quotient
+        assert getAmountOutV2(amountIn, reserveIn, reserveOut) >= amountOut
+        exact = Fraction(reserveIn * amountOut * 1000, (reserveOut - amountOut) * 997)
+        assert exact < amountIn <= exact + 1
+
+
+def ringPools(rnd, seed, gap=0.02):
+    # WETH -> DAI -> USDC -> WETH on three V2 pools, one price off by up to gap
+    pools = []
+    for i, (token0, token1) in enumerate(((WETH, DAI), (DAI, USDC), (USDC, WETH))):
+        reserve = rnd.randint(10**20, 10**24)
+        shift = 1 + rnd.uniform(-gap, gap) if i == seed % 3 else 1
+        pools.append(v2Pool(seed * 3 + i, token0, token1, reserve, int(reserve * shift), (18, 18)))
+    return getPoolSnapshots(pools)
+
+
+def test_batch_quotes_match_the_hop_by_hop_swaps():
+    rnd = random.Random(21)
+    for seed in range(20):
+        path = ringPools(rnd, seed)
+        reserve = path[0].reserve0
+        amounts = [0, 1, 2, 999, reserve - 1, reserve, reserve * 10, 2**112] + [rnd.randint(1, reserve) for _ in range(30)]
+        expected = [swapAmountMultiHop(amount, WETH, "true", path)[0] for amount in amounts]
+        assert quoteV2PathBatch(amounts, path, WETH) == expected
+
+        # Screening floats stay within the rounding of the integer hops
+        screened = quoteV2PathBatch(amounts, path, WETH, exact=False)
+        assert screened.tolist() == pytest.approx(expected, rel=1e-12, abs=len(path) + 1)
+
+
+def test_grid_borrow_lands_on_the_closed_form_borrow():
+    rnd = random.Random(22)
+    checked = 0
+    for seed in range(60):
+        pools = ringPools(rnd, seed)
+        borrow = optimalBorrowV2(DAI, pools)
+        if borrow <= 2:
+            continue
+        upperBound = pools[0].reserve1 - 1
+        gridBorrow, gridProfit = optimalBorrowGrid(DAI, pools, upperBound)
+        # Integer profits are flat to a unit over a window about sqrt(reserve) wide around the peak,
+        # so both land on that plateau rather than on the same borrow
+        assert gridProfit == calcProfitMultiHop(gridBorrow, DAI, pools)
+        assert abs(gridProfit - calcProfitMultiHop(borrow, DAI, pools)) <= 2
+        assert gridBorrow == pytest.approx(borrow, rel=1e-6)
+        checked += 1
+    assert checked > 10
@@ -0,0 +1,42 @@
+import json
+
+from optimizeV3 import optimizeMultiHopBatch
+from optimizerCache import clearOptimizerCache, getOptimizerCache, poolStateFingerprint
+from poolParams import USDC, v2Pool, v3Pool
+from poolSnapshot import getPoolSnapshot
+
+
+def test_interior_liquidity_change_is_a_new_fingerprint():
+    poolparam = v3Pool(5)
+    changed = json.loads(json.dumps(poolparam))
+    # Same tick count and end ticks, one interior liquidityNet moved
+    tick, liquidityNet, liquidityGross = changed["tickMap"][len(changed["tickMap"]) // 2]
+    changed["tickMap"][len(changed["tickMap"]) // 2] = [tick, str(int(liquidityNet) + 1), liquidityGross]
+
+    fingerprint = poolStateFingerprint(getPoolSnapshot(poolparam))
+    assert fingerprint == poolStateFingerprint(getPoolSnapshot(json.loads(json.dumps(poolparam))))
+    assert fingerprint != poolStateFingerprint(getPoolSnapshot(changed))
+
+
+def test_batch_results_are_cached_in_the_calling_process():
+    clearOptimizerCache()
+    cheap = v3Pool(11, positions=60)
+    expensive = v3Pool(12, positions=60, priceShift=40)
+    v2 = v2Pool(1, reserve1=int(2 * 10**22 * 1.004))
+    pools = [cheap, expensive, v2]
+    jobs = [
+        [USDC, [cheap["poolAddress"], expensive["poolAddress"]]],
+        [USDC, [cheap["poolAddress"], v2["poolAddress"]]],
+        [USDC, [cheap["poolAddress"], "0xmissing"]],
+    ]
+    batchparam = {"pools": pools, "jobs": jobs}
+
+    first = json.loads(optimizeMultiHopBatch(batchparam, 1))
+    stats = getOptimizerCache().stats()
+    assert stats["size"] == 2
+    assert stats["optima"] == sum(int(result.get("profit") or 0) > 0 for result in first)
+
+    second = json.loads(optimizeMultiHopBatch(batchparam, 1))
+    assert second == first
+    assert getOptimizerCache().stats()["hits"] == stats["hits"] + 2
+    assert second[-1]["error"].startswith("KeyError")
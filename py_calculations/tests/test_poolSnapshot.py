@@ -0,0 +1,26 @@
+import json
+
+from optimizeV3 import getSpotPrice, swapAmount
+from poolParams import USDC, v3Pool
+from poolSnapshot import getPoolSnapshot
+
+
+def test_partial_params_do_not_shadow_full_params():
+    # unpackPoolParam params carry no tickMapRange, a later full param of the same pool and block needs its own snapshot
+    full = v3Pool(301)
+    full["blockNumber"] = 100
+    partial = dict(full)
+    del partial["tickMapRange"]
+
+    getSpotPrice(json.dumps(partial), USDC)
+    assert getPoolSnapshot(json.dumps(full)).tickMapRange == tuple(full["tickMapRange"])
+    assert swapAmount(10**9, USDC, "true", json.dumps(full))[0] > 0
+
+
+def test_interior_tick_change_is_a_new_snapshot():
+    pool = v3Pool(302)
+    changed = json.loads(json.dumps(pool))
+    changed["tickMap"][len(changed["tickMap"]) // 2][1] = "1"
+
+    assert getPoolSnapshot(pool) is getPoolSnapshot(json.loads(json.dumps(pool)))
+    assert getPoolSnapshot(changed) is not getPoolSnapshot(pool)
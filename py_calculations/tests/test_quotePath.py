@@ -0,0 +1,130 @@
+import random
+
+from optimizeV3 import quotePath, simulateSwap, swapAmount, swapAmountMultiHop
+from poolParams import DAI, USDC, WETH, v2Pool, v3Pool
+from poolSnapshot import getPoolSnapshots
+
+
+def otherToken(pool, tokenAddress):
+    return pool.token1Address if pool.token0Address == tokenAddress else pool.token0Address
+
+
+def chainExactIn(amount, tokenAddress, pools):
+    # Token amounts along the path, swapAmount hop by hop from the first pool
+    amounts = [amount]
+    for pool in pools:
+        amounts.append(swapAmount(amounts[-1], tokenAddress, "true", pool)[0])
+        tokenAddress = otherToken(pool, tokenAddress)
+    return amounts
+
+
+def chainExactOut(amount, tokenAddress, pools):
+    # Token amounts along the path, swapAmount hop by hop back from the last pool
+    amounts = [amount]
+    for pool in reversed(pools):
+        amounts.insert(0, swapAmount(amounts[0], tokenAddress, "false", pool)[0])
+        tokenAddress = otherToken(pool, tokenAddress)
+    return amounts
+
+
+def samplePaths():
+    # USDC -> WETH -> DAI -> USDC on a V3 and two V2 pools, and the same pools the other way around.
+    # The V3 pool is shallow enough to run out on what the V2 pools can pay
+    pools = getPoolSnapshots(
+        [
+            v3Pool(1, positions=40, liquidityRange=(10**14, 10**16)),
+            v2Pool(2, token0=DAI, token1=WETH, reserve0=4 * 10**25, reserve1=10**22, decimals=(18, 18)),
+            v2Pool(3, token0=DAI, token1=USDC, reserve0=4 * 10**25, reserve1=4 * 10**13, decimals=(18, 6)),
+        ]
+    )
+    return [pools, pools[::-1]]
+
+
+def test_exact_input_quotes_match_the_chained_swaps():
+    rnd = random.Random(23)
+    for pools in samplePaths():
+        for exponent in range(2, 12):
+            amount = rnd.randint(10**exponent, 10 ** (exponent + 1))
+            quote = quotePath(amount, USDC, True, pools)
+            assert quote.filled
+            assert quote.amounts == chainExactIn(amount, USDC, pools)
+            assert (quote.amountIn, quote.amountOut) == (amount, quote.amounts[-1])
+            assert quotePath(amount, USDC, "true", pools) == quote
+
+            token = USDC
+            crossed = 0
+            for pool, amountIn, sqrtPriceX96 in zip(pools, quote.amounts, quote.sqrtPrices):
+                result = simulateSwap(amountIn, token, True, pool)
+                assert result.sqrtPriceX96 == sqrtPriceX96
+                crossed += result.ticksCrossed
+                token = otherToken(pool, token)
+            assert quote.ticksCrossed == crossed
+
+
+def test_exact_output_quotes_match_the_chained_swaps():
+    rnd = random.Random(24)
+    for pools in samplePaths():
+        for exponent in range(2, 12):
+            amount = rnd.randint(10**exponent, 10 ** (exponent + 1))
+            quote = quotePath(amount, USDC, False, pools)
+            assert quote.filled
+            assert quote.amounts == chainExactOut(amount, USDC, pools)
+            assert (quote.amountIn, quote.amountOut) == (quote.amounts[0], amount)
+            assert quotePath(amount, USDC, "false", pools) == quote
+            # The quoted input swapped forward pays at least the output asked for
+            assert chainExactIn(quote.amountIn, USDC, pools)[-1] >= amount
+
+
+def firstUnfilled(isInput, pools):
+    return next(10**k for k in range(2, 40) if not quotePath(10**k, USDC, isInput, pools).filled)
+
+
+def test_unfilled_exact_input_hop_stops_the_quote():
+    for pools in samplePaths():
+        amount = firstUnfilled(True, pools)
+        quote = quotePath(amount, USDC, True, pools)
+        token = USDC
+        for stop, pool in enumerate(pools):
+            if not simulateSwap(quote.amounts[stop], token, True, pool).filled:
+                break
+            token = otherToken(pool, token)
+        assert pools[stop].poolType == "uniswapV3"
+        # Partial output of the hop that ran out of liquidity, nothing swapped after it
+        assert quote.amounts[: stop + 2] == chainExactIn(amount, USDC, pools)[: stop + 2]
+        assert quote.amounts[stop + 2 :] == [0] * (len(pools) - stop - 1)
+        assert not quote.filled
+
+
+def test_unfilled_exact_output_hop_stops_the_quote():
+    for pools in samplePaths():
+        amount = firstUnfilled(False, pools)
+        quote = quotePath(amount, USDC, False, pools)
+        token = USDC
+        for stop in range(len(pools) - 1, -1, -1):
+            result = simulateSwap(quote.amounts[stop + 1], token, False, pools[stop])
+            if not result.filled:
+                break
+            token = otherToken(pools[stop], token)
+        chained = chainExactOut(amount, USDC, pools)
+        # swapAmount gives 0 for the hop that can not pay out, the quote keeps what that hop did fill
+        assert quote.amounts[stop + 1 :] == chained[stop + 1 :]
+        assert chained[stop] == 0
+        assert quote.amounts[stop] == result.amountCalculated
+        assert quote.amounts[:stop] == [0] * stop
+        assert not quote.filled
+
+
+def test_bool_and_string_directions_agree():
+    # The router sends 'true' / 'false', the optimizer passes bools
+    for pools in samplePaths():
+        amountIn = firstUnfilled(True, pools)
+        amountOut = firstUnfilled(False, pools)
+        for amount in (10**6, amountIn, amountOut):
+            for pool in pools:
+                for tokenAddress in (pool.token0Address, pool.token1Address):
+                    assert swapAmount(amount, tokenAddress, True, pool) == swapAmount(amount, tokenAddress, "true", pool)
+                    assert swapAmount(amount, tokenAddress, False, pool) == swapAmount(amount, tokenAddress, "false", pool)
+                    assert simulateSwap(amount, tokenAddress, True, pool) == simulateSwap(amount, tokenAddress, "true", pool)
+                    assert simulateSwap(amount, tokenAddress, False, pool) == simulateSwap(amount, tokenAddress, "false", pool)
+            assert swapAmountMultiHop(amount, USDC, True, pools) == swapAmountMultiHop(amount, USDC, "true", pools)
+            assert swapAmountMultiHop(amount, USDC, False, pools) == swapAmountMultiHop(amount, USDC, "false", pools)
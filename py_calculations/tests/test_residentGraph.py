@@ -0,0 +1,178 @@
+import json
+
+from csrGraph import CSRGraph
+from graphParams import edgeMap, graphData, poolEdges, poolGraph, randomV2Pools, tokenAddress
+from network import ResidentGraph, findTopCyclesEdges, graphFindCycleEdges
+from poolParams import DAI, USDC, WETH
+
+TOKENS = [WETH, USDC, DAI] + [tokenAddress(i) for i in range(5)]
+
+
+def pairCounts(pools):
+    counts = {}
+    for pool in pools:
+        pair = frozenset((pool["token0Address"], pool["token1Address"]))
+        counts[pair] = counts.get(pair, 0) + 1
+    return counts
+
+
+def assertSameAsRebuilt(engine, expected):
+    # Graph, pool index and array core of the engine against the graph built from the final pools
+    assert edgeMap(engine.graph) == edgeMap(expected)
+    linked = {node for node in engine.graph if engine.graph.degree(node) > 0}
+    assert linked == set(expected.nodes())
+
+    poolEdgeSets = {}
+    for source, target, key in expected.edges(data="key"):
+        poolEdgeSets.setdefault(key, set()).add((source, target))
+    assert engine.poolEdges == poolEdgeSets
+
+    core = engine.getCore()
+    assert core.numberOfEdges() == expected.number_of_edges()
+    for source, target, attr in expected.edges(data=True):
+        edgeId = core.edgeId(source, target)
+        assert core.weight[edgeId] == attr["weight"]
+        assert core.ratiof[edgeId] == attr["ratiof"]
+        assert core.poolKeys[core.poolKey[edgeId]] == attr["key"]
+    assert engine.getCycleIndex().weights[: core.numberOfEdges()].tolist() == core.weight.tolist()
+
+
+def test_deltas_match_a_graph_rebuilt_from_scratch():
+    pools = randomV2Pools(8, TOKENS, 24)
+    initial, added = pools[:18], pools[18:]
+    engine = ResidentGraph(graphData(initial))
+    # Built before the deltas, so the in place updates are exercised
+    engine.getCore()
+    engine.getCycleIndex()
+
+    counts = pairCounts(pools)
+    removed = [pool for pool in initial if counts[frozenset((pool["token0Address"], pool["token1Address"]))] == 1][:3]
+    removedAddresses = {pool["poolAddress"] for pool in removed}
+    assert len(removed) == 3
+
+    engine.addEdges([edge for pool in added for edge in poolEdges(pool)])
+    engine.removePools(sorted(removedAddresses))
+
+    # New reserves on every remaining pool, deltas only for the edges each pool serves
+    final = []
+    deltas = []
+    for i, pool in enumerate(initial + added):
+        if pool["poolAddress"] in removedAddresses:
+            continue
+        if i % 2 == 0:
+            pool = dict(pool, reserve1=str(int(pool["reserve1"]) * 101 // 100))
+            for edge in poolEdges(pool):
+                if engine.graph[edge["source"]][edge["target"]]["key"] == pool["poolAddress"]:
+                    deltas.append({k: edge[k] for k in ("key", "source", "target", "ratiof", "weight")})
+        final.append(pool)
+    assert len(deltas) > 0
+    engine.getCore()
+    engine.getCycleIndex()
+    updated = engine.applyEdgeDeltas(deltas, 123)
+
+    assert len(updated) == len(deltas)
+    assert engine.state()["version"] == 4
+    assert engine.state()["topologyVersion"] == 3
+    assert engine.state()["blockNumber"] == 123
+    assertSameAsRebuilt(engine, poolGraph(final))
+
+
+def test_delta_takes_an_edge_over_only_with_a_lower_weight():
+    pools = randomV2Pools(9, TOKENS, 18)
+    engine = ResidentGraph(graphData(pools))
+    engine.getCore()
+    engine.getCycleIndex()
+    expected = poolGraph(pools)
+
+    source, target, attr = next(iter(expected.edges(data=True)))
+    otherKey = "0x%040x" % 0xC0FFEE
+    worse = {"key": otherKey, "source": source, "target": target, "ratiof": attr["ratiof"] * 0.9, "weight": attr["weight"] + 0.1}
+    assert engine.applyEdgeDeltas([worse]) == []
+
+    better = dict(worse, ratiof=attr["ratiof"] * 1.1, weight=attr["weight"] - 0.1)
+    assert engine.applyEdgeDeltas([better]) == [(source, target)]
+    expected[source][target].update(key=otherKey, ratiof=better["ratiof"], weight=better["weight"])
+    assertSameAsRebuilt(engine, expected)
+
+
+def test_delta_without_tokens_goes_to_the_single_edge_of_its_pool():
+    pools = randomV2Pools(10, TOKENS, 18)
+    engine = ResidentGraph(graphData(pools))
+    # One direction of a deeper pool, its pool serves that edge only
+    edge = dict(poolEdges(pools[0])[0], key="0x%040x" % 0xC0FFEE, liquidityUSD=10**9)
+    engine.addEdges([edge])
+    engine.getCore()
+    key = edge["key"]
+    [(source, target)] = engine.poolEdges[key]
+
+    weight = engine.graph[source][target]["weight"] + 0.5
+    assert engine.applyEdgeDeltas([{"key": key, "ratiof": 0.5, "weight": weight}]) == [(source, target)]
+    assert engine.graph[source][target]["weight"] == weight
+    assert engine.getCore().weight[engine.getCore().edgeId(source, target)] == weight
+    assert engine.getCore().weight.tolist() == CSRGraph.fromGraph(engine.graph).weight.tolist()
+
+
+def assertBestParallelEdges(engine, expected):
+    # Every pair edge of the core, cycle index and cycle lookups is on the lowest weight pool of the rebuilt multigraph
+    assert edgeMap(engine.graph) == edgeMap(expected)
+    core = engine.getCore()
+    index = engine.getCycleIndex()
+    bestKeys = {}
+    for source, target in set(expected.edges()):
+        parallel = expected[source][target]
+        bestKey = min(parallel, key=lambda key: parallel[key]["weight"])
+        bestKeys[(source, target)] = bestKey
+        edgeId = core.edgeId(source, target)
+        assert core.poolKeys[core.poolKey[edgeId]] == bestKey
+        assert core.weight[edgeId] == parallel[bestKey]["weight"]
+        assert core.ratiof[edgeId] == parallel[bestKey]["ratiof"]
+        assert engine.pairWeight(source, target) == parallel[bestKey]["weight"]
+        assert index.weights[edgeId] == parallel[bestKey]["weight"]
+        [edge] = graphFindCycleEdges(engine.graph, [source, target])
+        assert edge[2]["key"] == bestKey
+    assert core.weight.tolist() == CSRGraph.fromGraph(expected).weight.tolist()
+    return bestKeys
+
+
+def test_multigraph_core_takes_the_best_parallel_edge():
+    # Few tokens, so most pairs have several pools
+    pools = randomV2Pools(16, TOKENS[:4], 24, noise=0.05)
+    engine = ResidentGraph(graphData(pools, multigraph=True))
+    expected = poolGraph(pools, multigraph=True)
+    assert max(len(expected[source][target]) for source, target in expected.edges()) > 2
+    assertBestParallelEdges(engine, expected)
+
+    cycles = json.loads(findTopCyclesEdges(engine, maxPathLength=4, k=20))
+    assert len(cycles) > 0
+    for cycle in cycles:
+        edges = graphFindCycleEdges(engine.graph, cycle["tokens"])
+        assert cycle["pools"] == [edge[2]["key"] for edge in edges]
+
+
+def test_multigraph_deltas_re_pick_the_best_parallel_edge():
+    pools = randomV2Pools(17, TOKENS[:4], 24, noise=0.05)
+    engine = ResidentGraph(graphData(pools, multigraph=True))
+    core = engine.getCore()
+    engine.getCycleIndex()
+    before = assertBestParallelEdges(engine, poolGraph(pools, multigraph=True))
+
+    # Reserve moves on a third of the pools, both directions of each moved pool get a delta
+    final = []
+    deltas = []
+    for i, pool in enumerate(pools):
+        if i % 3 == 0:
+            pool = dict(pool, reserve1=str(int(pool["reserve1"]) * (108 if i % 2 == 0 else 92) // 100))
+            deltas.extend({k: edge[k] for k in ("key", "source", "target", "ratiof", "weight")} for edge in poolEdges(pool))
+        final.append(pool)
+    updated = engine.applyEdgeDeltas(deltas)
+
+    assert len(updated) == len(deltas)
+    assert engine.getCore() is core
+    after = assertBestParallelEdges(engine, poolGraph(final, multigraph=True))
+    assert any(before[pair] != after[pair] for pair in before)
+
+    # A pool a pair does not have is not an edge of it
+    source, target = next(iter(before))
+    missing = {"key": "0x%040x" % 0xC0FFEE, "source": source, "target": target, "ratiof": 10.0, "weight": -2.3}
+    assert engine.applyEdgeDeltas([missing]) == []
+    assertBestParallelEdges(engine, poolGraph(final, multigraph=True))
@@ -0,0 +1,42 @@
+import json
+import os
+import subprocess
+import sys
+
+routerPath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "router.py")
+
+
+def serveLines(lines):
+    # router.py reads its stdin at import, the serve loop runs in its own process
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    completed = subprocess.run(
+        [sys.executable, routerPath, "serve"],
+        input="\n".join(lines + ["Exit"]) + "\n",
+        capture_output=True,
+        text=True,
+        env=env,
+        timeout=120,
+    )
+    assert completed.returncode == 0, completed.stderr
+    return [json.loads(line) for line in completed.stdout.splitlines()]
+
+
+def test_serve_loop_answers_after_bad_lines():
+    responses = serveLines(
+        [
+            "{not json",
+            "[]",
+            "1",
+            json.dumps({"id": 1, "method": "test", "args": ["ok"]}),
+            json.dumps({"id": 2, "method": "noSuchMethod", "args": []}),
+            json.dumps({"id": 3, "method": "getSqrtRatioAtTick", "args": ["0"]}),
+        ]
+    )
+
+    assert [response["id"] for response in responses] == [None, None, None, 1, 2, 3]
+    for response in responses[:3]:
+        assert response["status"] == 1
+        assert response["error"]
+    assert responses[3] == {"id": 1, "status": 0, "data": "ok"}
+    assert responses[4]["status"] == 1
+    assert responses[5] == {"id": 3, "status": 0, "data": str(2**96)}
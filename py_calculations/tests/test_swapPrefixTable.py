@@ -0,0 +1,64 @@
+import random
+
+import optimizeV3
+from optimizeV3 import MAX_SWAP_AMOUNT, getSwapPrefixTable, simulateSwap
+from poolParams import USDC, WETH, v3Pool
+from poolSnapshot import PoolSnapshot
+
+
+def swapBothWays(monkeypatch, amount, tokenAddress, isInput, pool):
+    # Same swap with the prefix tables and with the plain segment loop
+    monkeypatch.setattr(optimizeV3, "SWAP_PREFIX_TABLES", True)
+    tables = simulateSwap(amount, tokenAddress, isInput, pool)
+    monkeypatch.setattr(optimizeV3, "SWAP_PREFIX_TABLES", False)
+    plain = simulateSwap(amount, tokenAddress, isInput, pool)
+    assert tables == plain, (amount, tokenAddress, isInput)
+    return tables
+
+
+def samplePools():
+    # Dense and sparse liquidity, the sparse ones have 0 liquidity gaps and run out inside the tick range
+    for seed, tick, positions in ((1, 201007, 40), (2, -61, 40), (3, 0, 3), (4, 59, 1), (5, -1003, 6)):
+        yield v3Pool(seed, tick=tick, positions=positions)
+    # Tick data inconsistent with the current liquidity, liquidity goes negative a few ticks out
+    yield dict(v3Pool(6, tick=201007, positions=40), liquidity=str(10**15))
+
+
+def segmentAmounts(pool, toLeft, exactIn):
+    # Swap amounts on and around the totals of every full tick segment
+    table = getSwapPrefixTable(pool, toLeft)
+    table.extend(MAX_SWAP_AMOUNT, exactIn)
+    totals = table.amountsIn if exactIn else table.amountsOut
+    return sorted({max(total + offset, 1) for total in totals for offset in (-1, 0, 1)})
+
+
+def test_prefix_tables_match_the_segment_loop(monkeypatch):
+    rnd = random.Random(22)
+    for poolparam in samplePools():
+        for tokenAddress in (USDC, WETH):
+            for isInput in (True, False):
+                # Cold table extended by each swap, then a warm table with boundary and random amounts in any order
+                pool = PoolSnapshot(poolparam)
+                for exponent in range(2, 26, 2):
+                    swapBothWays(monkeypatch, rnd.randint(10**exponent, 10 ** (exponent + 1)), tokenAddress, isInput, pool)
+
+                toLeft = (tokenAddress == USDC) == isInput
+                amounts = segmentAmounts(pool, toLeft, isInput)
+                amounts += [rnd.randint(1, max(amounts)) for _ in range(50)]
+                rnd.shuffle(amounts)
+                crossed = set()
+                for amount in amounts + [MAX_SWAP_AMOUNT]:
+                    result = swapBothWays(monkeypatch, amount, tokenAddress, isInput, pool)
+                    crossed.add(result.ticksCrossed)
+                assert len(crossed) > 1
+
+
+def test_fresh_snapshots_match_the_segment_loop(monkeypatch):
+    # No table state carried over, each swap starts the table from the pool price
+    rnd = random.Random(23)
+    for poolparam in samplePools():
+        for tokenAddress in (USDC, WETH):
+            for isInput in ("true", "false"):
+                for exponent in range(4, 26, 3):
+                    amount = rnd.randint(10**exponent, 10 ** (exponent + 1))
+                    swapBothWays(monkeypatch, amount, tokenAddress, isInput, PoolSnapshot(poolparam))
@@ -0,0 +1,79 @@
+import json
+import random
+
+import optimizeV3
+from optimizeV3 import simulateSwap
+from poolParams import USDC, WETH, v3Pool
+from tickIndex import TickIndex
+from TickMath import getSqrtRatioAtTick
+
+TICK_SPACINGS = (1, 10, 60, 200)
+
+
+def randomTickIndex(rnd, tickSpacing, center):
+    # Initialized ticks on both sides of zero and of word boundaries
+    compressed = set(rnd.randint(center - 700, center + 700) for _ in range(rnd.randint(1, 60)))
+    return TickIndex([[tick * tickSpacing, str(rnd.randint(1, 10**18)), "0"] for tick in compressed])
+
+
+def test_next_tick_lookups_at_tick_boundaries():
+    # TickLens order, descending, with ticks on both sides of 0 and of a bitmap word
+    tickMap = [[15360, "-5", "5"], [120, "-7", "12"], [0, "4", "4"], [-60, "3", "3"], [-15420, "5", "5"]]
+    tickIndex = TickIndex(tickMap)
+    ticks = [-15420, -60, 0, 120, 15360]
+    liquidityNet = {int(tick): int(net) for tick, net, gross in tickMap}
+
+    def expected(tick):
+        return None if tick is None else (tick, liquidityNet[tick], getSqrtRatioAtTick(tick))
+
+    for i, tick in enumerate(ticks):
+        # Strictly below and above, an initialized tick is never its own next tick in either direction
+        below = ticks[i - 1] if i > 0 else None
+        above = ticks[i + 1] if i < len(ticks) - 1 else None
+        assert tickIndex.nextBelow(tick) == expected(below)
+        assert tickIndex.nextAbove(tick) == expected(above)
+        assert tickIndex.nextBelow(tick + 1) == expected(tick)
+        assert tickIndex.nextAbove(tick - 1) == expected(tick)
+        assert tickIndex.nextBelow(tick - 1) == expected(below)
+        assert tickIndex.nextAbove(tick + 1) == expected(above)
+        for lookup, bitmapLookup in ((tickIndex.nextBelow, tickIndex.nextBelowBitmap), (tickIndex.nextAbove, tickIndex.nextAboveBitmap)):
+            for offset in (-1, 0, 1):
+                assert bitmapLookup(tick + offset, 60) == lookup(tick + offset)
+
+    # Past either end, and an empty index
+    assert tickIndex.nextBelow(-887272) is None
+    assert tickIndex.nextAbove(887272) is None
+    assert tickIndex.nextAbove(-887272) == expected(ticks[0])
+    assert tickIndex.nextBelow(887272) == expected(ticks[-1])
+    empty = TickIndex([])
+    assert empty.nextBelow(0) is None and empty.nextAbove(0) is None
+    assert empty.nextBelowBitmap(0, 60) is None and empty.nextAboveBitmap(0, 60) is None
+
+
+def test_bitmap_traversal_matches_the_bisect_traversal():
+    rnd = random.Random(18)
+    for tickSpacing in TICK_SPACINGS:
+        for center in (-3000, -256, 0, 255, 3000):
+            tickIndex = randomTickIndex(rnd, tickSpacing, center)
+            low = (center - 800) * tickSpacing
+            high = (center + 800) * tickSpacing
+            # Every tick of the range when it is small, off spacing ticks included
+            step = max(tickSpacing // 7, 1)
+            for tick in range(low, high, step):
+                assert tickIndex.nextBelowBitmap(tick, tickSpacing) == tickIndex.nextBelow(tick), (tickSpacing, tick)
+                assert tickIndex.nextAboveBitmap(tick, tickSpacing) == tickIndex.nextAbove(tick), (tickSpacing, tick)
+
+
+def test_bitmap_swaps_match_the_index_swaps(monkeypatch):
+    # Without the prefix tables every crossed tick goes through the traversal
+    monkeypatch.setattr(optimizeV3, "SWAP_PREFIX_TABLES", False)
+    rnd = random.Random(19)
+    for seed, tick in enumerate((-1003, -61, -1, 0, 59, 201007)):
+        poolparam = json.dumps(v3Pool(seed, tick=tick, positions=30))
+        for tokenAddress in (USDC, WETH):
+            for isInput in ("true", "false"):
+                for exponent in range(4, 24, 2):
+                    amount = rnd.randint(10**exponent, 10 ** (exponent + 1))
+                    index = simulateSwap(amount, tokenAddress, isInput, poolparam, "index")
+                    bitmap = simulateSwap(amount, tokenAddress, isInput, poolparam, "bitmap")
+                    assert bitmap == index, (seed, tokenAddress, isInput, amount)
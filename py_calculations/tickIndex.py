@@ -0,0 +1,63 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from TickMath import getSqrtRatioAtTickCached
+from TickBitmap import tickBitmapFromTicks, nextInitializedTick
+
+
+class TickIndex:
+    # Initialized ticks of one pool snapshot in ascending order, liquidityNet and sqrt ratio aligned by position
+    __slots__ = ("ticks", "liquidityNet", "sqrtRatios", "tickSpacing", "tickBitmap", "tickPositions")
+
+    def __init__(self, tickMap):
+        # tickMap rows are [tick, liquidityNet, liquidityGross] as fetched from TickLens (descending ticks)
+        rows = sorted(tickMap, key=lambda row: int(row[0]))
+        self.ticks = array("i", [int(row[0]) for row in rows])
+        self.liquidityNet = [int(row[1]) for row in rows]
+        # getSqrtRatioAtTick of every tick, computed once per snapshot instead of at every crossing
+        self.sqrtRatios = [getSqrtRatioAtTickCached(tick) for tick in self.ticks]
+        # Sparse word -> bitmap of the ticks, built on the first bitmap traversal
+        self.tickSpacing = None
+        self.tickBitmap = None
+        self.tickPositions = None
+
+    def __len__(self):
+        return len(self.ticks)
+
+    def nextBelow(self, tick: int):
+        # (tick, liquidityNet, sqrtRatio) of the closest initialized tick strictly below tick, None if there is none
+        i = bisect_left(self.ticks, tick)
+        if i == 0:
+            return None
+        return (self.ticks[i - 1], self.liquidityNet[i - 1], self.sqrtRatios[i - 1])
+
+    def nextAbove(self, tick: int):
+        # (tick, liquidityNet, sqrtRatio) of the closest initialized tick strictly above tick, None if there is none
+        i = bisect_right(self.ticks, tick)
+        if i == len(self.ticks):
+            return None
+        return (self.ticks[i], self.liquidityNet[i], self.sqrtRatios[i])
+
+    def bitmap(self, tickSpacing: int) -> dict:
+        if self.tickBitmap is None or self.tickSpacing != tickSpacing:
+            self.tickSpacing = tickSpacing
+            self.tickBitmap = tickBitmapFromTicks(self.ticks, tickSpacing)
+            self.tickPositions = {tick: i for i, tick in enumerate(self.ticks)}
+        return self.tickBitmap
+
+    def _tickAt(self, tick):
+        if tick is None:
+            return None
+        i = self.tickPositions[tick]
+        return (tick, self.liquidityNet[i], self.sqrtRatios[i])
+
+    def nextBelowBitmap(self, tick: int, tickSpacing: int):
+        # nextBelow found word by word in the tick bitmap, the way the pool contract walks it
+        if len(self.ticks) == 0 or tick <= self.ticks[0]:
+            return None
+        return self._tickAt(nextInitializedTick(self.bitmap(tickSpacing), tick - 1, tickSpacing, True, self.ticks[0]))
+
+    def nextAboveBitmap(self, tick: int, tickSpacing: int):
+        # nextAbove found word by word in the tick bitmap
+        if len(self.ticks) == 0 or tick >= self.ticks[-1]:
+            return None
+        return self._tickAt(nextInitializedTick(self.bitmap(tickSpacing), tick, tickSpacing, False, self.ticks[-1]))